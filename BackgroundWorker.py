@@ -0,0 +1,124 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Интервал опроса очереди результатов из главного потока (мс)
+POLL_MS = 30
+
+
+# Исключение для остановки вытесненной задачи посреди долгого этапа
+class Cancelled(Exception):
+    pass
+
+
+# Функция для проверки флага отмены cancelled (threading.Event или None)
+# внутри долгих циклов: у вытесненной задачи возбуждает Cancelled
+def check_cancelled(cancelled):
+    if cancelled is not None and cancelled.is_set():
+        raise Cancelled
+
+
+# Фоновый расчет для приложений tkinter
+# Задача - функция task(cancelled), возвращающая итератор этапов результата
+# (например, сначала грубая сетка, затем подробная). Она выполняется в
+# отдельном потоке, а результаты передаются в главный поток через очередь,
+# которую опрашивает widget.after(), поэтому виджеты и графики меняются
+# только из главного потока. Если этапы приходят быстрее, чем опрос, рисуется
+# только последний из них.
+# Новая задача вытесняет прежнюю: флаг cancelled (threading.Event) прежней
+# задачи устанавливается, ее итератор закрывается на ближайшей границе
+# этапов, а ее результаты, уже попавшие в очередь, отбрасываются. Долгие
+# этапы получают флаг от задачи и проверяют его в своих циклах
+# (check_cancelled), так что вытесненная задача останавливается, не
+# дожидаясь конца этапа. Задачи выполняются по одной.
+class BackgroundWorker:
+    def __init__(self, widget, poll_ms=POLL_MS):
+        self.widget = widget
+        self.poll_ms = poll_ms
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.results = queue.Queue()
+        self.generation = 0
+        self.cancelled = None
+        self.handlers = None
+        self.polling = False
+
+    # Идет ли сейчас расчет
+    @property
+    def busy(self):
+        return self.handlers is not None
+
+    # Запуск задачи: on_result(этап) вызывается для каждого нового этапа,
+    # on_error(исключение) - при ошибке, on_done() - после последнего этапа
+    def submit(self, task, on_result, on_error=None, on_done=None):
+        self.cancel()
+        self.generation += 1
+        self.cancelled = threading.Event()
+        self.handlers = (on_result, on_error, on_done)
+        self.executor.submit(self._run, self.generation, task, self.cancelled)
+        if not self.polling:
+            self.polling = True
+            self.widget.after(self.poll_ms, self._poll)
+
+    # Отмена текущей задачи (ее результаты больше не выводятся)
+    def cancel(self):
+        if self.cancelled is not None:
+            self.cancelled.set()
+        self.cancelled = None
+        self.handlers = None
+
+    def _run(self, generation, task, cancelled):
+        if cancelled.is_set():
+            return
+        try:
+            stages = iter(task(cancelled))
+            try:
+                for result in stages:
+                    if cancelled.is_set():
+                        return
+                    self.results.put((generation, "result", result))
+            finally:
+                close = getattr(stages, "close", None)
+                if close is not None:
+                    close()
+        except Cancelled:
+            return
+        except Exception as error:
+            self.results.put((generation, "error", error))
+            return
+        self.results.put((generation, "done", None))
+
+    def _poll(self):
+        latest = None
+        finished = None
+        while True:
+            try:
+                generation, kind, value = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if generation != self.generation or self.handlers is None:
+                continue
+            if kind == "result":
+                latest = (value,)
+            else:
+                finished = (kind, value)
+
+        if self.handlers is not None:
+            on_result, on_error, on_done = self.handlers
+            if finished is not None:
+                self.cancelled = self.handlers = None
+            if latest is not None:
+                on_result(latest[0])
+            if finished is not None:
+                kind, value = finished
+                if kind == "error":
+                    if on_error is None:
+                        raise value
+                    on_error(value)
+                elif on_done is not None:
+                    on_done()
+
+        if self.handlers is not None:
+            self.widget.after(self.poll_ms, self._poll)
+        else:
+            self.polling = False
@@ -0,0 +1,295 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from BodyMotion import initial_bodies, simulate_bodies
+from EnergyCore import calculate_energies, integrate_spring
+from LoopSimulation import loop_trajectory
+from LoopSweep import SWEEP_FIELDS, stored_sweep
+from PlotRendering import FigurePanel
+from PotentialExpressions import compile_expression, parse_parameters
+from PotentialKernels import EXPRESSION_PREFIX, GRID, KERNELS, make_grid, potential_tiled, stored_potential
+from PotentialPlot import draw_potential, potential_axes
+from ResultStore import ResultStore, default_store, stored, write_chunked
+
+
+# Пакетная отрисовка сценариев без окна (холст Agg)
+# Сценарий - словарь с типом ("type"), файлом результата ("output") и
+# параметрами расчета. По расширению файла результата сохраняется рисунок
+# (.png, .svg, .pdf) или данные (.npz; для "potential" еще .npy - поблочный
+# расчет прямо в файл). Сценарии независимы и распределяются по пулу
+# процессов, поэтому пропускная способность растет с числом ядер.
+# Потенциал, движение тел и перебор петли берутся из хранилища результатов
+# ("store" - его каталог), если уже рассчитаны там же или в приложениях.
+#
+# Запуск: python BatchRender.py scenarios.json --output-dir out --workers 8 [--store DIR | --no-store]
+
+# Расширения файлов с данными (остальные - рисунки)
+DATA_EXTENSIONS = (".npz", ".npy")
+
+
+# Функция для чтения параметров поля: ключ ядра или "expr:<выражение>" и
+# значения параметров (список чисел или строка "a=1, b=2" для выражения)
+def _field_parameters(spec):
+    field = spec.get("field", "gravity")
+    params = spec.get("params")
+    if field.startswith(EXPRESSION_PREFIX):
+        names = [name for name, _ in compile_expression(field[len(EXPRESSION_PREFIX):])["params"]]
+        if params is None or isinstance(params, str):
+            return field, parse_parameters(params or "", names)
+    elif field not in KERNELS:
+        raise ValueError(f"неизвестный тип поля: {field}")
+    elif params is None:
+        params = [default for _, default in KERNELS[field]["params"]]
+    return field, tuple(float(p) for p in np.atleast_1d(params))
+
+
+# Функция для чтения сетки (x_min, x_max, y_min, y_max, nx, ny)
+def _grid(spec):
+    x_min, x_max, y_min, y_max, nx, ny = spec.get("grid", GRID)
+    return float(x_min), float(x_max), float(y_min), float(y_max), int(nx), int(ny)
+
+
+# Функция для чтения диапазона [минимум, максимум, число точек]
+def _range(values):
+    lo, hi, count = values
+    return np.linspace(float(lo), float(hi), int(count))
+
+
+# Колебания груза на пружине: смещение и энергии
+def energy_scenario(spec, store):
+    m, k, b = (float(spec.get(name, default)) for name, default in (("m", 1.0), ("k", 10.0), ("b", 0.5)))
+    t = np.linspace(0, float(spec.get("t_max", 20)), int(spec.get("samples", 500)))
+    y, stats = integrate_spring(spec.get("method", "analytic"), m, k, b, t, float(spec.get("x0", 1.0)),
+                                float(spec.get("v0", 0.0)), float(spec.get("tol", 1e-6)))
+    kinetic, potential_energy, total = calculate_energies(m, k, y)
+    data = {"t": t, "x": y[:, 0], "v": y[:, 1], "kinetic_energy": kinetic, "potential_energy": potential_energy,
+            "total_energy": total}
+
+    def draw(panel):
+        for position, (key, label, color) in enumerate((("kinetic_energy", "Кинетическая энергия", "blue"),
+                                                         ("potential_energy", "Потенциальная энергия", "orange"),
+                                                         ("total_energy", "Полная энергия", "green"))):
+            ax = panel.figure.add_subplot(311 + position)
+            panel.line(ax, key, t, data[key], label=label, color=color)
+            ax.set_ylabel("Энергия (Дж)")
+            ax.legend()
+        ax.set_xlabel("Время (с)")
+
+    return data, draw, (8, 6)
+
+
+# Функция для построения контурного и 3D-графиков потенциала
+def _draw_potential(panel, X, Y, U):
+    ax_contour, ax_surface = potential_axes(panel)
+    draw_potential(panel, ax_contour, ax_surface, X, Y, U)
+    return ax_contour
+
+
+# Потенциальное поле на сетке
+def potential_scenario(spec, store):
+    field, params = _field_parameters(spec)
+    X, Y = make_grid(_grid(spec))
+    U = stored_potential(store, field, params, _grid(spec))
+    return {"x": X[0], "y": Y[:, 0], "U": U}, lambda panel: _draw_potential(panel, X, Y, U), (12, 5)
+
+
+# Движение тел в потенциальном поле: поле, конечные положения и следы
+def bodies_scenario(spec, store):
+    field, params = _field_parameters(spec)
+    n, seed, speed = int(spec.get("n", 1000)), int(spec.get("seed", 0)), float(spec.get("speed", 0.5))
+    dt, n_frames, steps = float(spec.get("dt", 0.01)), int(spec.get("frames", 100)), int(spec.get("steps", 5))
+    mass, pair_cutoff = float(spec.get("mass", 1.0)), float(spec.get("pair_cutoff", 0.0))
+    pair_strength = float(spec.get("pair_strength", 50.0))
+
+    def compute(writer):
+        state = initial_bodies(n, speed=speed, seed=seed)
+        return {"frames": simulate_bodies(state, dt, n_frames, field, params, mass, pair_cutoff, pair_strength,
+                                          steps)}
+
+    frames = stored(store, "bodies", {"field": field, "params": params, "n": n, "seed": seed, "speed": speed,
+                                      "mass": mass, "pair_cutoff": pair_cutoff, "pair_strength": pair_strength},
+                    {"dt": dt, "frames": n_frames, "steps": steps}, compute)["frames"]
+    data = {"frames": frames.astype(np.float32)}
+
+    def draw(panel):
+        X, Y = make_grid(GRID)
+        ax = _draw_potential(panel, X, Y, stored_potential(store, field, params, GRID))
+        trails = frames[:, :int(spec.get("trail_bodies", 50)), :2].transpose(1, 0, 2)
+        panel.lines(ax, "trails", trails, colors="white", linewidths=0.8, alpha=0.7)
+        panel.scatter(ax, "bodies", frames[-1, :, 0], frames[-1, :, 1], s=4, color="red")
+        ax.set_xlim(GRID[0], GRID[1])
+        ax.set_ylim(GRID[2], GRID[3])
+
+    return data, draw, (12, 5)
+
+
+# Мертвая петля: необходимая скорость, движение по дуге и полет после отрыва
+def loop_scenario(spec, store):
+    R = float(spec.get("R", 3.0))
+    result = loop_trajectory(float(spec.get("mu", 0.03)), R, np.radians(float(spec.get("alpha", 150.0))))
+
+    def draw(panel):
+        ax = panel.figure.add_subplot(111)
+        panel.line(ax, "arc", result["x_arc"], result["y_arc"], label="Путь по дуге", color="blue")
+        panel.line(ax, "trajectory", result["x_flight"], result["y_flight"], label="Траектория после отрыва",
+                   color="red")
+        panel.scatter(ax, "detachment", result["x_arc"][-1:], result["y_arc"][-1:], color="green",
+                      label="Точка отрыва")
+        ax.set_xlabel("x (м)")
+        ax.set_ylabel("y (м)")
+        ax.set_title(f"Необходимая скорость: {result['v0']:.2f} м/с")
+        ax.grid(True)
+        ax.legend()
+        ax.axis("equal")
+
+    return result, draw, (10, 6)
+
+
+# Перебор параметров петли (μ, R, α) и тепловая карта среза по μ
+def loop_sweep_scenario(spec, store):
+    sweep = stored_sweep(store, _range(spec.get("mu", (0, 0.3, 100))), _range(spec.get("R", (1, 10, 100))),
+                         np.radians(_range(spec.get("alpha", (100, 170, 100)))), workers=1)
+    field = spec.get("field", "v_min")
+    if field not in SWEEP_FIELDS:
+        raise ValueError(f"неизвестная величина: {field}")
+
+    def draw(panel):
+        i = int(np.abs(sweep["mu"] - float(spec.get("mu_slice", 0.03))).argmin())
+        alpha = np.degrees(sweep["alpha"])
+        ax = panel.figure.add_subplot(111)
+        panel.image(ax, "map", sweep[field][i], (alpha[0], alpha[-1], sweep["R"][0], sweep["R"][-1]),
+                    colorbar=True, cmap="viridis")
+        ax.set_xlabel("α (град)")
+        ax.set_ylabel("R (м)")
+        ax.set_title(f"{field} при μ = {sweep['mu'][i]:.3g}")
+
+    return sweep, draw, (7, 5)
+
+
+# Типы сценариев: функция (spec, хранилище или None) -> (данные, рисование на
+# FigurePanel, размер фигуры)
+SCENARIOS = {
+    "energy": energy_scenario,
+    "potential": potential_scenario,
+    "bodies": bodies_scenario,
+    "loop": loop_scenario,
+    "loop_sweep": loop_sweep_scenario,
+}
+
+
+# Функция для расчета и сохранения одного сценария
+# Выполняется в процессе пула; ошибки не прерывают пакет, а возвращаются
+# в отчете. Возвращает словарь: output, type, seconds, error (или None).
+def render_scenario(spec):
+    start = time.perf_counter()
+    kind = spec.get("type")
+    output = spec["output"]
+    error = None
+    try:
+        if kind not in SCENARIOS:
+            raise ValueError(f"неизвестный тип сценария: {kind}")
+        store = ResultStore(spec["store"]) if spec.get("store") else None
+        directory = os.path.dirname(output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        extension = os.path.splitext(output)[1].lower()
+        if extension == ".npy":
+            # Большая сетка потенциала считается плитками прямо в файл (в
+            # хранилище - и оттуда полосами копируется в output)
+            if kind != "potential":
+                raise ValueError("формат .npy доступен только для сценария potential")
+            field, params = _field_parameters(spec)
+            dtype = np.dtype(spec.get("dtype", "float64"))
+            if store is None:
+                potential_tiled(field, params, _grid(spec), path=output, dtype=dtype)
+            else:
+                write_chunked(output, stored_potential(store, field, params, _grid(spec), dtype))
+        else:
+            data, draw, figsize = SCENARIOS[kind](spec, store)
+            if extension == ".npz":
+                np.savez_compressed(output, **data)
+            else:
+                panel = FigurePanel(None, figsize=figsize)
+                draw(panel)
+                panel.figure.tight_layout()
+                panel.save(output, dpi=int(spec.get("dpi", 100)))
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    return {"output": output, "type": kind, "seconds": time.perf_counter() - start, "error": error}
+
+
+# Функция для разбора значения ячейки CSV: число, список или логическое
+# значение в записи JSON, иначе строка
+def _parse_value(text):
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+# Функция для чтения пакета сценариев из JSON (список или {"scenarios": [...]})
+# или CSV (строка заголовка - имена параметров, пустые ячейки пропускаются)
+def load_scenarios(path):
+    if path.lower().endswith(".csv"):
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            return [{key: _parse_value(value) for key, value in row.items() if value not in (None, "")}
+                    for row in csv.DictReader(f)]
+    with open(path, encoding="utf-8-sig") as f:
+        specs = json.load(f)
+    return specs["scenarios"] if isinstance(specs, dict) else specs
+
+
+# Функция для пакетного расчета сценариев в пуле из workers процессов
+# Файлы результатов без пути кладутся в output_dir; сценарию без "output"
+# дается имя <номер>_<тип>.png. store - каталог хранилища результатов для
+# сценариев без своего "store" (None - не сохранять). Отчеты выдаются по
+# мере готовности в порядке сценариев.
+def render_batch(specs, output_dir=".", workers=None, store=None):
+    specs = [dict(spec) for spec in specs]
+    for index, spec in enumerate(specs):
+        output = str(spec.get("output") or f"{index:04d}_{spec.get('type')}.png")
+        spec["output"] = os.path.join(output_dir, output)
+        spec.setdefault("store", store)
+    if workers == 1:
+        yield from map(render_scenario, specs)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(render_scenario, specs)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Пакетная отрисовка сценариев без окна")
+    parser.add_argument("scenarios", help="файл сценариев (.json или .csv)")
+    parser.add_argument("--output-dir", default=".", help="каталог для файлов результатов")
+    parser.add_argument("--workers", type=int, default=None, help="число процессов (по умолчанию - число ядер)")
+    parser.add_argument("--store", help="каталог хранилища результатов (по умолчанию - как у приложений)")
+    parser.add_argument("--no-store", action="store_true", help="не брать и не сохранять результаты в хранилище")
+    args = parser.parse_args(argv)
+
+    store = None
+    if not args.no_store:
+        store = ResultStore(args.store) if args.store else default_store()
+    specs = load_scenarios(args.scenarios)
+    start = time.perf_counter()
+    failed = 0
+    for report in render_batch(specs, args.output_dir, args.workers, store.root if store else None):
+        if report["error"]:
+            failed += 1
+            print(f"ОШИБКА {report['output']}: {report['error']}", file=sys.stderr)
+        else:
+            print(f"{report['output']} ({report['type']}, {report['seconds']:.2f} с)")
+    elapsed = time.perf_counter() - start
+    print(f"Сценариев: {len(specs)}, ошибок: {failed}, время: {elapsed:.2f} с, "
+          f"{len(specs) / elapsed if elapsed > 0 else 0:.2f} сценариев/с")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,280 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from EnergyCore import runge_kutta_4th_order, spring_oscillation
+from LoopSimulation import loop_trajectory, minimum_speed
+from LoopSweep import parameter_sweep
+from PotentialKernels import KERNELS, calculate_potential_field, make_grid
+
+
+# Замеры производительности численных расчетов без окна
+# Каждый замер - фабрика, которая по размеру задачи готовит данные и
+# возвращает функцию расчета без аргументов, и лестница размеров. Первый
+# вызов не замеряется (прогрев кэшей и компиляция numba), затем время
+# берется по нескольким запускам, а пик памяти и число оставшихся блоков -
+# по отдельному запуску под tracemalloc (он замедляет расчет). Результаты
+# дописываются в журнал JSON (одна запись на строку) и сравниваются с
+# сохраненной базой: замедление или рост пика памяти больше порога
+# считается регрессией.
+#
+# Запуск: python Benchmarks.py [--quick] [--only rk4 field_direct] [--save-baseline]
+
+# Каталог приложений, журнал замеров и база для сравнения
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCH_HISTORY = os.path.join(APP_DIR, "benchmark_history.jsonl")
+BENCH_BASELINE = os.path.join(APP_DIR, "benchmark_baseline.json")
+
+# Допустимое относительное ухудшение времени и пика памяти
+REGRESSION_THRESHOLD = 0.2
+# Рост пика памяти меньше этого (байт) не считается регрессией
+MEMORY_SLACK = 1 << 20
+
+# Число запусков на размер: не меньше MIN_RUNS и не больше repeat, пока
+# суммарное время меньше TIME_BUDGET секунд
+MIN_RUNS = 3
+REPEAT = 7
+TIME_BUDGET = 2.0
+
+# Число размеров лестницы в быстром режиме (--quick)
+QUICK_SIZES = 2
+
+
+# Функция для случайного набора зарядов (x, y, q) в квадрате [-2, 2]²
+def random_charges(count, seed=0):
+    rng = np.random.default_rng(seed)
+    xy = rng.uniform(-2, 2, (count, 2))
+    q = rng.choice((-1e-9, 1e-9), count)
+    return [(x, y, charge) for (x, y), charge in zip(xy.tolist(), q.tolist())]
+
+
+# Поле и потенциал зарядов на сетке (расчет из plot_field); размер - (точек по оси, зарядов)
+def field_benchmark(solver, backend="auto"):
+    def make(size):
+        from ElectrostaticFieldModelling import compute_field
+
+        points, count = size
+        X, Y = np.meshgrid(np.linspace(-2, 2, points), np.linspace(-2, 2, points))
+        charges = random_charges(count)
+        return lambda: compute_field(charges, X, Y, solver=solver, backend=backend)
+
+    return make
+
+
+# РК4 для груза на пружине; размер - число шагов
+def rk4_benchmark(backend):
+    def make(size):
+        t = np.linspace(0, 20, size)
+        return lambda: runge_kutta_4th_order(spring_oscillation, [1.0, 0.0], t, args=(1.0, 10.0, 0.5),
+                                             backend=backend)
+
+    return make
+
+
+# Потенциал ядра на квадратной сетке; размер - число точек по оси
+def potential_benchmark(kernel):
+    params = tuple(float(default) for _, default in KERNELS[kernel]["params"])
+
+    def make(size):
+        X, Y = make_grid((-10.0, 10.0, -10.0, 10.0, size, size))
+        return lambda: calculate_potential_field(X, Y, kernel, params)
+
+    return make
+
+
+# Необходимая скорость для набора сценариев петли; размер - число сценариев
+def minimum_speed_benchmark(size):
+    rng = np.random.default_rng(0)
+    mu = rng.uniform(0, 0.3, size)
+    R = rng.uniform(1, 10, size)
+    alpha = rng.uniform(np.radians(100), np.radians(170), size)
+    return lambda: minimum_speed(mu, R, alpha)
+
+
+# Траектория петли целиком; размер - число шагов по дуге
+def loop_trajectory_benchmark(size):
+    return lambda: loop_trajectory(0.03, 3.0, 5 * np.pi / 6, steps=size)
+
+
+# Перебор параметров петли в одном процессе; размер - число точек по каждой оси
+def loop_sweep_benchmark(size):
+    mu = np.linspace(0, 0.3, size)
+    R = np.linspace(1, 10, size)
+    alpha = np.radians(np.linspace(100, 170, size))
+    return lambda: parameter_sweep(mu, R, alpha, workers=1)
+
+
+# Реестр замеров: имя -> (фабрика, лестница размеров)
+BENCHMARKS = {
+    "field_direct": (field_benchmark("direct"), ((50, 2), (200, 100), (500, 1000))),
+    "field_direct_numpy": (field_benchmark("direct", "numpy"), ((50, 2), (200, 100), (500, 1000))),
+    "field_tree": (field_benchmark("tree"), ((100, 100), (200, 1000), (500, 10000))),
+    "rk4": (rk4_benchmark("auto"), (10 ** 3, 10 ** 5, 10 ** 6)),
+    "rk4_numpy": (rk4_benchmark("numpy"), (10 ** 3, 10 ** 4, 10 ** 5)),
+}
+for _kernel in KERNELS:
+    BENCHMARKS["potential_" + _kernel] = (potential_benchmark(_kernel), (100, 1000, 2000))
+BENCHMARKS["loop_minimum_speed"] = (minimum_speed_benchmark, (1, 30, 300))
+BENCHMARKS["loop_trajectory"] = (loop_trajectory_benchmark, (100, 500, 2000))
+BENCHMARKS["loop_sweep"] = (loop_sweep_benchmark, (10, 50, 100))
+
+
+# Функция для подписи размера: (200, 100) -> "200x100"
+def size_label(size):
+    return "x".join(str(s) for s in size) if isinstance(size, tuple) else str(size)
+
+
+# Функция для замера одной функции расчета
+# Возвращает время (минимум и медиана по запускам, с), пик памяти под
+# tracemalloc и сколько байт и блоков осталось занято после расчета (без
+# учета результата, который освобождается только после замера).
+def measure(run, repeat=REPEAT, time_budget=TIME_BUDGET):
+    run()
+    times = []
+    while len(times) < max(repeat, 1):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+        if len(times) >= MIN_RUNS and sum(times) > time_budget:
+            break
+
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        result = run()
+        peak = tracemalloc.get_traced_memory()[1] - base
+        del result
+        stats = tracemalloc.take_snapshot().compare_to(before, "filename")
+    finally:
+        tracemalloc.stop()
+    return {
+        "runs": len(times),
+        "min": min(times),
+        "median": statistics.median(times),
+        "peak_bytes": peak,
+        "retained_bytes": sum(stat.size_diff for stat in stats),
+        "retained_blocks": sum(stat.count_diff for stat in stats),
+    }
+
+
+# Функция для прогона замеров: names - имена из BENCHMARKS (все, если не
+# заданы), sizes - сколько первых размеров лестницы брать (все, если None).
+# Выдает (ключ "имя[размер]", результат) по мере готовности.
+def run_benchmarks(names=None, sizes=None, repeat=REPEAT):
+    for name in names or BENCHMARKS:
+        if name not in BENCHMARKS:
+            raise ValueError(f"неизвестный замер: {name}")
+        make, ladder = BENCHMARKS[name]
+        for size in ladder[:sizes]:
+            result = measure(make(size), repeat)
+            result.update(benchmark=name, size=size_label(size))
+            yield f"{name}[{size_label(size)}]", result
+
+
+# Функция для описания окружения замера (версии и текущий коммит, если есть)
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=APP_DIR, capture_output=True,
+                                text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {"commit": commit, "python": platform.python_version(), "numpy": np.__version__,
+            "machine": platform.machine(), "processor": platform.processor(), "cpus": os.cpu_count()}
+
+
+# Функция для сравнения результатов с базой
+# Возвращает список регрессий: (ключ, величина, было, стало, отношение).
+def find_regressions(results, baseline, threshold=REGRESSION_THRESHOLD):
+    regressions = []
+    for key, result in results.items():
+        old = baseline.get(key)
+        if old is None:
+            continue
+        if result["median"] > old["median"] * (1 + threshold):
+            regressions.append((key, "median", old["median"], result["median"], result["median"] / old["median"]))
+        peak, old_peak = result["peak_bytes"], old["peak_bytes"]
+        if peak > old_peak * (1 + threshold) and peak - old_peak > MEMORY_SLACK:
+            regressions.append((key, "peak_bytes", old_peak, peak, peak / max(old_peak, 1)))
+    return regressions
+
+
+# Функция для чтения базы для сравнения ({} если ее нет)
+def load_baseline(path=BENCH_BASELINE):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)["results"]
+
+
+# Функция для сохранения записи (окружение и результаты) в файл JSON
+def save_baseline(record, path=BENCH_BASELINE):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(record, f, ensure_ascii=False, indent=1)
+
+
+# Функция для добавления записи в журнал замеров
+def append_history(record, path=BENCH_HISTORY):
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+# Функция для подписи объема памяти
+def format_bytes(n):
+    for unit in ("Б", "КБ", "МБ"):
+        if abs(n) < 1024:
+            return f"{n:.0f} {unit}"
+        n /= 1024
+    return f"{n:.1f} ГБ"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замеры производительности численных расчетов")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), metavar="ЗАМЕР",
+                        help="замеры для прогона: " + ", ".join(BENCHMARKS))
+    parser.add_argument("--quick", action="store_true", help=f"только {QUICK_SIZES} меньших размера лестницы")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="наибольшее число запусков на размер")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                        help="допустимое относительное ухудшение (0.2 - 20%%)")
+    parser.add_argument("--history", default=BENCH_HISTORY, help="журнал замеров (.jsonl)")
+    parser.add_argument("--baseline", default=BENCH_BASELINE, help="база для сравнения (.json)")
+    parser.add_argument("--save-baseline", action="store_true", help="сохранить результаты как новую базу")
+    args = parser.parse_args(argv)
+
+    baseline = load_baseline(args.baseline)
+    results = {}
+    for key, result in run_benchmarks(args.only, QUICK_SIZES if args.quick else None, args.repeat):
+        results[key] = result
+        line = (f"{key}: {result['median'] * 1e3:.2f} мс (мин {result['min'] * 1e3:.2f} мс, "
+                f"запусков {result['runs']}), пик {format_bytes(result['peak_bytes'])}")
+        if key in baseline:
+            line += f", к базе {result['median'] / baseline[key]['median']:.2f}x"
+        print(line, flush=True)
+
+    record = {"time": time.time(), "environment": environment(), "results": results}
+    append_history(record, args.history)
+    if args.save_baseline:
+        save_baseline(record, args.baseline)
+        print(f"База сохранена в {args.baseline}")
+
+    regressions = find_regressions(results, baseline, args.threshold)
+    for key, quantity, old, new, ratio in regressions:
+        if quantity == "median":
+            print(f"РЕГРЕССИЯ {key}: время {old * 1e3:.2f} -> {new * 1e3:.2f} мс ({ratio:.2f}x)", file=sys.stderr)
+        else:
+            print(f"РЕГРЕССИЯ {key}: пик памяти {format_bytes(old)} -> {format_bytes(new)} ({ratio:.2f}x)",
+                  file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+import numpy as np
+
+from Numerics import expand_ranges
+from PotentialKernels import gradient
+
+
+# Параметры движения тел по умолчанию
+BODY_REGION = 8.0  # тела стартуют в квадрате [-BODY_REGION, BODY_REGION]²
+PAIR_CHUNK = 1 << 20  # число пар-кандидатов, обрабатываемых за один проход
+PAIR_MAX_CELL = 1 << 20  # ограничение номера ячейки (для улетевших далеко тел)
+
+# Смещения соседних ячеек (половина окрестности: каждая пара учитывается один раз)
+PAIR_OFFSETS = ((0, 0), (1, -1), (1, 0), (1, 1), (0, 1))
+
+
+# Функция для создания начального состояния n тел
+# Возвращает массив формы (n, 4): x, y, vx, vy. Положения равномерно
+# распределены в квадрате [-region, region]², скорости - нормально с
+# разбросом speed.
+def initial_bodies(n, region=BODY_REGION, speed=0.0, seed=0):
+    rng = np.random.default_rng(seed)
+    state = np.empty((n, 4))
+    state[:, :2] = rng.uniform(-region, region, (n, 2))
+    state[:, 2:] = rng.normal(0.0, speed, (n, 2)) if speed > 0 else 0.0
+    return state
+
+
+# Функция для расчета сил парного отталкивания тел (мягкие сферы)
+# Сила между телами на расстоянии r < cutoff равна strength * (1 - r / cutoff)
+# и направлена вдоль линии центров. Пары ищутся по сетке ячеек размером
+# cutoff: тела сортируются по номеру ячейки, и для каждого тела
+# просматриваются только его ячейка и четыре соседние (половина окрестности),
+# так что работа O(N) при ограниченной плотности, а не O(N²). Пары-кандидаты
+# обрабатываются порциями не больше chunk.
+def pair_forces(positions, cutoff, strength, chunk=PAIR_CHUNK):
+    forces = np.zeros_like(positions)
+    members = np.flatnonzero(np.isfinite(positions).all(axis=1))
+    n = len(members)
+    if n < 2 or cutoff <= 0:
+        return forces
+
+    cells = np.clip(np.floor(positions[members] / cutoff), -PAIR_MAX_CELL, PAIR_MAX_CELL).astype(np.int64)
+    cells -= cells.min(axis=0) - 1
+    stride = cells[:, 1].max() + 2
+    keys = cells[:, 0] * stride + cells[:, 1]
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    members = members[order]
+    points = positions[members]
+
+    for dx, dy in PAIR_OFFSETS:
+        neighbor = keys + dx * stride + dy
+        first = np.searchsorted(keys, neighbor, side="left")
+        last = np.searchsorted(keys, neighbor, side="right")
+        if dx == 0 and dy == 0:
+            # В своей ячейке берем только тела, стоящие после текущего
+            first = np.maximum(first, np.arange(n) + 1)
+        counts = np.maximum(last - first, 0)
+        total = np.cumsum(counts)
+        if total[-1] == 0:
+            continue
+
+        start = 0
+        while start < n:
+            done = total[start - 1] if start > 0 else 0
+            stop = max(int(np.searchsorted(total, done + chunk, side="right")), start + 1)
+            owner, j = expand_ranges(first[start:stop], counts[start:stop])
+            i = owner + start
+            d = points[i] - points[j]
+            r = np.sqrt((d ** 2).sum(axis=1))
+            close = r < cutoff
+            i, j, d, r = i[close], j[close], d[close], r[close]
+            scale = np.divide(strength * (1 - r / cutoff), r, out=np.zeros_like(r), where=r > 0)
+            for axis in range(2):
+                f = d[:, axis] * scale
+                forces[:, axis][members] += np.bincount(i, weights=f, minlength=n)
+                forces[:, axis][members] -= np.bincount(j, weights=f, minlength=n)
+            start = stop
+    return forces
+
+
+# Функция для расчета ускорений тел в поле U (сила -∇U) с учетом парного
+# отталкивания (pair_cutoff > 0)
+def body_accelerations(positions, field_type, params, mass=1.0, pair_cutoff=0.0, pair_strength=0.0):
+    dU_dx, dU_dy = gradient(field_type, positions[:, 0], positions[:, 1], params)
+    acc = np.empty_like(positions)
+    acc[:, 0] = -dU_dx
+    acc[:, 1] = -dU_dy
+    if pair_cutoff > 0 and pair_strength != 0:
+        acc += pair_forces(positions, pair_cutoff, pair_strength)
+    acc /= mass
+    return acc
+
+
+# Генератор движения тел методом Верле со скоростями
+# state формы (n, 4) продвигается на месте: все тела интегрируются вместе
+# векторными операциями. После каждых steps шагов dt выдается state.
+def body_motion(state, dt, field_type, params, mass=1.0, pair_cutoff=0.0, pair_strength=0.0, steps=1):
+    positions = state[:, :2]
+    velocities = state[:, 2:]
+    acc = body_accelerations(positions, field_type, params, mass, pair_cutoff, pair_strength)
+    while True:
+        for _ in range(steps):
+            velocities += 0.5 * dt * acc
+            positions += dt * velocities
+            acc = body_accelerations(positions, field_type, params, mass, pair_cutoff, pair_strength)
+            velocities += 0.5 * dt * acc
+        yield state
+
+
+# Функция для расчета траекторий тел
+# Возвращает массив формы (n_frames + 1, n, 4) с состоянием через каждые
+# steps шагов, начиная с начального.
+def simulate_bodies(state, dt, n_frames, field_type, params, mass=1.0, pair_cutoff=0.0, pair_strength=0.0,
+                    steps=1):
+    state = np.array(state, dtype=float)
+    frames = [state.copy()]
+    motion = body_motion(state, dt, field_type, params, mass, pair_cutoff, pair_strength, steps)
+    for _ in range(n_frames):
+        frames.append(next(motion).copy())
+    return np.stack(frames)
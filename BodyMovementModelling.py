@@ -1,92 +1,141 @@
 import tkinter as tk
 from tkinter import ttk
 import numpy as np
-from matplotlib.figure import Figure
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-
-
-# Функция для расчета потенциальной энергии
-def calculate_potential_field(x, y, field_type, params):
-    if field_type == "Гравитационное поле":
-        G, m1, m2 = params
-        U = -G * m1 * m2 / np.sqrt(x ** 2 + y ** 2 + 1e-6)  # Добавляем маленькое значение для избежания деления на ноль
-    elif field_type == "Сила упругости":
-        k = params[0]
-        U = 0.5 * k * (x ** 2 + y ** 2)
-    elif field_type == "Степенная функция":
-        a, n, b, m = params
-        U = a * x ** n + b * y ** m
-    else:
-        U = np.zeros_like(x)
-    return U
+
+from BackgroundWorker import BackgroundWorker
+from BodyMotion import body_motion, initial_bodies
+from PlotRendering import FigurePanel
+from PotentialKernels import GRID, PotentialCache
+from PotentialPlot import (FIELD_TYPES, draw_potential, parameter_frames, potential_axes, potential_stages,
+                           read_field_parameters)
+from Profiling import profile_status_bar, profiler
+from ResultStore import default_store
+
+
+# Параметры отображения движения тел
+TRAIL_BODIES = 50  # число тел, для которых рисуется след
+TRAIL_LENGTH = 40  # длина следа (кадров)
+STEPS_PER_FRAME = 5  # шагов интегрирования на кадр анимации
+
+
+# Функция для отображения очередной сетки (в главном потоке)
+def show_potential(result):
+    stage, X, Y, U = result
+    draw_potential(panel, ax_contour, ax_surface, X, Y, U)
+    panel.draw()
+    status_label.config(text=f"Сетка {stage[4]}×{stage[5]}")
 
 
 # Функция для построения графика
-def plot_potential_field():
+# Потенциал считается в фоновом потоке: сначала на грубой сетке, затем
+# графики уточняются на месте. Новое построение отменяет незавершенное.
+# run_label - подпись построения в строке состояния замера этапов.
+def plot_potential_field(run_label="Построение графика"):
+    global panel, ax_contour, ax_surface, ani
+
+    profiler.start_run(run_label)
+
     # Получаем параметры от пользователя
     try:
-        field_type = field_type_var.get()
-        if field_type == "Гравитационное поле":
-            G = float(entry_G.get())
-            m1 = float(entry_m1.get())
-            m2 = float(entry_m2.get())
-            params = (G, m1, m2)
-        elif field_type == "Сила упругости":
-            k = float(entry_k.get())
-            params = (k,)
-        elif field_type == "Степенная функция":
-            a = float(entry_a.get())
-            n = float(entry_n.get())
-            b = float(entry_b.get())
-            m = float(entry_m.get())
-            params = (a, n, b, m)
+        with profiler.stage("разбор параметров"):
+            field_type, params, note = read_field_parameters(field_type_var.get(), param_entries)
+    except ValueError as error:
+        result_label.config(text=f"Ошибка: {error}")
+        return None
+    result_label.config(text=note)
+
+    # Останавливаем движение тел
+    if ani is not None:
+        ani.event_source.stop()
+        ani = None
+
+    # Фигура и оси создаются один раз, дальше у графиков меняются только данные
+    if panel is None:
+        with profiler.stage("создание фигуры"):
+            panel = FigurePanel(root)
+            ax_contour, ax_surface = potential_axes(panel)
+
+    panel.hide("bodies", "trails")
+    status_label.config(text="Расчет...")
+    worker.submit(lambda cancelled: potential_stages(potential_cache, result_store, field_type, params, GRID,
+                                                     cancelled),
+                  show_potential,
+                  lambda error: status_label.config(text=f"Ошибка: {error}"))
+    return field_type, params
+
+
+# Функция для анимации движения тел
+def animate(i):
+    with profiler.stage("шаг тел"):
+        state = next(motion)
+    bodies.set_offsets(state[:, :2])
+
+    # След хранится в кольцевом буфере из TRAIL_LENGTH последних положений
+    with profiler.stage("следы"):
+        trail[i % TRAIL_LENGTH] = state[:len(trail[0]), :2]
+        order = (np.arange(TRAIL_LENGTH) + i + 1) % TRAIL_LENGTH
+        trails.set_segments(trail[order[-min(i + 1, TRAIL_LENGTH):]].transpose(1, 0, 2))
+    return bodies, trails
+
+
+# Функция для запуска движения тел поверх контурного графика
+def start_motion():
+    global motion, bodies, trails, trail, ani
+
+    try:
+        n_bodies = int(entry_bodies.get())
+        mass = float(entry_body_mass.get())
+        speed = float(entry_speed.get())
+        dt = float(entry_dt.get())
+        pair_cutoff = float(entry_cutoff.get()) if pair_var.get() else 0.0
+        pair_strength = float(entry_strength.get())
     except ValueError:
-        result_label.config(text="Ошибка: введите корректные значения параметров")
+        result_label.config(text="Ошибка: введите корректные значения параметров движения")
+        return
+    if n_bodies < 1 or mass <= 0 or dt <= 0:
+        result_label.config(text="Ошибка: число тел, масса и шаг должны быть положительными")
+        return
+
+    plotted = plot_potential_field("Движение тел")
+    if plotted is None:
         return
+    field_type, params = plotted
 
-    # Задаем сетку координат
-    x = np.linspace(-10, 10, 100)
-    y = np.linspace(-10, 10, 100)
-    X, Y = np.meshgrid(x, y)
-    U = calculate_potential_field(X, Y, field_type, params)
-
-    # Создаем фигуру для отображения на холсте
-    fig = Figure(figsize=(6, 5))
-
-    # Контурный график
-    ax1 = fig.add_subplot(121)
-    cp = ax1.contourf(X, Y, U, cmap="viridis")
-    fig.colorbar(cp, ax=ax1)
-    ax1.set_title("Контурное распределение U(x, y)")
-    ax1.set_xlabel("x")
-    ax1.set_ylabel("y")
-
-    # 3D-график
-    ax2 = fig.add_subplot(122, projection='3d')
-    ax2.plot_surface(X, Y, U, cmap="viridis")
-    ax2.set_title("3D график U(x, y)")
-    ax2.set_xlabel("x")
-    ax2.set_ylabel("y")
-    ax2.set_zlabel("U(x, y)")
-
-    # Отображение графика на Tkinter Canvas
-    canvas = FigureCanvasTkAgg(fig, master=root)
-    canvas.draw()
-    canvas.get_tk_widget().pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+    with profiler.stage("начальное состояние"):
+        state = initial_bodies(n_bodies, speed=speed)
+        motion = body_motion(state, dt, field_type, params, mass, pair_cutoff, pair_strength,
+                             steps=STEPS_PER_FRAME)
+
+    # Тела и их следы на контурном графике (пределы осей не меняются); они
+    # рисуются поверх контуров, которые заменяются при уточнении сетки
+    bodies = panel.scatter(ax_contour, "bodies", state[:, 0], state[:, 1], s=4, color="red", zorder=3)
+    trail = np.repeat(state[None, :TRAIL_BODIES, :2], TRAIL_LENGTH, axis=0)
+    trails = panel.lines(ax_contour, "trails", [], colors="white", linewidths=0.8, alpha=0.7, zorder=3)
+    ax_contour.set_xlim(-10, 10)
+    ax_contour.set_ylim(-10, 10)
+    result_label.config(text=f"Тел: {n_bodies}, шаг dt = {dt}, шагов на кадр: {STEPS_PER_FRAME}")
+
+    # Модуль анимации загружается при первом запуске движения
+    from matplotlib.animation import FuncAnimation
+
+    ani = FuncAnimation(panel.figure, animate, interval=30, blit=True, cache_frame_data=False)
 
 
 # Функция для обновления видимости полей ввода параметров
 def update_fields(*args):
-    field_type = field_type_var.get()
-    frame_gravity.grid_remove()
-    frame_spring.grid_remove()
-    frame_power.grid_remove()
-    if field_type == "Гравитационное поле":
-        frame_gravity.grid()
-    elif field_type == "Сила упругости":
-        frame_spring.grid()
-    elif field_type == "Степенная функция":
-        frame_power.grid()
+    for frame in param_frames.values():
+        frame.pack_forget()
+    param_frames[FIELD_TYPES[field_type_var.get()]].pack(before=btn_plot)
+
+
+# Кэш сетки и рассчитанных потенциалов
+potential_cache = PotentialCache()
+
+# Хранилище рассчитанных потенциалов на диске (None - не сохранять)
+result_store = default_store()
+
+# Постоянная фигура с графиками (создается при первом построении) и анимация движения тел
+panel = ax_contour = ax_surface = ani = None
 
 
 # Настройка интерфейса tkinter
@@ -97,55 +146,52 @@ root.geometry("800x800")
 # Выбор типа силы
 field_type_var = tk.StringVar()
 field_type_var.set("Гравитационное поле")
-field_type_var.trace("w", update_fields)
 
 ttk.Label(root, text="Выберите тип силы:").pack(pady=5)
-field_type_menu = ttk.OptionMenu(root, field_type_var, "Гравитационное поле", "Гравитационное поле", "Сила упругости",
-                                 "Степенная функция")
+field_type_menu = ttk.OptionMenu(root, field_type_var, "Гравитационное поле", *FIELD_TYPES)
 field_type_menu.pack()
 
-# Параметры для гравитационного поля
-frame_gravity = ttk.Frame(root)
-ttk.Label(frame_gravity, text="G:").grid(row=0, column=0)
-entry_G = ttk.Entry(frame_gravity)
-entry_G.grid(row=0, column=1)
-ttk.Label(frame_gravity, text="m1:").grid(row=1, column=0)
-entry_m1 = ttk.Entry(frame_gravity)
-entry_m1.grid(row=1, column=1)
-ttk.Label(frame_gravity, text="m2:").grid(row=2, column=0)
-entry_m2 = ttk.Entry(frame_gravity)
-entry_m2.grid(row=2, column=1)
-
-# Параметры для силы упругости
-frame_spring = ttk.Frame(root)
-ttk.Label(frame_spring, text="Коэффициент жесткости k:").grid(row=0, column=0)
-entry_k = ttk.Entry(frame_spring)
-entry_k.grid(row=0, column=1)
-
-# Параметры для степенной функции
-frame_power = ttk.Frame(root)
-ttk.Label(frame_power, text="Коэффициент a:").grid(row=0, column=0)
-entry_a = ttk.Entry(frame_power)
-entry_a.grid(row=0, column=1)
-ttk.Label(frame_power, text="Степень n для x:").grid(row=1, column=0)
-entry_n = ttk.Entry(frame_power)
-entry_n.grid(row=1, column=1)
-ttk.Label(frame_power, text="Коэффициент b:").grid(row=2, column=0)
-entry_b = ttk.Entry(frame_power)
-entry_b.grid(row=2, column=1)
-ttk.Label(frame_power, text="Степень m для y:").grid(row=3, column=0)
-entry_m = ttk.Entry(frame_power)
-entry_m.grid(row=3, column=1)
-
-frame_gravity.pack()
+# Параметры для каждого типа поля
+param_frames, param_entries = parameter_frames(root)
 
 # Кнопка для построения графика
 btn_plot = ttk.Button(root, text="Построить график", command=plot_potential_field)
 btn_plot.pack(pady=10)
+update_fields()
+field_type_var.trace("w", update_fields)
+
+# Параметры движения тел
+frame_motion = ttk.Frame(root)
+motion_fields = (("Число тел:", "1000"), ("Масса тела:", "1"), ("Разброс начальных скоростей:", "0.5"),
+                 ("Шаг dt:", "0.01"), ("Радиус отталкивания:", "0.3"), ("Сила отталкивания:", "50"))
+motion_entries = []
+for row, (label, default) in enumerate(motion_fields):
+    ttk.Label(frame_motion, text=label).grid(row=row, column=0)
+    entry = ttk.Entry(frame_motion)
+    entry.insert(0, default)
+    entry.grid(row=row, column=1)
+    motion_entries.append(entry)
+entry_bodies, entry_body_mass, entry_speed, entry_dt, entry_cutoff, entry_strength = motion_entries
+pair_var = tk.BooleanVar(value=False)
+ttk.Checkbutton(frame_motion, text="Взаимодействие тел", variable=pair_var).grid(row=len(motion_fields), column=0,
+                                                                                columnspan=2)
+frame_motion.pack()
+
+# Кнопка для запуска движения тел
+btn_motion = ttk.Button(root, text="Запустить движение тел", command=start_motion)
+btn_motion.pack(pady=10)
 
 # Поле для вывода результата
 result_label = ttk.Label(root, text="")
 result_label.pack()
+status_label = ttk.Label(root, text="")
+status_label.pack()
+
+# Фоновый поток для расчета потенциала
+worker = BackgroundWorker(root)
+
+# Строка состояния с замером этапов (если он включен)
+profile_status_bar(root)
 
 # Запуск приложения
 root.mainloop()
@@ -1,9 +1,889 @@
-﻿import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+﻿import hashlib
+from collections import Counter, OrderedDict
+
+import numpy as np
 import tkinter as tk
 from tkinter import messagebox
 
+from PlotRendering import FigurePanel
+from Profiling import profile_status_bar, profiler
+from ResultStore import default_store
+from BackgroundWorker import BackgroundWorker, check_cancelled
+from Numerics import expand_ranges, jit_options, run_compiled
+from TiledGrid import TILE_SIZE, fill_tiled, open_output, refinement_specs
+
+
+# Константа Кулона (Н·м²/Кл²)
+K_COULOMB = 8.99e9
+
+# Объем одного временного буфера блока (байт)
+BLOCK_BYTES = 1 << 21
+
+# Число точек в блоке компилируемого ядра: вклады всех зарядов
+# накапливаются в блоке, пока он лежит в кэше процессора
+KERNEL_BLOCK = 4096
+
+# Параметры древесного решателя по умолчанию
+TREE_THETA = 0.5  # угол раскрытия: размер узла / расстояние до него
+TREE_ORDER = 2  # 0 - монополь, 1 - диполь, 2 - квадруполь
+TREE_LEAF_SIZE = 16  # максимальное число зарядов в листе
+TREE_MAX_DEPTH = 16  # максимальная глубина дерева
+TREE_TILE_POINTS = 64  # среднее число точек сетки в одной плитке
+TREE_CHUNK = 1 << 20  # число взаимодействий, обрабатываемых за один проход
+
+# Параметры кэша вкладов зарядов по умолчанию
+CACHE_BYTES = 256 * 2 ** 20  # бюджет памяти кэша (байт)
+CACHE_REBUILD_EVERY = 100  # полный пересчет после стольких правок (накопление ошибок округления)
+
+# Параметры адаптивной сетки по умолчанию
+ADAPTIVE_BASE = 16  # число ячеек начальной сетки по каждой оси
+ADAPTIVE_MAX_LEVEL = 5  # максимальное число делений ячейки
+ADAPTIVE_TOL = 0.05  # порог индикаторов кривизны V и неоднородности E
+
+# Параметры трассировки силовых линий по умолчанию
+LINES_PER_CHARGE = 12  # число линий, выпускаемых из каждого заряда
+LINES_START_RADIUS = 0.05  # радиус окружности затравок вокруг заряда (м)
+LINES_TOL = 1e-3  # допустимая ошибка положения за шаг (м)
+LINES_MAX_STEPS = 1000  # максимальное число шагов
+
+# Причины остановки силовой линии
+LINE_ACTIVE = 0
+LINE_HIT_CHARGE = 1
+LINE_LEFT_DOMAIN = 2
+LINE_STALLED = 3
+LINE_MAX_STEPS = 4
+
+# Сетка графика: границы и число точек по осям, наименьшая сетка при
+# постепенном уточнении и уровни деления адаптивной сетки по этапам
+FIELD_GRID = (-2.0, 2.0, -2.0, 2.0, 50, 50)
+FIELD_COARSE_POINTS = 12
+FIELD_ADAPTIVE_LEVELS = (ADAPTIVE_MAX_LEVEL - 2, ADAPTIVE_MAX_LEVEL)
+
+
+# Функция для приведения списка зарядов к массиву (n, 3)
+def charges_to_array(charges):
+    charges = np.asarray(charges, dtype=float)
+    if charges.size == 0:
+        return np.zeros((0, 3))
+    if charges.ndim != 2 or charges.shape[1] != 3:
+        charges = charges.reshape(-1, 3)
+    return charges
+
+
+# Функция для проверки, что X, Y получены из np.meshgrid(x, y)
+def grid_axes(X, Y):
+    if X.ndim != 2 or X.shape != Y.shape or X.size == 0:
+        return None
+    if not (X == X[:1, :]).all() or not (Y == Y[:, :1]).all():
+        return None
+    return X[0, :], Y[:, 0]
+
+
+# Функция для расчета поля E и потенциала V системы точечных зарядов
+# Возвращает Ex, Ey, |E| и V на сетке X, Y. Вклады всех зарядов считаются
+# одновременно блоками (заряды × точки сетки), объем каждого временного
+# буфера ограничен block_bytes. Точки, совпадающие с зарядом, не получают
+# вклада от этого заряда. dtype задает точность промежуточных вычислений.
+# solver="tree" включает приближенный древесный решатель (см. ниже) с
+# углом раскрытия theta и порядком мультипольного разложения order.
+# backend для прямой суммы: "numpy", "numba" (компилируемое ядро в
+# двойной точности) или "auto" (numba, если установлена). Флаг отмены
+# cancelled (см. check_cancelled) проверяется между частями древесного расчета.
+def compute_field(charges, X, Y, out=None, block_bytes=BLOCK_BYTES, dtype=np.float64,
+                  solver="direct", theta=TREE_THETA, order=TREE_ORDER, backend="auto", cancelled=None):
+    X = np.asarray(X, dtype=float)
+    Y = np.asarray(Y, dtype=float)
+    if X.shape != Y.shape:
+        raise ValueError("X и Y должны иметь одинаковую форму")
+    if solver not in ("direct", "tree"):
+        raise ValueError(f"Неизвестный решатель: {solver}")
+    if backend not in ("auto", "numpy", "numba"):
+        raise ValueError(f"Неизвестный бэкенд: {backend}")
+    charges = charges_to_array(charges)
+
+    if out is None:
+        out = tuple(np.empty(X.shape) for _ in range(4))
+    Ex, Ey, E, V = out
+    for arr in out:
+        if arr.shape != X.shape:
+            raise ValueError("Выходные массивы должны иметь форму сетки")
+
+    if len(charges) == 0:
+        for arr in out:
+            arr.fill(0.0)
+        return Ex, Ey, E, V
+
+    axes = grid_axes(X, Y) if solver == "direct" and backend == "numpy" else None
+    if axes is not None:
+        _field_on_grid(charges, axes[0], axes[1], Ex, Ey, V, block_bytes, dtype)
+    else:
+        flat = [arr.reshape(-1) if arr.flags.c_contiguous else np.empty(arr.size) for arr in (Ex, Ey, V)]
+        if solver == "tree":
+            _field_tree(charges, X.ravel(), Y.ravel(), *flat, theta, order, cancelled)
+        elif not _field_compiled(charges, X.ravel(), Y.ravel(), *flat, backend):
+            axes = grid_axes(X, Y)
+            if axes is not None:
+                _field_on_grid(charges, axes[0], axes[1], Ex, Ey, V, block_bytes, dtype)
+                flat = (Ex, Ey, V)
+            else:
+                _field_on_points(charges, X.ravel(), Y.ravel(), *flat, block_bytes, dtype)
+        for arr, values in zip((Ex, Ey, V), flat):
+            if not np.shares_memory(arr, values):
+                arr[...] = values.reshape(arr.shape)
+
+    Ex *= K_COULOMB
+    Ey *= K_COULOMB
+    V *= K_COULOMB
+    np.hypot(Ex, Ey, out=E)
+    return Ex, Ey, E, V
+
+
+# Функция для поблочного расчета поля на большой сетке
+# spec = (x_min, x_max, y_min, y_max, nx, ny). Сетка обходится плитками
+# tile × tile, и все временные массивы имеют размер плитки. Результат
+# (Ex, Ey, |E|, V) пишется в массивы формы (ny, nx) типа dtype, а при
+# заданном path_prefix - в файлы <path_prefix>_Ex.npy, _Ey.npy, _E.npy,
+# _V.npy через np.memmap, так что память не зависит от размера сетки.
+def compute_field_tiled(charges, spec, path_prefix=None, dtype=np.float64, tile=TILE_SIZE,
+                        solver="direct", theta=TREE_THETA, order=TREE_ORDER):
+    charges = charges_to_array(charges)
+    shape = (spec[5], spec[4])
+    outputs = tuple(open_output(None if path_prefix is None else f"{path_prefix}_{name}.npy", shape, dtype)
+                    for name in ("Ex", "Ey", "E", "V"))
+
+    def evaluate(x, y):
+        X, Y = np.broadcast_arrays(x, y)
+        out = tuple(np.empty(X.shape, dtype=dtype) for _ in range(4))
+        return compute_field(charges, X, Y, out=out, dtype=dtype, solver=solver, theta=theta, order=order)
+
+    return fill_tiled(outputs, spec, evaluate, tile, dtype)
+
+
+# Прямоугольная сетка: dx зависит только от столбца, dy только от строки,
+# поэтому квадраты расстояний собираются из двух маленьких таблиц
+def _field_on_grid(charges, x, y, Ex, Ey, V, block_bytes, dtype):
+    cx, cy, q = charges[:, 0:1], charges[:, 1:2], charges[:, 2]
+    n = len(q)
+    dx = x[None, :] - cx
+    dy = y[None, :] - cy
+    dx2 = (dx * dx).astype(dtype)
+    dy2 = (dy * dy).astype(dtype)
+    qdx = (q[:, None] * dx).astype(dtype)
+    qdy = (q[:, None] * dy).astype(dtype)
+    q = q.astype(dtype)
+
+    # Узлы сетки, совпадающие с зарядами
+    hit_c, hit_j, hit_i = [], [], []
+    for c, i in zip(*np.nonzero(dx2 == 0)):
+        for j in np.flatnonzero(dy2[c] == 0):
+            hit_c.append(c)
+            hit_j.append(j)
+            hit_i.append(i)
+    hit_c, hit_j, hit_i = np.array(hit_c, int), np.array(hit_j, int), np.array(hit_i, int)
+
+    nx, ny = len(x), len(y)
+    rows = int(max(1, min(ny, block_bytes // (np.dtype(dtype).itemsize * n * nx))))
+    r2 = np.empty((n, rows, nx), dtype=dtype)
+    inv_r = np.empty((n, rows, nx), dtype=dtype)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for start in range(0, ny, rows):
+            stop = min(start + rows, ny)
+            r2_b = r2[:, :stop - start]
+            inv_r_b = inv_r[:, :stop - start]
+
+            np.add(dy2[:, start:stop, None], dx2[:, None, :], out=r2_b)
+            np.sqrt(r2_b, out=inv_r_b)
+            np.reciprocal(inv_r_b, out=inv_r_b)
+            # r2_b теперь хранит 1 / r^3
+            np.divide(inv_r_b, r2_b, out=r2_b)
+
+            if len(hit_c):
+                sel = (hit_j >= start) & (hit_j < stop)
+                inv_r_b[hit_c[sel], hit_j[sel] - start, hit_i[sel]] = 0
+                r2_b[hit_c[sel], hit_j[sel] - start, hit_i[sel]] = 0
+
+            V[start:stop] = np.einsum('c,cji->ji', q, inv_r_b)
+            Ex[start:stop] = np.einsum('ci,cji->ji', qdx, r2_b)
+            Ey[start:stop] = np.einsum('cj,cji->ji', qdy[:, start:stop], r2_b)
+
+
+# Произвольный набор точек: блоки по точкам, буферы переиспользуются
+def _field_on_points(charges, px, py, Ex, Ey, V, block_bytes, dtype):
+    cx = charges[:, 0:1].astype(dtype)
+    cy = charges[:, 1:2].astype(dtype)
+    q = charges[:, 2].astype(dtype)
+    n, N = len(q), len(px)
+    size = int(max(1, min(N, block_bytes // (np.dtype(dtype).itemsize * n))))
+    dx = np.empty((n, size), dtype=dtype)
+    dy = np.empty((n, size), dtype=dtype)
+    r = np.empty((n, size), dtype=dtype)
+    tmp = np.empty((n, size), dtype=dtype)
+    hit = np.empty((n, size), dtype=bool)
+
+    for start in range(0, N, size):
+        stop = min(start + size, N)
+        w = stop - start
+        dx_b, dy_b, r_b, tmp_b, hit_b = dx[:, :w], dy[:, :w], r[:, :w], tmp[:, :w], hit[:, :w]
+
+        np.subtract(px[None, start:stop], cx, out=dx_b)
+        np.subtract(py[None, start:stop], cy, out=dy_b)
+        np.multiply(dx_b, dx_b, out=r_b)
+        np.multiply(dy_b, dy_b, out=tmp_b)
+        r_b += tmp_b
+
+        # Избегаем деления на ноль
+        np.equal(r_b, 0, out=hit_b)
+        np.sqrt(r_b, out=r_b)
+        r_b[hit_b] = np.inf
+        np.reciprocal(r_b, out=r_b)
+
+        V[start:stop] = q @ r_b
+        np.multiply(r_b, r_b, out=tmp_b)
+        tmp_b *= r_b
+        dx_b *= tmp_b
+        dy_b *= tmp_b
+        Ex[start:stop] = q @ dx_b
+        Ey[start:stop] = q @ dy_b
+
+
+# 1/r для компилируемого ядра (0 при r2 = 0, как у совпадающих с зарядом
+# точек): начальное приближение в одинарной точности (относительная ошибка
+# около 1e-7) считается быстрой векторной инструкцией, одна поправка
+# третьего порядка y(1 + e/2 + 3e²/8), e = 1 - r2·y², доводит его до
+# двойной точности
+@jit_options(fastmath={"contract", "afn", "arcp"}, error_model="numpy", inline="always")
+def _inv_sqrt(r2):
+    y = np.float64(np.float32(1.0) / np.sqrt(np.float32(r2)))
+    e = 1.0 - r2 * y * y
+    y = y + y * e * (0.5 + 0.375 * e)
+    return y if r2 > 0 else 0.0
+
+
+# Цикл прямой суммы по точкам (компилируется numba)
+# Точки обходятся блоками по block, заряды - парами: вклады двух зарядов
+# складываются до записи в накопители. Внутренние циклы идут по точкам
+# блока без ветвлений и векторизуются.
+@jit_options(fastmath={"contract", "afn", "arcp"}, error_model="numpy")
+def _field_loop(inv_sqrt, cx, cy, q, px, py, Ex, Ey, V, block):
+    n = len(q)
+    for start in range(0, len(px), block):
+        stop = min(start + block, len(px))
+        bx, by = px[start:stop], py[start:stop]
+        bEx, bEy, bV = Ex[start:stop], Ey[start:stop], V[start:stop]
+        bEx[:] = 0.0
+        bEy[:] = 0.0
+        bV[:] = 0.0
+        for c in range(0, n - 1, 2):
+            cxa, cya, qa = cx[c], cy[c], q[c]
+            cxb, cyb, qb = cx[c + 1], cy[c + 1], q[c + 1]
+            for i in range(stop - start):
+                dxa = bx[i] - cxa
+                dya = by[i] - cya
+                dxb = bx[i] - cxb
+                dyb = by[i] - cyb
+                ra = inv_sqrt(dxa * dxa + dya * dya)
+                rb = inv_sqrt(dxb * dxb + dyb * dyb)
+                qra = qa * ra
+                qrb = qb * rb
+                qr3a = qra * ra * ra
+                qr3b = qrb * rb * rb
+                bV[i] += qra + qrb
+                bEx[i] += qr3a * dxa + qr3b * dxb
+                bEy[i] += qr3a * dya + qr3b * dyb
+        if n % 2:
+            cxa, cya, qa = cx[n - 1], cy[n - 1], q[n - 1]
+            for i in range(stop - start):
+                dxa = bx[i] - cxa
+                dya = by[i] - cya
+                ra = inv_sqrt(dxa * dxa + dya * dya)
+                qra = qa * ra
+                qr3a = qra * ra * ra
+                bV[i] += qra
+                bEx[i] += qr3a * dxa
+                bEy[i] += qr3a * dya
+
+
+# Функция для прямой суммы компилируемым ядром; False - ядро недоступно
+# (или результат нужно пересчитать через numpy, см. ниже)
+# Координаты делятся на степень двойки (точно), чтобы квадраты расстояний
+# лежали в диапазоне одинарной точности. Точка ближе ~1e-19 масштаба к
+# заряду, но не совпадающая с ним, дает нечисловое приближение; тогда
+# весь расчет повторяется через numpy.
+def _field_compiled(charges, px, py, Ex, Ey, V, backend):
+    if backend == "numpy":
+        return False
+    extent = max(np.abs(px).max(initial=0.0), np.abs(py).max(initial=0.0), np.abs(charges[:, :2]).max())
+    scale = 2.0 ** np.ceil(np.log2(extent)) if extent > 0 else 1.0
+    buffers = [arr if arr.dtype == np.float64 else np.empty(arr.shape) for arr in (Ex, Ey, V)]
+    if not run_compiled(_field_loop, _inv_sqrt, backend, charges[:, 0] / scale, charges[:, 1] / scale,
+                        np.ascontiguousarray(charges[:, 2]), px / scale, py / scale, *buffers, KERNEL_BLOCK):
+        return False
+    if not all(np.isfinite(arr).all() for arr in buffers):
+        return False
+    for arr, values, power in zip((Ex, Ey, V), buffers, (2, 2, 1)):
+        values /= scale ** power
+        if values is not arr:
+            arr[...] = values
+    return True
+
+
+# Функция для вычисления ключей Мортона (чередование битов ix и iy)
+def _morton_keys(ix, iy):
+    def spread(v):
+        v = v.astype(np.int64) & 0xFFFF
+        v = (v | (v << 8)) & 0x00FF00FF
+        v = (v | (v << 4)) & 0x0F0F0F0F
+        v = (v | (v << 2)) & 0x33333333
+        v = (v | (v << 1)) & 0x55555555
+        return v
+    return spread(ix) | (spread(iy) << 1)
+
+
+# Функция для построения квадродерева зарядов
+# Узлы хранятся по уровням подряд, дети каждого узла лежат непрерывным
+# отрезком. Для каждого узла запоминаются мультипольные моменты относительно
+# центра разложения и радиус, охватывающий все его заряды.
+def build_charge_tree(charges, leaf_size=TREE_LEAF_SIZE, max_depth=TREE_MAX_DEPTH):
+    charges = charges_to_array(charges)
+    if len(charges) == 0:
+        raise ValueError("Для построения дерева нужен хотя бы один заряд")
+    x, y, q = charges[:, 0], charges[:, 1], charges[:, 2]
+
+    x0, y0 = x.min(), y.min()
+    size = max(x.max() - x0, y.max() - y0)
+    size = size * (1 + 1e-12) if size > 0 else 1.0
+    cells = 1 << max_depth
+    ix = np.minimum(((x - x0) / size * cells).astype(np.int64), cells - 1)
+    iy = np.minimum(((y - y0) / size * cells).astype(np.int64), cells - 1)
+    keys = _morton_keys(ix, iy)
+    order = np.argsort(keys, kind="stable")
+    keys, ix, iy = keys[order], ix[order], iy[order]
+    x, y, q = x[order], y[order], q[order]
+
+    levels = []
+    for level in range(max_depth + 1):
+        prefix = keys >> (2 * (max_depth - level))
+        starts = np.flatnonzero(np.r_[True, prefix[1:] != prefix[:-1]])
+        counts = np.diff(np.r_[starts, len(keys)])
+
+        # Активны только узлы, вложенные в активные нелистовые узлы уровнем выше
+        if level:
+            parent = np.searchsorted(prev_starts, starts, side="right") - 1
+            active = prev_expand[parent]
+        else:
+            active = np.ones(1, dtype=bool)
+        # Центр разложения - центр модулей зарядов узла (или центр ячейки)
+        cell = size / (1 << level)
+        cx = x0 + ((ix[starts] >> (max_depth - level)) + 0.5) * cell
+        cy = y0 + ((iy[starts] >> (max_depth - level)) + 0.5) * cell
+        weight = np.add.reduceat(np.abs(q), starts)
+        has_weight = weight > 0
+        cx[has_weight] = (np.add.reduceat(np.abs(q) * x, starts) / np.where(has_weight, weight, 1))[has_weight]
+        cy[has_weight] = (np.add.reduceat(np.abs(q) * y, starts) / np.where(has_weight, weight, 1))[has_weight]
+
+        owner = np.repeat(np.arange(len(starts)), counts)
+        dx = x - cx[owner]
+        dy = y - cy[owner]
+        qdx, qdy = q * dx, q * dy
+        sxx = np.add.reduceat(qdx * dx, starts)
+        syy = np.add.reduceat(qdy * dy, starts)
+        moments = np.stack([
+            np.add.reduceat(q, starts),
+            np.add.reduceat(qdx, starts),
+            np.add.reduceat(qdy, starts),
+            2 * sxx - syy,
+            3 * np.add.reduceat(qdx * dy, starts),
+            2 * syy - sxx,
+        ], axis=1)
+        radius = np.maximum.reduceat(np.hypot(dx, dy), starts)
+
+        leaf = (counts <= leaf_size) | (level == max_depth)
+        levels.append((starts[active], counts[active], cx[active], cy[active],
+                       radius[active], moments[active], leaf[active]))
+        prev_starts = starts
+        prev_expand = active & ~leaf
+        if not prev_expand.any():
+            break
+
+    # Сшивание уровней и поиск детей
+    start = np.concatenate([lv[0] for lv in levels])
+    count = np.concatenate([lv[1] for lv in levels])
+    level_first = np.cumsum([0] + [len(lv[0]) for lv in levels])
+    child_first = np.zeros(len(start), dtype=np.int64)
+    child_count = np.zeros(len(start), dtype=np.int64)
+    for level in range(len(levels) - 1):
+        lo, hi = level_first[level], level_first[level + 1]
+        nxt = levels[level + 1][0]
+        first = np.searchsorted(nxt, start[lo:hi])
+        last = np.searchsorted(nxt, start[lo:hi] + count[lo:hi])
+        child_first[lo:hi] = level_first[level + 1] + first
+        child_count[lo:hi] = last - first
+
+    return {
+        "x": x, "y": y, "q": q,
+        "start": start, "count": count,
+        "cx": np.concatenate([lv[2] for lv in levels]),
+        "cy": np.concatenate([lv[3] for lv in levels]),
+        "radius": np.concatenate([lv[4] for lv in levels]),
+        "moments": np.concatenate([lv[5] for lv in levels]),
+        "leaf": np.concatenate([lv[6] for lv in levels]),
+        "child_first": child_first, "child_count": child_count,
+    }
+
+
+# Функция для разбиения точек на плитки примерно по tile_points точек
+def _tile_points(px, py, tile_points=TREE_TILE_POINTS):
+    x0, y0 = px.min(), py.min()
+    width = max(px.max() - x0, 1e-300)
+    height = max(py.max() - y0, 1e-300)
+    n_tiles = max(1, len(px) // tile_points)
+    nbx = int(max(1, round(np.sqrt(n_tiles * width / height))))
+    nby = int(max(1, round(n_tiles / nbx)))
+    bx = np.minimum(((px - x0) / width * nbx).astype(np.int64), nbx - 1)
+    by = np.minimum(((py - y0) / height * nby).astype(np.int64), nby - 1)
+    order = np.argsort(by * nbx + bx, kind="stable")
+    key = (by * nbx + bx)[order]
+    starts = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+    counts = np.diff(np.r_[starts, len(key)])
+
+    sx, sy = px[order], py[order]
+    xmin, xmax = np.minimum.reduceat(sx, starts), np.maximum.reduceat(sx, starts)
+    ymin, ymax = np.minimum.reduceat(sy, starts), np.maximum.reduceat(sy, starts)
+    return {
+        "order": order, "x": sx, "y": sy, "start": starts, "count": counts,
+        "cx": 0.5 * (xmin + xmax), "cy": 0.5 * (ymin + ymax),
+        "radius": 0.5 * np.hypot(xmax - xmin, ymax - ymin),
+    }
+
+
+# Функция для обхода дерева: пары (плитка, узел) делятся на дальние,
+# для которых хватает мультипольного разложения, и ближние листовые
+def _interaction_lists(tree, tiles, theta):
+    t = np.arange(len(tiles["start"]))
+    n = np.zeros(len(t), dtype=np.int64)
+    far, near = [], []
+    while len(t):
+        dist = np.hypot(tiles["cx"][t] - tree["cx"][n], tiles["cy"][t] - tree["cy"][n]) - tiles["radius"][t]
+        accept = (dist > 0) & (tree["radius"][n] < theta * dist)
+        far.append((t[accept], n[accept]))
+        leaf = ~accept & tree["leaf"][n]
+        near.append((t[leaf], n[leaf]))
+        split = ~accept & ~tree["leaf"][n]
+        owner, n = expand_ranges(tree["child_first"][n[split]], tree["child_count"][n[split]])
+        t = t[split][owner]
+    far_t, far_n = (np.concatenate(a) for a in zip(*far))
+    near_t, near_n = (np.concatenate(a) for a in zip(*near))
+    return far_t, far_n, near_t, near_n
+
+
+# Функция для обхода пар (плитка, источник) порциями не больше TREE_CHUNK
+# взаимодействий: возвращает индексы источника и точки для каждой порции
+def _pair_chunks(pair_tiles, pair_sources, tiles):
+    counts = tiles["count"][pair_tiles]
+    total = np.cumsum(counts)
+    lo = 0
+    while lo < len(counts):
+        done = total[lo - 1] if lo else 0
+        hi = max(lo + 1, int(np.searchsorted(total, done + TREE_CHUNK, side="right")))
+        owner, points = expand_ranges(tiles["start"][pair_tiles[lo:hi]], counts[lo:hi])
+        yield pair_sources[lo:hi][owner], points
+        lo = hi
+
+
+# Древесный решатель (Barnes–Hut): для далеких узлов используется
+# мультипольное разложение до порядка order, для ближних листов - прямая сумма.
+# Результат без множителя K_COULOMB, как и у прямых ядер.
+def _field_tree(charges, px, py, Ex, Ey, V, theta, order, cancelled=None):
+    tree = build_charge_tree(charges)
+    tiles = _tile_points(px, py)
+    far_t, far_n, near_t, near_n = _interaction_lists(tree, tiles, theta)
+    N = len(px)
+    ex, ey, v = np.zeros(N), np.zeros(N), np.zeros(N)
+
+    for nodes, points in _pair_chunks(far_t, far_n, tiles):
+        check_cancelled(cancelled)
+        rx = tiles["x"][points] - tree["cx"][nodes]
+        ry = tiles["y"][points] - tree["cy"][nodes]
+        inv_r2 = 1.0 / (rx * rx + ry * ry)
+        inv_r = np.sqrt(inv_r2)
+        mom = tree["moments"][nodes]
+
+        q_r3 = mom[:, 0] * inv_r * inv_r2
+        pot = mom[:, 0] * inv_r
+        fx = q_r3 * rx
+        fy = q_r3 * ry
+        if order >= 1:
+            inv_r3 = inv_r * inv_r2
+            pr = mom[:, 1] * rx + mom[:, 2] * ry
+            pot += pr * inv_r3
+            a = 3 * pr * inv_r3 * inv_r2
+            fx += a * rx - mom[:, 1] * inv_r3
+            fy += a * ry - mom[:, 2] * inv_r3
+        if order >= 2:
+            inv_r5 = inv_r * inv_r2 * inv_r2
+            qrx = mom[:, 3] * rx + mom[:, 4] * ry
+            qry = mom[:, 4] * rx + mom[:, 5] * ry
+            rqr = qrx * rx + qry * ry
+            pot += 0.5 * rqr * inv_r5
+            a = 2.5 * rqr * inv_r5 * inv_r2
+            fx += a * rx - qrx * inv_r5
+            fy += a * ry - qry * inv_r5
+
+        v += np.bincount(points, weights=pot, minlength=N)
+        ex += np.bincount(points, weights=fx, minlength=N)
+        ey += np.bincount(points, weights=fy, minlength=N)
+
+    # Ближние листы: пары (плитка, заряд) и прямое суммирование
+    owner, sources = expand_ranges(tree["start"][near_n], tree["count"][near_n])
+    for src, points in _pair_chunks(near_t[owner], sources, tiles):
+        check_cancelled(cancelled)
+        rx = tiles["x"][points] - tree["x"][src]
+        ry = tiles["y"][points] - tree["y"][src]
+        r2 = rx * rx + ry * ry
+        # Избегаем деления на ноль
+        r2[r2 == 0] = np.inf
+        inv_r = 1.0 / np.sqrt(r2)
+        q_r = tree["q"][src] * inv_r
+        q_r3 = q_r / r2
+
+        v += np.bincount(points, weights=q_r, minlength=N)
+        ex += np.bincount(points, weights=q_r3 * rx, minlength=N)
+        ey += np.bincount(points, weights=q_r3 * ry, minlength=N)
+
+    Ex[tiles["order"]] = ex
+    Ey[tiles["order"]] = ey
+    V[tiles["order"]] = v
+
+
+# Функция для оценки погрешности приближенного решения (например, древесного)
+# относительно прямой суммы на случайной выборке из sample точек.
+# Возвращает относительные ошибки в норме L2 и максимальные ошибки,
+# отнесенные к максимуму модуля точного значения.
+def field_error(charges, X, Y, field, sample=2000, seed=0):
+    X = np.ravel(X)
+    Y = np.ravel(Y)
+    Ex, Ey, _, V = (np.ravel(arr) for arr in field)
+    rng = np.random.default_rng(seed)
+    idx = rng.choice(len(X), size=min(sample, len(X)), replace=False)
+    ref_Ex, ref_Ey, ref_E, ref_V = compute_field(charges, X[idx], Y[idx])
+
+    dV = V[idx] - ref_V
+    dE = np.hypot(Ex[idx] - ref_Ex, Ey[idx] - ref_Ey)
+    tiny = np.finfo(float).tiny
+    return {
+        "V_l2": np.linalg.norm(dV) / max(np.linalg.norm(ref_V), tiny),
+        "E_l2": np.linalg.norm(dE) / max(np.linalg.norm(ref_E), tiny),
+        "V_max": np.abs(dV).max() / max(np.abs(ref_V).max(), tiny),
+        "E_max": dE.max() / max(ref_E.max(), tiny),
+    }
+
+
+# Функция для адаптивной выборки поля на квадродереве ячеек
+# Начальная сетка base × base ячеек в области bounds делится на четыре там,
+# где потенциал в центре ячейки заметно отличается от среднего по углам
+# (кривизна V) или вектор E в центре отличается от среднего по углам
+# (большой градиент поля). Все ячейки уровня обрабатываются вместе, поле
+# в каждой точке вычисляется один раз. Возвращает словарь: координаты всех
+# вычисленных точек x, y, значения Ex, Ey, E, V в них, индексы центров
+# листовых ячеек centers, размеры этих ячеек size и типичный диапазон
+# потенциала V_range (5-й и 95-й процентили на начальной сетке).
+# Флаг отмены cancelled проверяется перед каждым уровнем деления.
+def adaptive_field(charges, bounds=(-2, 2, -2, 2), base=ADAPTIVE_BASE, max_level=ADAPTIVE_MAX_LEVEL,
+                   tol=ADAPTIVE_TOL, solver="direct", theta=TREE_THETA, cancelled=None):
+    x0, x1, y0, y1 = bounds
+    # Целочисленные координаты: центры ячеек последнего уровня тоже целые
+    step = 2 ** (max_level + 1)
+    width = base * step
+    hx = (x1 - x0) / width
+    hy = (y1 - y0) / width
+
+    keys = np.zeros(0, dtype=np.int64)
+    values = np.zeros((0, 4))
+
+    def lookup(key):
+        nonlocal keys, values
+        new = np.setdiff1d(key, keys)
+        if len(new):
+            px = x0 + (new // (width + 1)) * hx
+            py = y0 + (new % (width + 1)) * hy
+            field = compute_field(charges, px, py, solver=solver, theta=theta, cancelled=cancelled)
+            keys = np.concatenate([keys, new])
+            values = np.concatenate([values, np.stack(field, axis=1)])
+            order = np.argsort(keys)
+            keys, values = keys[order], values[order]
+        return np.searchsorted(keys, key)
+
+    ci, cj = (arr.ravel() * step for arr in np.meshgrid(np.arange(base), np.arange(base), indexing="ij"))
+    size = step
+    leaf_centers, leaf_sizes = [], []
+    V_range = None
+    for level in range(max_level + 1):
+        check_cancelled(cancelled)
+        half = size // 2
+        corner_keys = np.stack([ci, ci + size, ci, ci + size]) * (width + 1) + np.stack([cj, cj, cj + size, cj + size])
+        center_keys = (ci + half) * (width + 1) + cj + half
+        found = lookup(np.concatenate([corner_keys, center_keys[None]]))
+        corners, center = found[:4], found[4]
+        if level == max_level:
+            leaf_centers.append(center_keys)
+            leaf_sizes.append(np.full(len(center), size))
+            break
+
+        Ex_c, Ey_c, _, V_c = values[center].T
+        Ex_k, Ey_k, E_k, V_k = (values[corners][..., m] for m in range(4))
+        if V_range is None:
+            # Типичный разброс V по равномерной начальной сетке
+            V_range = tuple(np.percentile(values[:, 3], [5, 95]))
+        V_scale = V_range[1] - V_range[0] if V_range[1] > V_range[0] else 1.0
+
+        # Индикаторы кривизны потенциала и неоднородности поля
+        curvature = np.abs(V_c - V_k.mean(axis=0)) / V_scale
+        dE = np.hypot(Ex_c - Ex_k.mean(axis=0), Ey_c - Ey_k.mean(axis=0))
+        E_norm = np.hypot(Ex_c, Ey_c) + E_k.mean(axis=0)
+        gradient = dE / np.where(E_norm > 0, E_norm, 1.0)
+        refine = (curvature > tol) | (gradient > tol)
+
+        leaf_centers.append(center_keys[~refine])
+        leaf_sizes.append(np.full(int((~refine).sum()), size))
+        ci = np.concatenate([ci[refine], ci[refine] + half, ci[refine], ci[refine] + half])
+        cj = np.concatenate([cj[refine], cj[refine], cj[refine] + half, cj[refine] + half])
+        size = half
+        if len(ci) == 0:
+            break
+
+    # Индексы центров листьев ищутся в конце: добавление точек сдвигает их
+    centers = np.searchsorted(keys, np.concatenate(leaf_centers))
+    sizes = np.concatenate(leaf_sizes)
+    return {
+        "x": x0 + (keys // (width + 1)) * hx,
+        "y": y0 + (keys % (width + 1)) * hy,
+        "Ex": values[:, 0], "Ey": values[:, 1], "E": values[:, 2], "V": values[:, 3],
+        "centers": centers, "size": sizes * hx,
+        "V_range": V_range if V_range is not None else (values[:, 3].min(), values[:, 3].max()),
+    }
+
+
+# Функция для расстояния от каждой точки до ближайшего заряда
+def nearest_charge_distance(charges, px, py, block_bytes=BLOCK_BYTES):
+    charges = charges_to_array(charges)
+    cx, cy = charges[:, 0:1], charges[:, 1:2]
+    dist = np.empty(len(px))
+    size = int(max(1, block_bytes // (8 * max(len(charges), 1))))
+    for start in range(0, len(px), size):
+        stop = min(start + size, len(px))
+        d2 = (px[None, start:stop] - cx) ** 2 + (py[None, start:stop] - cy) ** 2
+        dist[start:stop] = np.sqrt(d2.min(axis=0))
+    return dist
+
+
+# Функция для трассировки силовых линий
+# Из каждого заряда на окружности радиуса r0 выпускается lines_per_charge
+# линий: от положительных зарядов вдоль E, от отрицательных против E. Все
+# линии продвигаются одновременно методом Богацкого–Шампина 3(2) по длине
+# дуги, шаг каждой линии подбирается по оценке ошибки tol. Поле вычисляется
+# только в текущих точках линий. Линия останавливается, когда подходит к
+# заряду ближе r_stop, выходит из области bounds, попадает в точку с E = 0
+# или исчерпывает max_steps шагов.
+# Возвращает словарь: points - точки всех линий подряд, start и count -
+# начало и длина каждой линии в points, status - причина остановки
+# (LINE_HIT_CHARGE, LINE_LEFT_DOMAIN, LINE_STALLED, LINE_MAX_STEPS).
+# Флаг отмены cancelled проверяется перед каждым шагом.
+def trace_field_lines(charges, lines_per_charge=LINES_PER_CHARGE, r0=LINES_START_RADIUS, bounds=(-2, 2, -2, 2),
+                      tol=LINES_TOL, h_min=1e-4, h_max=0.1, max_steps=LINES_MAX_STEPS, r_stop=None,
+                      solver="direct", theta=TREE_THETA, cancelled=None):
+    charges = charges_to_array(charges)
+    charges = charges[charges[:, 2] != 0]
+    if r_stop is None:
+        r_stop = 0.5 * r0
+    x0, x1, y0, y1 = bounds
+
+    # Затравки на окружностях вокруг зарядов
+    angles = 2 * np.pi * (np.arange(lines_per_charge) + 0.5) / lines_per_charge
+    pos = np.stack([
+        (charges[:, 0:1] + r0 * np.cos(angles)).ravel(),
+        (charges[:, 1:2] + r0 * np.sin(angles)).ravel(),
+    ], axis=1)
+    sign = np.repeat(np.sign(charges[:, 2]), lines_per_charge)
+    L = len(pos)
+
+    def direction(p, s):
+        Ex, Ey, E, _ = compute_field(charges, p[:, 0], p[:, 1], solver=solver, theta=theta, cancelled=cancelled)
+        scale = s / np.where(E > 0, E, np.inf)
+        return np.stack([Ex * scale, Ey * scale], axis=1)
+
+    h = np.full(L, min(r0, h_max))
+    k1 = direction(pos, sign) if L else np.zeros((0, 2))
+    status = np.zeros(L, dtype=np.int8)
+    active = np.arange(L)
+    recorded_lines = [active]
+    recorded_points = [pos.copy()]
+
+    for _ in range(max_steps):
+        if len(active) == 0:
+            break
+        check_cancelled(cancelled)
+        y, s, hh = pos[active], sign[active], h[active][:, None]
+        k1a = k1[active]
+        k2 = direction(y + 0.5 * hh * k1a, s)
+        k3 = direction(y + 0.75 * hh * k2, s)
+        y3 = y + hh * (2 / 9 * k1a + 1 / 3 * k2 + 4 / 9 * k3)
+        k4 = direction(y3, s)
+        y2 = y + hh * (7 / 24 * k1a + 1 / 4 * k2 + 1 / 3 * k3 + 1 / 8 * k4)
+
+        # Управление шагом по разности решений 3-го и 2-го порядка
+        err = np.hypot(*(y3 - y2).T)
+        ok = (err <= tol) | (h[active] <= h_min)
+        factor = np.clip(0.9 * (tol / np.maximum(err, 1e-300)) ** (1 / 3), 0.2, 5.0)
+        h[active] = np.clip(h[active] * factor, h_min, h_max)
+
+        accepted = active[ok]
+        moved = np.hypot(*(y3[ok] - pos[accepted]).T)
+        pos[accepted] = y3[ok]
+        k1[accepted] = k4[ok]
+        recorded_lines.append(accepted)
+        recorded_points.append(pos[accepted].copy())
+
+        # Условия остановки
+        px, py = pos[accepted, 0], pos[accepted, 1]
+        outside = (px < x0) | (px > x1) | (py < y0) | (py > y1)
+        hit = nearest_charge_distance(charges, px, py) < r_stop
+        stalled = moved < 1e-12
+        status[accepted[stalled]] = LINE_STALLED
+        status[accepted[outside]] = LINE_LEFT_DOMAIN
+        status[accepted[hit]] = LINE_HIT_CHARGE
+        active = active[status[active] == LINE_ACTIVE]
+
+    status[active] = LINE_MAX_STEPS
+
+    # Точки каждой линии подряд, в порядке шагов
+    lines = np.concatenate(recorded_lines)
+    points = np.concatenate(recorded_points)
+    order = np.argsort(lines, kind="stable")
+    count = np.bincount(lines, minlength=L)
+    return {
+        "points": points[order],
+        "start": np.cumsum(count) - count,
+        "count": count,
+        "status": status,
+        "sign": sign,
+    }
+
+
+# Кэш вкладов отдельных зарядов для интерактивного редактирования
+# Вклад каждого заряда (Ex, Ey, V) хранится по ключу (x, y, q, сетка), при
+# превышении max_bytes вытесняются давно не использованные записи. При правке
+# набора зарядов из накопленных сумм вычитаются вклады удаленных зарядов и
+# добавляются вклады новых, поэтому время пропорционально числу изменений.
+class FieldCache:
+    def __init__(self, max_bytes=CACHE_BYTES, rebuild_every=CACHE_REBUILD_EVERY):
+        self.max_bytes = max_bytes
+        self.rebuild_every = rebuild_every
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+        # Текущее состояние сумм
+        self.grid_key = None
+        self.charges = Counter()
+        self.totals = None
+        self.updates = 0
+
+    def clear(self):
+        self.entries.clear()
+        self.nbytes = 0
+        self.grid_key = None
+        self.charges = Counter()
+        self.totals = None
+        self.updates = 0
+
+    # Вклад одного заряда: из кэша или вычисленный заново
+    def contribution(self, charge, X, Y):
+        key = charge + (self.grid_key,)
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+        Ex, Ey, _, V = compute_field([charge], X, Y)
+        entry = (Ex, Ey, V)
+        size = Ex.nbytes + Ey.nbytes + V.nbytes
+        if size <= self.max_bytes:
+            self.entries[key] = entry
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                _, old = self.entries.popitem(last=False)
+                self.nbytes -= sum(arr.nbytes for arr in old)
+        return entry
+
+    # Функция для пересчета поля после правки набора зарядов
+    # Возвращает Ex, Ey, |E| и V, как compute_field
+    def update(self, charges, X, Y):
+        X = np.asarray(X, dtype=float)
+        Y = np.asarray(Y, dtype=float)
+        charges = Counter(tuple(charge) for charge in charges_to_array(charges).tolist())
+        grid_key = (X.shape, hashlib.sha1(X.tobytes()).hexdigest(), hashlib.sha1(Y.tobytes()).hexdigest())
+
+        removed = self.charges - charges
+        added = charges - self.charges
+        changed = sum(removed.values()) + sum(added.values())
+
+        if (grid_key != self.grid_key or self.totals is None or self.updates >= self.rebuild_every
+                or changed >= sum(charges.values())):
+            # Полный пересчет выгоднее: новая сетка или изменилось большинство зарядов
+            self.grid_key = grid_key
+            Ex, Ey, _, V = compute_field(list(charges.elements()), X, Y)
+            self.totals = (Ex, Ey, V)
+            self.updates = 0
+        elif changed:
+            for charge, count in removed.items():
+                for total, part in zip(self.totals, self.contribution(charge, X, Y)):
+                    for _ in range(count):
+                        total -= part
+            for charge, count in added.items():
+                for total, part in zip(self.totals, self.contribution(charge, X, Y)):
+                    for _ in range(count):
+                        total += part
+            self.updates += 1
+
+        self.charges = charges
+        Ex, Ey, V = (total.copy() for total in self.totals)
+        return Ex, Ey, np.hypot(Ex, Ey), V
+
+
+# Функция для запроса к хранилищу результатов: (модель, параметры, разрешение)
+# итогового этапа построения поля
+def field_request(charges, solver, theta, adaptive, field_lines):
+    params = {"charges": charges_to_array(charges), "solver": solver, "theta": theta if solver == "tree" else None,
+              "field_lines": field_lines}
+    resolution = {"grid": FIELD_GRID, "adaptive_level": FIELD_ADAPTIVE_LEVELS[-1] if adaptive else None}
+    return "electrostatic_field", params, resolution
+
+
+# Функция для записи итогового этапа в хранилище: словари адаптивной сетки и
+# силовых линий разворачиваются в отдельные массивы "mesh.x", "lines.points" и т. п.
+def pack_field(result):
+    record = {name: result[name] for name in ("X", "Y", "Ex", "Ey", "E", "V", "error")}
+    for part in ("mesh", "lines"):
+        record[part] = result[part] is not None
+        for name, value in (result[part] or {}).items():
+            record[f"{part}.{name}"] = value
+    return record
+
+
+# Функция для итогового этапа из записи хранилища (обратная pack_field)
+def unpack_field(charges, record):
+    result = {name: record[name] for name in ("X", "Y", "Ex", "Ey", "E", "V", "error")}
+    result.update(charges=charges, final=True, stage="из хранилища")
+    for part in ("mesh", "lines"):
+        prefix = part + "."
+        result[part] = {name[len(prefix):]: value for name, value in record.items()
+                        if name.startswith(prefix)} if record[part] else None
+    return result
+
 
 class ElectrostaticFieldApp:
     def __init__(self, master):
@@ -19,94 +899,211 @@ class ElectrostaticFieldApp:
         self.entry_charges.insert(0, "-1,0,1e-9; 1,0,-1e-9")  # Значения по умолчанию
         self.entry_charges.pack(pady=5)
 
+        # Выбор решателя и угла раскрытия дерева
+        self.frame_solver = tk.Frame(master)
+        self.frame_solver.pack(pady=5)
+        tk.Label(self.frame_solver, text="Решатель:").grid(row=0, column=0)
+        self.solver_var = tk.StringVar(value="Прямая сумма")
+        self.solver_menu = tk.OptionMenu(self.frame_solver, self.solver_var, "Прямая сумма", "Дерево (Barnes–Hut)")
+        self.solver_menu.grid(row=0, column=1)
+        tk.Label(self.frame_solver, text="θ:").grid(row=0, column=2)
+        self.entry_theta = tk.Entry(self.frame_solver, width=6)
+        self.entry_theta.insert(0, str(TREE_THETA))
+        self.entry_theta.grid(row=0, column=3)
+        self.adaptive_var = tk.BooleanVar(value=False)
+        self.check_adaptive = tk.Checkbutton(self.frame_solver, text="Адаптивная сетка", variable=self.adaptive_var)
+        self.check_adaptive.grid(row=0, column=4)
+        self.lines_var = tk.BooleanVar(value=False)
+        self.check_lines = tk.Checkbutton(self.frame_solver, text="Силовые линии", variable=self.lines_var)
+        self.check_lines.grid(row=0, column=5)
+
         # Кнопка запуска
         self.button = tk.Button(master, text="Построить поле", command=self.run_simulation)
         self.button.pack(pady=10)
 
-        # Поле для графика
-        self.figure, self.ax = plt.subplots(figsize=(6, 5))
-        self.canvas = FigureCanvasTkAgg(self.figure, master)
-        self.canvas.get_tk_widget().pack(pady=5)
+        # Поле для вывода погрешности решателя
+        self.label_status = tk.Label(master, text="")
+        self.label_status.pack()
+
+        # Поле для графика: фигура и оформление создаются один раз,
+        # при перестроении меняются только данные художников
+        self.panel = FigurePanel(master, figsize=(6, 5), pady=5)
+        self.figure = self.panel.figure
+        self.canvas = self.panel.canvas
+        self.ax = self.figure.add_subplot(111)
+        self.ax.set_title("Электростатическое поле точечных зарядов")
+        self.ax.set_xlabel("X (м)")
+        self.ax.set_ylabel("Y (м)")
+        self.ax.axhline(0, color='black', linewidth=0.5)
+        self.ax.axvline(0, color='black', linewidth=0.5)
+        self.ax.grid()
+        self.ax.set_xlim(-2.2, 2.2)
+        self.ax.set_ylim(-2.2, 2.2)
+
+        # Кэш вкладов зарядов для быстрого перестроения после правок
+        self.field_cache = FieldCache()
+
+        # Хранилище итоговых результатов на диске (None - не сохранять)
+        self.result_store = default_store()
+
+        # Фоновый поток расчета: новое построение отменяет незавершенное
+        self.worker = BackgroundWorker(master)
+
+        # Строка состояния с замером этапов (если он включен)
+        profile_status_bar(master)
 
     def run_simulation(self):
+        profiler.start_run("Построение поля")
         try:
             # Чтение и обработка данных из ввода
-            charges_input = self.entry_charges.get()
-            charges = []
-            for charge_str in charges_input.split(";"):
-                x, y, q = map(float, charge_str.split(","))
-                charges.append((x, y, q))
+            with profiler.stage("разбор зарядов"):
+                charges_input = self.entry_charges.get()
+                charges = []
+                for charge_str in charges_input.split(";"):
+                    x, y, q = map(float, charge_str.split(","))
+                    charges.append((x, y, q))
+                theta = float(self.entry_theta.get())
         except ValueError:
             messagebox.showerror("Ошибка", "Введите корректные данные: x,y,q; x,y,q ...")
             return
 
-        # Построение электростатического поля
-        self.plot_field(charges)
+        solver = "tree" if self.solver_var.get().startswith("Дерево") else "direct"
 
-    def plot_field(self, charges):
-        # Константы
-        k = 8.99e9  # Константа Кулона (Н·м²/Кл²)
+        # Построение электростатического поля в фоновом потоке: сначала на
+        # грубой сетке, затем график уточняется на месте
+        adaptive = self.adaptive_var.get()
+        field_lines = self.lines_var.get()
+        self.label_status.config(text="Расчет...")
+        self.worker.submit(lambda cancelled: self.field_stages(charges, solver, theta, adaptive, field_lines,
+                                                               cancelled),
+                           self.draw_field, lambda error: messagebox.showerror("Ошибка", str(error)))
 
-        # Сетка точек
-        x = np.linspace(-2, 2, 50)
-        y = np.linspace(-2, 2, 50)
-        X, Y = np.meshgrid(x, y)
+    # Функция для расчета поля от грубой сетки к подробной (в фоновом потоке)
+    # Равномерная сетка уточняется от FIELD_COARSE_POINTS до FIELD_POINTS точек
+    # по оси (кэш вкладов зарядов - только для итоговой сетки, чтобы
+    # промежуточные сетки его не вытесняли), адаптивная - числом уровней
+    # деления. Погрешность дерева и силовые линии считаются на последнем этапе.
+    # Итоговый этап сохраняется в хранилище, и при повторном запросе сразу
+    # выдается сохраненный без промежуточных этапов. Флаг отмены cancelled
+    # передается в долгие расчеты внутри этапов.
+    def field_stages(self, charges, solver="direct", theta=TREE_THETA, adaptive=False, field_lines=False,
+                     cancelled=None):
+        request = field_request(charges, solver, theta, adaptive, field_lines)
+        if self.result_store is not None:
+            record = self.result_store.load(*request)
+            if record is not None:
+                yield unpack_field(charges, record)
+                return
 
-        # Инициализация векторов поля
-        Ex = np.zeros(X.shape)
-        Ey = np.zeros(Y.shape)
+        if adaptive:
+            stages = [("adaptive", level) for level in FIELD_ADAPTIVE_LEVELS]
+        else:
+            stages = refinement_specs(FIELD_GRID, coarse=FIELD_COARSE_POINTS)
+        for i, stage in enumerate(stages):
+            final = i == len(stages) - 1
+            result = {"charges": charges, "mesh": None, "error": None, "lines": None, "final": final}
+            if adaptive:
+                # Неравномерная сетка, сгущающаяся у зарядов
+                with profiler.stage("поле", levels=stage[1]):
+                    mesh = adaptive_field(charges, bounds=FIELD_GRID[:4], max_level=stage[1], solver=solver,
+                                          theta=theta, cancelled=cancelled)
+                result["mesh"] = mesh
+                X, Y = mesh["x"], mesh["y"]
+                Ex, Ey, E, V = mesh["Ex"], mesh["Ey"], mesh["E"], mesh["V"]
+                result["stage"] = f"уровней деления: {stage[1]}"
+            else:
+                # Сетка точек
+                X, Y = np.meshgrid(np.linspace(*stage[:2], stage[4]), np.linspace(*stage[2:4], stage[5]))
+
+                # Вычисление электростатического поля и потенциала: прямая сумма
+                # обновляется инкрементально через кэш вкладов зарядов
+                with profiler.stage("поле", grid=f"{stage[4]}x{stage[5]}"):
+                    if solver == "direct" and final:
+                        Ex, Ey, E, V = self.field_cache.update(charges, X, Y)
+                    else:
+                        Ex, Ey, E, V = compute_field(charges, X, Y, solver=solver, theta=theta,
+                                                     cancelled=cancelled)
+                result["stage"] = f"сетка {stage[4]}×{stage[5]}"
+            result.update(X=X, Y=Y, Ex=Ex, Ey=Ey, E=E, V=V)
 
-        # Вычисление электростатического поля
-        for cx, cy, q in charges:
-            dx = X - cx
-            dy = Y - cy
-            r_squared = dx**2 + dy**2
-            r = np.sqrt(r_squared)
+            if final:
+                # Погрешность дерева относительно прямой суммы
+                if solver == "tree":
+                    with profiler.stage("погрешность дерева"):
+                        result["error"] = field_error(charges, X, Y, (Ex, Ey, E, V))
+                # Силовые линии
+                if field_lines:
+                    with profiler.stage("силовые линии"):
+                        result["lines"] = trace_field_lines(charges, solver=solver, theta=theta,
+                                                            cancelled=cancelled)
+                if self.result_store is not None:
+                    with profiler.stage("сохранение"):
+                        self.result_store.save(*request, pack_field(result))
+            yield result
 
-            # Избегаем деления на ноль
-            r_squared[r_squared == 0] = np.inf
-            r[r == 0] = np.inf
+    # Функция для отображения очередного этапа расчета (в главном потоке)
+    def draw_field(self, result):
+        X, Y, Ex, Ey, E, V = (result[name] for name in ("X", "Y", "Ex", "Ey", "E", "V"))
+        mesh = result["mesh"]
 
-            Ex += k * q * dx / r_squared
-            Ey += k * q * dy / r_squared
+        if not result["final"]:
+            self.label_status.config(text=f"Предварительно: {result['stage']}, уточняется...")
+        elif result["error"] is not None:
+            error = result["error"]
+            self.label_status.config(text=f"Погрешность дерева: V {error['V_l2']:.2e}, E {error['E_l2']:.2e}")
+        else:
+            self.label_status.config(text="")
 
         # Нормализация для визуализации
-        E = np.sqrt(Ex**2 + Ey**2)
-        Ex /= E
-        Ey /= E
+        with profiler.stage("нормировка"):
+            E_safe = np.where(E > 0, E, 1.0)
+            Ex = Ex / E_safe
+            Ey = Ey / E_safe
 
-        # Очистка предыдущего графика
-        self.ax.clear()
+        # Построение векторного поля (при той же сетке стрелки обновляются на месте)
+        if mesh is not None:
+            # Стрелки в центрах листовых ячеек, длина пропорциональна размеру ячейки
+            c = mesh["centers"]
+            length = 0.8 * mesh["size"]
+            self.panel.quiver(self.ax, "E", X[c], Y[c], Ex[c] * length, Ey[c] * length, E[c], cmap='viridis',
+                              angles='xy', scale_units='xy', scale=1, pivot='middle')
+        else:
+            # Длина стрелок обратно пропорциональна числу точек по оси
+            scale = 20 * FIELD_GRID[4] / X.shape[1]
+            self.panel.quiver(self.ax, "E", X, Y, Ex, Ey, E, cmap='viridis', scale=scale, pivot='middle')
 
-        # Построение векторного поля
-        self.ax.quiver(X, Y, Ex, Ey, E, cmap='viridis', scale=20, pivot='middle')
+        # Силовые линии
+        if result["lines"] is not None:
+            lines = result["lines"]
+            segments = np.split(lines["points"], lines["start"][1:])
+            self.panel.lines(self.ax, "field_lines", segments, colors='black', linewidths=0.8, alpha=0.8)
+        else:
+            self.panel.hide("field_lines")
 
         # Рисуем заряды
-        for cx, cy, q in charges:
-            if q > 0:
-                self.ax.plot(cx, cy, 'ro', markersize=10, label=f'+{q*1e9:.1f} нКл')
-            else:
-                self.ax.plot(cx, cy, 'bo', markersize=10, label=f'{q*1e9:.1f} нКл')
-
-        # Эквипотенциальные линии
-        V = np.zeros(X.shape)
-        for cx, cy, q in charges:
-            r = np.sqrt((X - cx)**2 + (Y - cy)**2)
-            r[r == 0] = np.inf
-            V += k * q / r
+        q = charges_to_array(result["charges"])
+        positive = q[q[:, 2] > 0]
+        negative = q[q[:, 2] <= 0]
+        self.panel.line(self.ax, "positive", positive[:, 0], positive[:, 1], 'ro', markersize=10)
+        self.panel.line(self.ax, "negative", negative[:, 0], negative[:, 1], 'bo', markersize=10)
 
-        self.ax.contour(X, Y, V, levels=20, cmap='cool', alpha=0.7)
-
-        # Настройки графика
-        self.ax.set_title("Электростатическое поле точечных зарядов")
-        self.ax.set_xlabel("X (м)")
-        self.ax.set_ylabel("Y (м)")
-        self.ax.axhline(0, color='black', linewidth=0.5)
-        self.ax.axvline(0, color='black', linewidth=0.5)
-        self.ax.grid()
+        # Эквипотенциальные линии (контуры заменяются)
+        if mesh is not None:
+            # У зарядов V почти бесконечен, поэтому уровни берутся по начальной сетке
+            lo, hi = mesh["V_range"]
+            levels = np.linspace(lo, hi, 20) if hi > lo else 20
+            self.panel.tricontour(self.ax, "V", X, Y, V, levels=levels, cmap='cool', alpha=0.7)
+        else:
+            self.panel.contour(self.ax, "V", X, Y, V, levels=20, cmap='cool', alpha=0.7)
 
         # Обновление графика
-        self.canvas.draw()
+        self.panel.draw()
+
+    # Функция для синхронного построения поля (сразу итоговый этап)
+    def plot_field(self, charges, solver="direct", theta=TREE_THETA, adaptive=False, field_lines=False):
+        for result in self.field_stages(charges, solver, theta, adaptive, field_lines):
+            pass
+        self.draw_field(result)
 
 
 if __name__ == "__main__":
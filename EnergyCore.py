@@ -0,0 +1,477 @@
+import numpy as np
+
+from BackgroundWorker import check_cancelled
+from Numerics import run_compiled
+
+
+# Функция для численного решения ОДУ методом Рунге-Кутты 4-го порядка
+# f(t, y, dydt, *args) записывает производные в dydt, не создавая новых
+# массивов. Буферы стадий выделяются один раз на весь расчет. backend:
+# "numpy", "numba" или "auto" (numba, если установлен и f компилируется).
+# y0 формы (n_state,) - одна система, (n_systems, n_state) - ансамбль:
+# каждая стадия тогда продвигает все системы одной векторной операцией,
+# а результат имеет форму (len(t), n_systems, n_state).
+def runge_kutta_4th_order(f, y0, t, args=(), backend="auto"):
+    y0 = np.asarray(y0, dtype=float)
+    n = len(t)
+    y = np.zeros((n,) + y0.shape)
+    y[0] = y0
+    k1, k2, k3, k4, tmp = (np.empty(y0.shape) for _ in range(5))
+
+    if backend not in ("auto", "numpy", "numba"):
+        raise ValueError(f"Неизвестный бэкенд: {backend}")
+    if backend == "numba" and y0.ndim != 1:
+        raise ValueError("Бэкенд numba поддерживает только одну систему")
+    if backend != "numpy" and y0.ndim == 1:
+        if run_compiled(_rk4_loop, f, backend, y, np.asarray(t, dtype=float), tuple(args), k1, k2, k3, k4, tmp):
+            return y
+
+    dt = t[1] - t[0]
+    for i in range(1, n):
+        y_prev = y[i - 1]
+        f(t[i - 1], y_prev, k1, *args)
+        np.multiply(k1, dt / 2, out=tmp)
+        tmp += y_prev
+        f(t[i - 1] + dt / 2, tmp, k2, *args)
+        np.multiply(k2, dt / 2, out=tmp)
+        tmp += y_prev
+        f(t[i - 1] + dt / 2, tmp, k3, *args)
+        np.multiply(k3, dt, out=tmp)
+        tmp += y_prev
+        f(t[i - 1] + dt, tmp, k4, *args)
+
+        np.add(k2, k3, out=tmp)
+        tmp *= 2
+        tmp += k1
+        tmp += k4
+        tmp *= dt / 6
+        np.add(y_prev, tmp, out=y[i])
+
+    return y
+
+
+# Цикл РК4 поэлементно: в таком виде он компилируется numba целиком
+def _rk4_loop(f, y, t, args, k1, k2, k3, k4, tmp):
+    dt = t[1] - t[0]
+    dim = y.shape[1]
+    for i in range(1, len(t)):
+        f(t[i - 1], y[i - 1], k1, *args)
+        for j in range(dim):
+            tmp[j] = y[i - 1, j] + dt / 2 * k1[j]
+        f(t[i - 1] + dt / 2, tmp, k2, *args)
+        for j in range(dim):
+            tmp[j] = y[i - 1, j] + dt / 2 * k2[j]
+        f(t[i - 1] + dt / 2, tmp, k3, *args)
+        for j in range(dim):
+            tmp[j] = y[i - 1, j] + dt * k3[j]
+        f(t[i - 1] + dt, tmp, k4, *args)
+        for j in range(dim):
+            y[i, j] = y[i - 1, j] + dt / 6 * (k1[j] + 2 * k2[j] + 2 * k3[j] + k4[j])
+
+
+# Коэффициенты метода Дормана–Принса 5(4)
+DP_C = np.array([0, 1 / 5, 3 / 10, 4 / 5, 8 / 9, 1, 1])
+DP_A = np.array([
+    [0, 0, 0, 0, 0, 0],
+    [1 / 5, 0, 0, 0, 0, 0],
+    [3 / 40, 9 / 40, 0, 0, 0, 0],
+    [44 / 45, -56 / 15, 32 / 9, 0, 0, 0],
+    [19372 / 6561, -25360 / 2187, 64448 / 6561, -212 / 729, 0, 0],
+    [9017 / 3168, -355 / 33, 46732 / 5247, 49 / 176, -5103 / 18656, 0],
+    [35 / 384, 0, 500 / 1113, 125 / 192, -2187 / 6784, 11 / 84],
+])
+DP_B = np.array([35 / 384, 0, 500 / 1113, 125 / 192, -2187 / 6784, 11 / 84, 0])
+# Разность весов решений 5-го и 4-го порядка (оценка ошибки)
+DP_E = np.array([-71 / 57600, 0, 71 / 16695, -71 / 1920, 17253 / 339200, -22 / 525, 1 / 40])
+# Плотный вывод: y(t + θh) = y + h Σ_i K_i Σ_j P_ij θ^(j+1)
+DP_P = np.array([
+    [1, -8048581381 / 2820520608, 8663915743 / 2820520608, -12715105075 / 11282082432],
+    [0, 0, 0, 0],
+    [0, 131558114200 / 32700410799, -68118460800 / 10900136933, 87487479700 / 32700410799],
+    [0, -1754552775 / 470086768, 14199869525 / 1410260304, -10690763975 / 1880347072],
+    [0, 127303824393 / 49829197408, -318862633887 / 49829197408, 701980252875 / 199316789632],
+    [0, -282668133 / 205662961, 2019193451 / 616988883, -1453857185 / 822651844],
+    [0, 40617522 / 29380423, -110615467 / 29380423, 69997945 / 29380423],
+])
+
+
+# Генератор принятых шагов метода Дормана–Принса 5(4) с адаптивным шагом
+# Шаг подбирается так, чтобы оценка локальной ошибки не превышала
+# atol + rtol * |y|. Выдает кортежи (t, h, y, K) - начало и длину шага,
+# решение в его начале и стадии K (для плотного вывода, действительны до
+# следующего шага). Последний шаг обрезается по t_end; без t_end расчет
+# продолжается бесконечно с сохранением подобранного шага. stats
+# накапливает число принятых и отброшенных шагов и вычислений f.
+def dormand_prince_steps(f, y0, t0, args=(), rtol=1e-6, atol=1e-9, h0=None, t_end=None, stats=None):
+    if stats is None:
+        stats = {"steps": 0, "rejected": 0, "nfev": 0}
+    t = t0
+    y = np.array(y0, dtype=float)
+    K = np.empty((7,) + y.shape)
+    h_limit = np.inf if t_end is None else t_end - t
+
+    def rhs(t_stage, y_stage, out):
+        f(t_stage, y_stage, out, *args)
+        stats["nfev"] += 1
+
+    def error_norm(e, scale):
+        return np.sqrt(np.mean((e / scale) ** 2))
+
+    rhs(t, y, K[0])
+
+    # Начальный шаг по оценке Хайрера
+    if h0 is None:
+        scale = atol + rtol * np.abs(y)
+        d0, d1 = error_norm(y, scale), error_norm(K[0], scale)
+        h0 = 1e-6 if d0 < 1e-5 or d1 < 1e-5 else 0.01 * d0 / d1
+        h0 = min(h0, h_limit)
+        rhs(t + h0, y + h0 * K[0], K[1])
+        d2 = error_norm(K[1] - K[0], scale) / h0
+        h1 = max(1e-6, h0 * 1e-3) if max(d1, d2) <= 1e-15 else (0.01 / max(d1, d2)) ** (1 / 5)
+        h0 = min(100 * h0, h1)
+    h = h0
+
+    while True:
+        if t_end is not None:
+            h = min(h, t_end - t)
+
+        for i in range(1, 7):
+            y_stage = y + h * np.tensordot(DP_A[i, :i], K[:i], axes=1)
+            rhs(t + DP_C[i] * h, y_stage, K[i])
+        y_new = y_stage
+
+        scale = atol + rtol * np.maximum(np.abs(y), np.abs(y_new))
+        err = error_norm(h * np.tensordot(DP_E, K, axes=1), scale)
+        if err > 1:
+            stats["rejected"] += 1
+            h *= max(0.2, 0.9 * err ** (-1 / 5))
+            continue
+
+        stats["steps"] += 1
+        yield t, h, y, K
+        t, y = t + h, y_new
+        K[0] = K[6]
+        h *= min(10.0, 0.9 * err ** (-1 / 5)) if err > 0 else 10.0
+
+
+# Функция для плотного вывода 4-го порядка в моментах t_points внутри шага (t, h, y, K)
+def dense_output(t, h, y, K, t_points):
+    theta = (np.asarray(t_points) - t) / h
+    powers = theta[:, None] ** np.arange(1, 5)
+    Q = np.tensordot(DP_P.T, K, axes=1)
+    return y + h * np.tensordot(powers, Q, axes=1)
+
+
+# Функция для решения ОДУ методом Дормана–Принса 5(4) с адаптивным шагом
+# Решение в точках t_eval (по возрастанию, t_eval[0] - начальный момент)
+# получается плотным выводом 4-го порядка, а не шагами (см.
+# dormand_prince_steps). f(t, y, dydt, *args) - правая часть в том же виде,
+# что для РК4, y0 может описывать и ансамбль систем (шаг тогда общий для всех).
+# Возвращает решение формы (len(t_eval),) + y0.shape и статистику: число
+# принятых (steps) и отброшенных (rejected) шагов и вычислений f (nfev).
+def dormand_prince(f, y0, t_eval, args=(), rtol=1e-6, atol=1e-9, h0=None, max_steps=10 ** 6):
+    y0 = np.asarray(y0, dtype=float)
+    t_eval = np.asarray(t_eval, dtype=float)
+    y_out = np.zeros((len(t_eval),) + y0.shape)
+    y_out[0] = y0
+    stats = {"steps": 0, "rejected": 0, "nfev": 0}
+    if len(t_eval) < 2:
+        return y_out, stats
+
+    t_end = t_eval[-1]
+    next_out = 1
+    for t, h, y, K in dormand_prince_steps(f, y0, t_eval[0], args, rtol, atol, h0, t_end, stats):
+        # Плотный вывод для точек t_eval внутри принятого шага
+        t_new = t + h
+        last = np.searchsorted(t_eval, t_new, side="right") if t_new < t_end else len(t_eval)
+        if last > next_out:
+            y_out[next_out:last] = dense_output(t, h, y, K, t_eval[next_out:last])
+            next_out = last
+        if next_out == len(t_eval):
+            break
+        if stats["steps"] + stats["rejected"] >= max_steps:
+            raise RuntimeError("Превышено максимальное число шагов")
+
+    return y_out, stats
+
+
+# Веса композиций симметричного шага Верле: один шаг - метод 2-го порядка,
+# три шага с весами Йошиды - метод 4-го порядка
+_YOSHIDA_W1 = 1 / (2 - 2 ** (1 / 3))
+SYMPLECTIC_WEIGHTS = {
+    "verlet": np.array([1.0]),
+    "yoshida4": np.array([_YOSHIDA_W1, 1 - 2 * _YOSHIDA_W1, _YOSHIDA_W1]),
+}
+
+
+# Функция для симплектического интегрирования системы x' = v,
+# v' = a(t, x) - damping * v: скоростной Верле (leapfrog) или композиция
+# Йошиды 4-го порядка. acceleration(t, x, *args) - консервативная часть
+# ускорения. Затухание учитывается точно: множители exp(-damping * h / 2)
+# обрамляют каждый шаг Верле (расщепление Стрэнга), поэтому без затухания
+# метод симплектический и не дает векового дрейфа энергии.
+# y0 = (x0, v0) или массив (n_systems, 2); результат как у runge_kutta_4th_order.
+def symplectic_integrate(acceleration, y0, t, args=(), damping=0.0, method="verlet", backend="auto"):
+    if method not in SYMPLECTIC_WEIGHTS:
+        raise ValueError(f"Неизвестный симплектический метод: {method}")
+    if backend not in ("auto", "numpy", "numba"):
+        raise ValueError(f"Неизвестный бэкенд: {backend}")
+    weights = SYMPLECTIC_WEIGHTS[method]
+    y0 = np.asarray(y0, dtype=float)
+    t = np.asarray(t, dtype=float)
+    y = np.zeros((len(t),) + y0.shape)
+    y[0] = y0
+
+    if backend != "numpy" and y0.ndim == 1 and np.ndim(damping) == 0:
+        if run_compiled(_symplectic_loop, acceleration, backend, y, t, tuple(args), float(damping), weights):
+            return y
+
+    x, v = y0.T
+    for i in range(1, len(t)):
+        h = t[i] - t[i - 1]
+        tau = t[i - 1]
+        for w in weights:
+            hw = h * w
+            decay = np.exp(-damping * hw / 2)
+            v = v * decay + hw / 2 * acceleration(tau, x, *args)
+            x = x + hw * v
+            tau = tau + hw
+            v = (v + hw / 2 * acceleration(tau, x, *args)) * decay
+        state = y[i].T
+        state[0] = x
+        state[1] = v
+
+    return y
+
+
+# Цикл симплектического метода для одной системы (компилируется numba)
+def _symplectic_loop(acceleration, y, t, args, damping, weights):
+    x = y[0, 0]
+    v = y[0, 1]
+    for i in range(1, len(t)):
+        h = t[i] - t[i - 1]
+        tau = t[i - 1]
+        for w in weights:
+            hw = h * w
+            decay = np.exp(-damping * hw / 2)
+            v = v * decay + hw / 2 * acceleration(tau, x, *args)
+            x = x + hw * v
+            tau = tau + hw
+            v = (v + hw / 2 * acceleration(tau, x, *args)) * decay
+        y[i, 0] = x
+        y[i, 1] = v
+
+
+# Функция для вычисления производных (записывает их в dydt)
+# y[..., 0] - смещение, y[..., 1] - скорость; m, k, b - числа или массивы
+# по системам ансамбля
+def spring_oscillation(t, y, dydt, m, k, b):
+    x, v = y.T
+    derivatives = dydt.T
+    derivatives[0] = v
+    derivatives[1] = -k / m * x - b / m * v
+
+
+# Функция для консервативной части ускорения (для симплектических методов,
+# затухание b / m передается им отдельно)
+def spring_acceleration(t, x, m, k, b):
+    return -k / m * x
+
+
+# Функция для точного решения уравнения m x'' + b x' + k x = 0
+# Годится для слабого, критического и сильного затухания: при
+# γ = b / 2m и ω0² = k / m  x = x0 C + (v0 + γ x0) S, v = v0 C - (ω0² x0 + γ v0) S,
+# где C, S = e^(-γt) (cos, sin/ω) при γ < ω0, e^(-γt) (1, t) при γ = ω0
+# и e^(-γt) (ch, sh/s) при γ > ω0.
+def spring_analytic(t, m, k, b, x0=1.0, v0=0.0):
+    t = np.asarray(t, dtype=float)
+    gamma = b / (2 * m)
+    omega0_sq = k / m
+    disc = omega0_sq - gamma ** 2
+    if disc > 0:
+        omega = np.sqrt(disc)
+        decay = np.exp(-gamma * t)
+        C = decay * np.cos(omega * t)
+        S = decay * np.sin(omega * t) / omega
+    elif disc < 0:
+        # Экспоненты собраны заранее, чтобы ch и sh не переполнялись
+        s = np.sqrt(-disc)
+        slow = np.exp((s - gamma) * t)
+        fast = np.exp(-(s + gamma) * t)
+        C = 0.5 * (slow + fast)
+        S = 0.5 * (slow - fast) / s
+    else:
+        C = np.exp(-gamma * t)
+        S = C * t
+    x = x0 * C + (v0 + gamma * x0) * S
+    v = v0 * C - (omega0_sq * x0 + gamma * v0) * S
+    return x, v
+
+
+# Функция для расчета ансамбля осцилляторов с разными параметрами
+# m, k, b, x0, v0 - числа или массивы, приводимые к общей форме (n_systems,).
+# Возвращает решение формы (len(t), n_systems, 2) и массивы параметров.
+def spring_ensemble(m, k, b, t, x0=1.0, v0=0.0, backend="auto"):
+    m, k, b, x0, v0 = (np.ravel(a).astype(float) for a in np.broadcast_arrays(m, k, b, x0, v0))
+    y0 = np.stack([x0, v0], axis=1)
+    y = runge_kutta_4th_order(spring_oscillation, y0, t, args=(m, k, b), backend=backend)
+    return y, m, k, b
+
+
+# Функция для расчета энергий
+# Для ансамбля y формы (n_t, n_systems, 2) и массивов m, k энергии
+# возвращаются массивами (n_t, n_systems)
+def calculate_energies(m, k, y):
+    x = y[..., 0]
+    v = y[..., 1]
+    kinetic_energy = 0.5 * m * v ** 2
+    potential_energy = 0.5 * k * x ** 2
+    total_energy = kinetic_energy + potential_energy
+    return kinetic_energy, potential_energy, total_energy
+
+
+# Функция для длительного расчета (например, 10^7 шагов) по частям
+# В памяти хранится только текущая часть траектории и прореженная запись
+# энергий (около n_record точек). Дрейф полной энергии - отклонение от
+# точного значения по spring_analytic, отнесенное к начальной энергии.
+# method: "rk4", "verlet" или "yoshida4".
+def long_horizon_drift(m, k, b, dt, n_steps=10 ** 7, method="verlet", x0=1.0, v0=0.0, chunk=10 ** 5,
+                       n_record=2000):
+    for result in long_horizon_progress(m, k, b, dt, n_steps, method, x0, v0, chunk, n_record, reports=1):
+        pass
+    return result
+
+
+# Генератор длительного расчета с промежуточными результатами
+# Выдает reports раз (примерно через равные числа шагов) результат в том же
+# виде, что long_horizon_drift, но для уже рассчитанной части горизонта;
+# steps - число сделанных шагов. Последний результат - полный. Флаг отмены
+# cancelled (см. check_cancelled) проверяется перед каждой частью из chunk шагов.
+def long_horizon_progress(m, k, b, dt, n_steps=10 ** 7, method="verlet", x0=1.0, v0=0.0, chunk=10 ** 5,
+                          n_record=2000, reports=10, cancelled=None):
+    if method == "rk4":
+        def integrate(y, t):
+            return runge_kutta_4th_order(spring_oscillation, y, t, args=(m, k, b))
+    else:
+        def integrate(y, t):
+            return symplectic_integrate(spring_acceleration, y, t, args=(m, k, b), damping=b / m, method=method)
+
+    E0 = 0.5 * m * v0 ** 2 + 0.5 * k * x0 ** 2
+    E_scale = E0 if E0 > 0 else 1.0
+    record_every = max(1, n_steps // n_record)
+    record = {"t": [], "kinetic_energy": [], "potential_energy": [], "total_energy": [], "drift": []}
+    max_drift = 0.0
+    drift = np.zeros(1)
+
+    y = np.array([x0, v0], dtype=float)
+    step = 0
+    report_every = max(1, -(-n_steps // max(reports, 1)))
+    next_report = report_every
+    while step < n_steps:
+        check_cancelled(cancelled)
+        n = min(chunk, n_steps - step)
+        t = (step + np.arange(n + 1)) * dt
+        y_chunk = integrate(y, t)
+
+        ke, pe, E = calculate_energies(m, k, y_chunk[1:])
+        x_exact, v_exact = spring_analytic(t[1:], m, k, b, x0, v0)
+        E_exact = 0.5 * m * v_exact ** 2 + 0.5 * k * x_exact ** 2
+        drift = (E - E_exact) / E_scale
+        max_drift = max(max_drift, np.abs(drift).max())
+
+        keep = (step + 1 + np.arange(n)) % record_every == 0
+        for name, values in (("t", t[1:]), ("kinetic_energy", ke), ("potential_energy", pe),
+                             ("total_energy", E), ("drift", drift)):
+            record[name].append(values[keep])
+
+        y = y_chunk[-1]
+        step += n
+
+        if step >= next_report or step == n_steps:
+            next_report += report_every
+            result = {name: np.concatenate(values) for name, values in record.items()}
+            result["max_drift"] = max_drift
+            result["final_drift"] = drift[-1]
+            result["steps"] = step
+            yield result
+
+
+# Функция для расчета траектории пружинного маятника выбранным методом
+# method: "analytic" (точное решение, без шагов), "rk4", "dopri" (допуск tol),
+# "verlet" или "yoshida4". Возвращает решение формы (len(t), 2) и
+# статистику шагов и вычислений правой части.
+def integrate_spring(method, m, k, b, t, x0=1.0, v0=0.0, tol=1e-6):
+    y0 = [x0, v0]
+    n_steps = len(t) - 1
+    if method == "analytic":
+        y = np.stack(spring_analytic(t, m, k, b, x0, v0), axis=-1)
+        return y, {"steps": 0, "rejected": 0, "nfev": 0}
+    if method == "dopri":
+        return dormand_prince(spring_oscillation, y0, t, args=(m, k, b), rtol=tol, atol=tol * 1e-3)
+    if method == "rk4":
+        y = runge_kutta_4th_order(spring_oscillation, y0, t, args=(m, k, b))
+        return y, {"steps": n_steps, "rejected": 0, "nfev": 4 * n_steps}
+    if method in SYMPLECTIC_WEIGHTS:
+        y = symplectic_integrate(spring_acceleration, y0, t, args=(m, k, b), damping=b / m, method=method)
+        return y, {"steps": n_steps, "rejected": 0, "nfev": 2 * len(SYMPLECTIC_WEIGHTS[method]) * n_steps}
+    raise ValueError(f"Неизвестный метод: {method}")
+
+
+# Функция для проверки численных методов по точному решению
+# Возвращает для каждого метода максимальные ошибки смещения (x), скорости (v)
+# и полной энергии (energy) на сетке t.
+def check_integrators(m, k, b, t, x0=1.0, v0=0.0, tol=1e-6, methods=("rk4", "dopri", "verlet", "yoshida4")):
+    exact = np.stack(spring_analytic(t, m, k, b, x0, v0), axis=-1)
+    _, _, exact_energy = calculate_energies(m, k, exact)
+    errors = {}
+    for method in methods:
+        y, _ = integrate_spring(method, m, k, b, t, x0, v0, tol)
+        _, _, energy = calculate_energies(m, k, y)
+        errors[method] = {
+            "x": np.abs(y[:, 0] - exact[:, 0]).max(),
+            "v": np.abs(y[:, 1] - exact[:, 1]).max(),
+            "energy": np.abs(energy - exact_energy).max(),
+        }
+    return errors
+
+
+# Генератор потокового интегрирования движения груза
+# Бесконечно выдает кортежи (t, y, stats) порциями по chunk отсчетов с шагом
+# dt: первая порция - начальное состояние, каждая следующая продолжает
+# расчет с последнего состояния предыдущей. stats накапливает число шагов,
+# отброшенных шагов и вычислений правой части с начала расчета. Для "dopri"
+# все порции - одно интегрирование: подобранный шаг и производная
+# переходят из порции в порцию, а отсчеты берутся плотным выводом; на
+# порцию отводится не больше max_steps шагов.
+def integrate_spring_stream(method, m, k, b, dt, chunk=10, x0=1.0, v0=0.0, tol=1e-6, max_steps=10 ** 6):
+    stats = {"steps": 0, "rejected": 0, "nfev": 0}
+    state = (x0, v0)
+    yield np.zeros(1), np.array([[x0, v0]]), dict(stats)
+
+    offsets = np.arange(chunk + 1)
+    start = 0
+    if method == "dopri":
+        steps = dormand_prince_steps(spring_oscillation, state, 0.0, (m, k, b), tol, tol * 1e-3, stats=stats)
+        step = next(steps)
+    while True:
+        # Время считается от целого номера отсчета, чтобы не накапливать ошибку
+        t = (start + offsets) * dt
+        if method == "dopri":
+            y = np.empty((chunk + 1, 2))
+            limit = stats["steps"] + stats["rejected"] + max_steps
+            for i in range(1, chunk + 1):
+                while step[0] + step[1] < t[i]:
+                    if stats["steps"] + stats["rejected"] >= limit:
+                        raise RuntimeError("Превышено максимальное число шагов")
+                    step = next(steps)
+                y[i] = dense_output(*step, t[i:i + 1])[0]
+        else:
+            if method == "analytic":
+                y, chunk_stats = integrate_spring(method, m, k, b, t, x0, v0, tol)
+            else:
+                y, chunk_stats = integrate_spring(method, m, k, b, t, state[0], state[1], tol)
+            for key in stats:
+                stats[key] += chunk_stats[key]
+            state = y[-1]
+        start += chunk
+        yield t[1:], y[1:], dict(stats)
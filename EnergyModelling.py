@@ -1,90 +1,172 @@
 ﻿import tkinter as tk
 from tkinter import ttk
 import numpy as np
-from matplotlib.figure import Figure
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from matplotlib.animation import FuncAnimation
 
+from BackgroundWorker import BackgroundWorker
+from EnergyCore import calculate_energies, check_integrators, integrate_spring_stream, long_horizon_progress
+from PlotRendering import DecimatedLine, RingBuffer, update_ylim
+from Profiling import profile_status_bar, profiler
+from ResultStore import default_store
 
-# Функция для численного решения ОДУ методом Рунге-Кутты 4-го порядка
-def runge_kutta_4th_order(f, y0, t, args=()):
-    n = len(t)
-    y = np.zeros((n, len(y0)))
-    y[0] = y0
-    dt = t[1] - t[0]
 
-    for i in range(1, n):
-        k1 = f(t[i - 1], y[i - 1], *args)
-        k2 = f(t[i - 1] + dt / 2, y[i - 1] + dt / 2 * np.array(k1), *args)
-        k3 = f(t[i - 1] + dt / 2, y[i - 1] + dt / 2 * np.array(k2), *args)
-        k4 = f(t[i - 1] + dt, y[i - 1] + dt * np.array(k3), *args)
-
-        y[i] = y[i - 1] + (dt / 6) * (np.array(k1) + 2 * np.array(k2) + 2 * np.array(k3) + np.array(k4))
+# Функция для сравнения численных методов с точным решением
+def check_methods():
+    try:
+        m = float(entry_mass.get())
+        k = float(entry_k.get())
+        b = float(entry_b.get())
+        tol = float(entry_tol.get())
+    except ValueError:
+        result_label.config(text="Ошибка: введите корректные значения параметров")
+        return
 
-    return y
+    t_eval = np.linspace(0, 20, 500)
+    try:
+        errors = check_integrators(m, k, b, t_eval, tol=tol)
+    except RuntimeError as error:
+        result_label.config(text=f"Ошибка: {error}")
+        return
+    names = {method: name for name, method in METHODS.items()}
+    result_label.config(text="Макс. ошибка x: " + ", ".join(
+        f"{names[method]} {error['x']:.1e}" for method, error in errors.items()))
 
 
-# Функция для вычисления производных
-def spring_oscillation(t, y, m, k, b):
-    x, v = y
-    dxdt = v
-    dvdt = -k / m * x - b / m * v
-    return [dxdt, dvdt]
+# Методы интегрирования, доступные в интерфейсе
+METHODS = {
+    "Аналитическое решение": "analytic",
+    "Рунге-Кутта 4": "rk4",
+    "Дорманд-Принс 5(4)": "dopri",
+    "Верле (симплектический)": "verlet",
+    "Йошида 4 (симплектический)": "yoshida4",
+}
 
+# Число шагов длительного расчета и число сохраняемых отсчетов энергии
+LONG_HORIZON_STEPS = 10 ** 7
+LONG_HORIZON_RECORD = 10 ** 6
+LONG_HORIZON_REPORTS = 20  # сколько раз по ходу расчета обновляются графики
 
-# Функция для расчета энергий
-def calculate_energies(m, k, y):
-    x = y[:, 0]
-    v = y[:, 1]
-    kinetic_energy = 0.5 * m * v ** 2
-    potential_energy = 0.5 * k * x ** 2
-    total_energy = kinetic_energy + potential_energy
-    return kinetic_energy, potential_energy, total_energy
+# Потоковая анимация: длина окна (отсчетов), отсчетов за кадр и шаг по времени
+STREAM_WINDOW = 500
+STREAM_CHUNK = 5
+STREAM_DT = 20 / (STREAM_WINDOW - 1)
 
 
 # Функция для анимации графиков
+# Каждый кадр берет очередную порцию из генератора, дописывает ее в кольцевые
+# буферы и показывает последние STREAM_WINDOW отсчетов, поэтому память и
+# стоимость кадра не растут со временем моделирования. Если расчет порции
+# не удался, анимация останавливается, ошибка выводится в строке результата,
+# а функция возвращает пустой набор линий.
 def animate(i):
-    if i < len(t_eval):
-        # Обновляем данные для каждого временного шага
-        line_ke.set_data(t_eval[:i], kinetic_energy[:i])
-        line_pe.set_data(t_eval[:i], potential_energy[:i])
-        line_te.set_data(t_eval[:i], total_energy[:i])
-
+    global ani
+    with profiler.stage("расчет"):
+        try:
+            t, y, stats = next(stream)
+        except RuntimeError as error:
+            if ani is not None:
+                ani.event_source.stop()
+                ani = None
+            result_label.config(text=f"Ошибка: {error}")
+            return ()
+        kinetic, potential, total = calculate_energies(stream_params[0], stream_params[1], y)
+    buffer_t.extend(t)
+    buffer_ke.extend(kinetic)
+    buffer_pe.extend(potential)
+    buffer_te.extend(total)
+
+    # Прокручиваем окно по времени
+    t_window = buffer_t.view()
+    t_left = max(t_window[-1] - STREAM_DT * (STREAM_WINDOW - 1), 0.0)
+    for line, buffer in ((line_ke, buffer_ke), (line_pe, buffer_pe), (line_te, buffer_te)):
+        values = buffer.view()
+        line.set_data(t_window, values)
+        line.axes.set_xlim(t_left, t_left + STREAM_DT * (STREAM_WINDOW - 1))
+        update_ylim(line.axes, values)
+
+    result_label.config(text=f"t = {t_window[-1]:.1f} с. Шагов: {stats['steps']} (отброшено {stats['rejected']}), "
+                             f"вычислений правой части: {stats['nfev']}")
     return line_ke, line_pe, line_te
 
 
+# Функция для длительного расчета в фоновом потоке
+# Готовый результат берется из хранилища (файлы открываются без чтения в
+# память), иначе выдаются промежуточные результаты, а полный сохраняется.
+def long_horizon_stages(m, k, b, dt, method, x0, v0, cancelled=None):
+    params = {"m": m, "k": k, "b": b, "method": method, "x0": x0, "v0": v0}
+    resolution = {"dt": dt, "n_steps": LONG_HORIZON_STEPS, "n_record": LONG_HORIZON_RECORD}
+    if result_store is not None:
+        drift = result_store.load("energy_long_horizon", params, resolution)
+        if drift is not None:
+            yield drift
+            return
+    for drift in long_horizon_progress(m, k, b, dt, n_steps=LONG_HORIZON_STEPS, method=method, x0=x0, v0=v0,
+                                       n_record=LONG_HORIZON_RECORD, reports=LONG_HORIZON_REPORTS,
+                                       cancelled=cancelled):
+        if drift["steps"] == LONG_HORIZON_STEPS and result_store is not None:
+            drift = result_store.save("energy_long_horizon", params, resolution, drift)
+        yield drift
+
+
+# Функция для вывода промежуточного результата длительного расчета
+# (вызывается в главном потоке). Графики дополняются только новыми
+# отсчетами, пределы по времени сразу охватывают весь горизонт.
+def show_drift(drift):
+    with profiler.stage("прореживание"):
+        for line, name in zip(decimated_lines, ("kinetic_energy", "potential_energy", "total_energy")):
+            energy = drift[name]
+            line.append(drift["t"][line.n:], energy[line.n:])
+            line.ax.set_ylim(0, energy.max() * 1.1)
+    line_te.figure.canvas.draw_idle()
+    result_label.config(text=f"Шагов: {drift['steps']} из {LONG_HORIZON_STEPS}. Дрейф полной энергии (доля E0): "
+                             f"макс. {drift['max_drift']:.2e}, в конце {drift['final_drift']:.2e}")
+
+
 # Функция для построения графиков
 def plot_energies():
-    global kinetic_energy, potential_energy, total_energy, t_eval, line_ke, line_pe, line_te, ani
+    global stream, stream_params, buffer_t, buffer_ke, buffer_pe, buffer_te, line_ke, line_pe, line_te, ani, \
+        decimated_lines
+
+    profiler.start_run("Построение графиков")
+
+    # matplotlib загружается при первом построении, а не при запуске приложения
+    with profiler.stage("импорт matplotlib"):
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
+        from matplotlib.animation import FuncAnimation
 
     try:
-        m = float(entry_mass.get())
-        k = float(entry_k.get())
-        b = float(entry_b.get())
+        with profiler.stage("разбор параметров"):
+            m = float(entry_mass.get())
+            k = float(entry_k.get())
+            b = float(entry_b.get())
+            tol = float(entry_tol.get())
+            dt = float(entry_dt.get())
     except ValueError:
         result_label.config(text="Ошибка: введите корректные значения параметров")
         return
+    method = METHODS[method_var.get()]
 
     # Начальные условия
     x0 = 1.0
     v0 = 0.0
-    y0 = [x0, v0]
 
-    # Время моделирования
-    t_span = (0, 20)
-    t_eval = np.linspace(t_span[0], t_span[1], 500)
+    # Останавливаем предыдущую анимацию и прежний длительный расчет
+    if ani is not None:
+        ani.event_source.stop()
+        ani = None
+    worker.cancel()
 
-    # Решение ОДУ
-    y_solution = runge_kutta_4th_order(spring_oscillation, y0, t_eval, args=(m, k, b))
-
-    # Вычисление энергий
-    kinetic_energy, potential_energy, total_energy = calculate_energies(m, k, y_solution)
+    long_horizon = long_horizon_var.get()
+    if long_horizon and method in ("analytic", "dopri"):
+        result_label.config(text="Ошибка: длительный расчет доступен для РК4 и симплектических методов")
+        return
 
     # Создаем фигуру и оси
-    fig = Figure(figsize=(8, 6))
-    ax1 = fig.add_subplot(311)
-    ax2 = fig.add_subplot(312)
-    ax3 = fig.add_subplot(313)
+    with profiler.stage("создание фигуры"):
+        fig = Figure(figsize=(8, 6))
+        ax1 = fig.add_subplot(311)
+        ax2 = fig.add_subplot(312)
+        ax3 = fig.add_subplot(313)
 
     # Инициализация линий для анимации
     line_ke, = ax1.plot([], [], label="Кинетическая энергия", color="blue")
@@ -99,24 +181,55 @@ def plot_energies():
     ax3.set_ylabel("Энергия (Дж)")
     ax3.legend()
 
-    # Устанавливаем пределы для осей
-    ax1.set_xlim(t_eval[0], t_eval[-1])
-    ax2.set_xlim(t_eval[0], t_eval[-1])
-    ax3.set_xlim(t_eval[0], t_eval[-1])
-    ax1.set_ylim(0, max(kinetic_energy) * 1.1)
-    ax2.set_ylim(0, max(potential_energy) * 1.1)
-    ax3.set_ylim(0, max(total_energy) * 1.1)
+    if long_horizon:
+        # Результат длительного расчета (до 10^6 отсчетов) рисуется через
+        # огибающую по пикселям, которая пересчитывается при смене вида
+        decimated_lines = []
+        for line in (line_ke, line_pe, line_te):
+            line.axes.set_xlim(0, LONG_HORIZON_STEPS * dt)
+            decimated_lines.append(DecimatedLine(line))
+    else:
+        # Решение ОДУ порциями: по умолчанию точное решение, иначе фиксированный
+        # шаг, адаптивный шаг с заданным допуском или симплектический метод
+        stream = integrate_spring_stream(method, m, k, b, STREAM_DT, STREAM_CHUNK, x0, v0, tol)
+        stream_params = (m, k)
+        buffer_t, buffer_ke, buffer_pe, buffer_te = (RingBuffer(STREAM_WINDOW) for _ in range(4))
+        for ax in (ax1, ax2, ax3):
+            ax.set_ylim(0, 1.0)
 
     # Отображение графика на Tkinter Canvas
     for widget in canvas_frame.winfo_children():
         widget.destroy()
 
     canvas = FigureCanvasTkAgg(fig, master=canvas_frame)
+    profiler.wrap(canvas, "draw", "draw")
     canvas.draw()
     canvas.get_tk_widget().pack(side=tk.TOP, fill=tk.BOTH, expand=True)
 
-    # Запуск анимации
-    ani = FuncAnimation(fig, animate, frames=len(t_eval), interval=20, blit=True)
+    # Панель масштабирования и прокрутки графиков
+    NavigationToolbar2Tk(canvas, canvas_frame)
+
+    if long_horizon:
+        # Длительный расчет по частям идет в фоновом потоке, графики
+        # дополняются по мере готовности, окно при этом не блокируется
+        result_label.config(text=f"Шагов: 0 из {LONG_HORIZON_STEPS}")
+        worker.submit(lambda cancelled: profiler.iterate("длительный расчет", long_horizon_stages(
+            m, k, b, dt, method, x0, v0, cancelled)), show_drift,
+            lambda error: result_label.config(text=f"Ошибка: {error}"))
+    else:
+        # Запуск бесконечной анимации: окно прокручивается, поэтому оси
+        # перерисовываются целиком (blit=False), а кадры не кэшируются
+        if not animate(0):
+            return
+        ani = FuncAnimation(fig, animate, interval=20, blit=False, cache_frame_data=False)
+
+
+# Текущая анимация (останавливается при новом построении)
+ani = None
+decimated_lines = []
+
+# Хранилище результатов длительных расчетов (None - не сохранять)
+result_store = default_store()
 
 
 # Настройка интерфейса tkinter
@@ -124,6 +237,9 @@ root = tk.Tk()
 root.title("Энергетические превращения при колебании груза на пружине")
 root.geometry("800x800")
 
+# Фоновый поток для длительного расчета
+worker = BackgroundWorker(root)
+
 # Ввод массы груза
 ttk.Label(root, text="Масса груза (кг):").pack(pady=5)
 entry_mass = ttk.Entry(root)
@@ -139,10 +255,34 @@ ttk.Label(root, text="Коэффициент сопротивления b (кг/
 entry_b = ttk.Entry(root)
 entry_b.pack()
 
+# Выбор метода интегрирования
+ttk.Label(root, text="Метод интегрирования:").pack(pady=5)
+method_var = tk.StringVar()
+method_menu = ttk.OptionMenu(root, method_var, "Аналитическое решение", *METHODS)
+method_menu.pack()
+
+# Допуск для адаптивного метода
+ttk.Label(root, text="Допуск (для метода Дорманда-Принса):").pack(pady=5)
+entry_tol = ttk.Entry(root)
+entry_tol.insert(0, "1e-6")
+entry_tol.pack()
+
+# Длительный расчет с контролем дрейфа энергии
+long_horizon_var = tk.BooleanVar(value=False)
+ttk.Checkbutton(root, text="Длительный расчет (10^7 шагов)", variable=long_horizon_var).pack(pady=5)
+ttk.Label(root, text="Шаг dt для длительного расчета (с):").pack()
+entry_dt = ttk.Entry(root)
+entry_dt.insert(0, "0.01")
+entry_dt.pack()
+
 # Кнопка для построения графиков
 btn_plot = ttk.Button(root, text="Построить графики", command=plot_energies)
 btn_plot.pack(pady=10)
 
+# Кнопка для проверки численных методов по точному решению
+btn_check = ttk.Button(root, text="Сравнить методы с точным решением", command=check_methods)
+btn_check.pack()
+
 # Поле для вывода результата
 result_label = ttk.Label(root, text="")
 result_label.pack()
@@ -151,5 +291,8 @@ result_label.pack()
 canvas_frame = ttk.Frame(root)
 canvas_frame.pack(fill=tk.BOTH, expand=True)
 
+# Строка состояния с замером этапов (если он включен)
+profile_status_bar(root)
+
 # Запуск приложения
 root.mainloop()
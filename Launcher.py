@@ -0,0 +1,183 @@
+import ast
+import importlib
+import json
+import os
+import runpy
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+# Каталог приложений и журнал времени запуска моделей (одна запись JSON на строку)
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+STARTUP_LOG = os.path.join(APP_DIR, "startup_times.jsonl")
+
+# Модели: название -> скрипт
+MODELS = {
+    "Энергия колебаний груза на пружине": "EnergyModelling.py",
+    "Потенциальное поле": "PotentialFieldModelling.py",
+    "Движение тел в потенциальном поле": "BodyMovementModelling.py",
+    "Мертвая петля": "LoopTrajectory.py",
+    "Электростатическое поле": "ElectrostaticFieldModelling.py",
+}
+
+# Интервал опроса запущенных моделей (мс)
+POLL_MS = 200
+
+
+# Функция для получения модулей, импортируемых скриптом на верхнем уровне
+# (в порядке появления, без повторов)
+def top_level_imports(path):
+    with open(path, encoding="utf-8-sig") as f:
+        tree = ast.parse(f.read(), path)
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.level == 0:
+            names = [node.module]
+        else:
+            continue
+        modules.extend(name for name in names if name not in modules)
+    return modules
+
+
+# Функция для запуска модели в текущем процессе (вызывается в дочернем процессе)
+# Модули верхнего уровня скрипта импортируются по очереди с замером времени
+# (время общих зависимостей относится к первому импортировавшему их модулю),
+# затем скрипт выполняется как __main__. При входе в главный цикл tkinter,
+# когда окно уже построено, в report_path (если задан) записывается отчет JSON.
+def run_model(script, report_path):
+    start = time.perf_counter()
+    path = os.path.join(APP_DIR, script)
+    imports = {}
+    for name in top_level_imports(path):
+        t0 = time.perf_counter()
+        importlib.import_module(name)
+        imports[name] = time.perf_counter() - t0
+    import_seconds = time.perf_counter() - start
+
+    import tkinter as tk
+
+    original_mainloop = tk.Misc.mainloop
+
+    def mainloop(self, n=0):
+        tk.Misc.mainloop = original_mainloop
+        report = {
+            "script": script,
+            "time": time.time(),
+            "imports": imports,
+            "import_seconds": import_seconds,
+            "startup_seconds": time.perf_counter() - start,
+        }
+        if report_path:
+            with open(report_path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(report, f)
+            os.replace(report_path + ".tmp", report_path)
+        original_mainloop(self, n)
+
+    tk.Misc.mainloop = mainloop
+    sys.argv = [path]
+    runpy.run_path(path, run_name="__main__")
+
+
+# Функция для чтения журнала времени запуска одной модели
+def read_startup_log(script, path=STARTUP_LOG):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    return [record for record in records if record.get("script") == script]
+
+
+# Функция для добавления записи в журнал времени запуска
+def append_startup_log(record, path=STARTUP_LOG):
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+# Функция для описания отчета о запуске: общее время, сравнение с медианой
+# прошлых запусков и самые долгие импорты
+def describe_startup(name, report, history):
+    text = f"{name}: окно за {report['wall_seconds']:.2f} с (импорт {report['import_seconds']:.2f} с)"
+    if history:
+        median = statistics.median(record["wall_seconds"] for record in history)
+        text += f", медиана прошлых запусков {median:.2f} с"
+    slowest = sorted(report["imports"].items(), key=lambda item: -item[1])[:5]
+    return text + "\n" + ", ".join(f"{module} {seconds:.3f} с" for module, seconds in slowest)
+
+
+# Окно запуска моделей
+# Сам лаунчер импортирует только tkinter; каждая модель открывается в
+# отдельном процессе и загружает свои модули и графику только при открытии.
+class LauncherApp:
+    def __init__(self, root):
+        from tkinter import ttk
+
+        self.root = root
+        self.root.title("Модели")
+        self.running = []
+
+        ttk.Label(root, text="Выберите модель:").pack(pady=5)
+        for name, script in MODELS.items():
+            ttk.Button(root, text=name, command=lambda name=name, script=script: self.open_model(name, script)).pack(
+                fill="x", padx=10, pady=2)
+        self.result_label = ttk.Label(root, text="", justify="left", wraplength=560)
+        self.result_label.pack(padx=10, pady=10)
+
+    # Функция для открытия модели в новом процессе
+    def open_model(self, name, script):
+        handle, report_path = tempfile.mkstemp(prefix="startup_", suffix=".json")
+        os.close(handle)
+        os.remove(report_path)
+        process = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--run", script, "--report",
+                                    report_path], cwd=APP_DIR)
+        self.running.append((name, script, process, report_path, time.time()))
+        self.result_label.config(text=f"{name}: запуск...")
+        if len(self.running) == 1:
+            self.root.after(POLL_MS, self.poll)
+
+    # Функция для опроса запущенных моделей: появившиеся отчеты выводятся и
+    # записываются в журнал, упавшие до открытия окна модели - сообщаются
+    def poll(self):
+        waiting = []
+        for name, script, process, report_path, started in self.running:
+            if os.path.exists(report_path):
+                with open(report_path, encoding="utf-8") as f:
+                    report = json.load(f)
+                os.remove(report_path)
+                report["wall_seconds"] = report["time"] - started
+                history = read_startup_log(script)
+                append_startup_log(report)
+                self.result_label.config(text=describe_startup(name, report, history))
+            elif process.poll() is not None:
+                self.result_label.config(text=f"Ошибка: {name} завершилась с кодом {process.returncode}")
+            else:
+                waiting.append((name, script, process, report_path, started))
+        self.running = waiting
+        if self.running:
+            self.root.after(POLL_MS, self.poll)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Запуск моделей")
+    parser.add_argument("--run", help="скрипт модели для запуска в этом процессе")
+    parser.add_argument("--report", help="файл отчета о времени запуска")
+    args = parser.parse_args(argv)
+    if args.run:
+        run_model(args.run, args.report)
+        return
+
+    import tkinter as tk
+
+    root = tk.Tk()
+    LauncherApp(root)
+    root.mainloop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+import numpy as np
+
+
+# Ускорение свободного падения (м/с^2)
+G = 9.8
+
+# Число шагов интегрирования по углу на участке дуги
+ARC_STEPS = 500
+
+# Число итераций бисекции при уточнении событий и поиске минимальной скорости
+# (относительная точность 2^-40 ~ 1e-12)
+BISECTION_STEPS = 40
+
+# Наибольшее число отрезков при поиске минимальной скорости и размер
+# пакета прогонов, на который рассчитан выбор их числа
+MAX_SECTIONS = 32
+SECTION_BATCH = 4096
+
+# Наибольшее число удвоений начальной оценки скорости при поиске верхней
+# границы (2^64 ~ 1.8e19 от оценки без трения)
+MAX_DOUBLINGS = 64
+
+# Исходы движения по дуге: тело дошло до конечного угла, оторвалось
+# (сила реакции обратилась в ноль), остановилось (скорость обратилась в ноль)
+REACHED, DETACHED, STOPPED = 0, 1, 2
+
+
+# Правая часть уравнения движения по дуге для u = v² как функции угла θ
+# Положение тела (R sin θ, R (1 - cos θ)), θ = 0 - нижняя точка петли.
+# Сила реакции на единицу массы N = v²/R + g cos θ, трение Кулона μ N
+# направлено против движения: du/dθ = -2 g R sin θ - 2 μ R N.
+# Передаются sin θ и cos θ, чтобы шаг считал их один раз для каждой точки.
+def arc_rate(sin_theta, cos_theta, u, mu, R, g=G):
+    return -2 * g * R * sin_theta - 2 * mu * (u + g * R * cos_theta)
+
+
+# Сила реакции опоры на единицу массы
+def normal_force(theta, u, R, g=G):
+    return u / R + g * np.cos(theta)
+
+
+# Шаг метода Рунге-Кутты 4-го порядка по углу
+def arc_step(theta, u, h, mu, R, g=G):
+    sin_mid, cos_mid = np.sin(theta + h / 2), np.cos(theta + h / 2)
+    k1 = arc_rate(np.sin(theta), np.cos(theta), u, mu, R, g)
+    k2 = arc_rate(sin_mid, cos_mid, u + h / 2 * k1, mu, R, g)
+    k3 = arc_rate(sin_mid, cos_mid, u + h / 2 * k2, mu, R, g)
+    k4 = arc_rate(np.sin(theta + h), np.cos(theta + h), u + h * k3, mu, R, g)
+    return u + h / 6 * (k1 + 2 * k2 + 2 * k3 + k4)
+
+
+# Функция для уточнения момента события внутри шага [θ, θ + h]
+# Событие - первый переход через ноль min(N, u); доля шага s находится
+# векторизованной бисекцией, состояние в точке s h считается тем же шагом РК4.
+def _event_fraction(theta, u, h, mu, R, g):
+    lo = np.zeros_like(u)
+    hi = np.ones_like(u)
+    for _ in range(BISECTION_STEPS):
+        s = (lo + hi) / 2
+        u_s = arc_step(theta, u, s * h, mu, R, g)
+        fired = np.minimum(normal_force(theta + s * h, u_s, R, g), u_s) <= 0
+        hi = np.where(fired, s, hi)
+        lo = np.where(fired, lo, s)
+    return hi
+
+
+# Функция для интегрирования движения по дуге для набора начальных скоростей
+# Аргументы v0, mu, R, theta_end - массивы совместимой формы (каждый элемент -
+# отдельный прогон). Прогон заканчивается отрывом, остановкой или на угле
+# theta_end. Возвращает словарь массивов той же формы: status (REACHED,
+# DETACHED, STOPPED), theta - угол окончания, speed - скорость в этой точке.
+# Шаг, на котором сработало событие, запоминается, а сам момент события
+# уточняется после интегрирования одной бисекцией для всех прогонов сразу
+# (refine=False - без уточнения, когда нужен только исход).
+def simulate_arc(v0, mu, R, theta_end, g=G, steps=ARC_STEPS, refine=True):
+    arrays = np.broadcast_arrays(*(np.asarray(a, dtype=float) for a in (v0, mu, R, theta_end)))
+    shape = arrays[0].shape
+    v0, mu, R, theta_end = (a.ravel() for a in arrays)
+    h = theta_end / steps
+    u = v0 ** 2
+    active = u > 0
+    status = np.where(active, REACHED, STOPPED)
+    event_step = np.where(active, steps, 0)
+    event_u = u.copy()
+
+    for k in range(steps):
+        theta = k * h
+        u_next = arc_step(theta, u, h, mu, R, g)
+        detached = normal_force(theta + h, u_next, R, g) <= 0
+        fired = active & (detached | (u_next <= 0))
+        if fired.any():
+            status[fired] = np.where(detached[fired], DETACHED, STOPPED)
+            event_step[fired] = k
+            event_u[fired] = u[fired]
+            active &= ~fired
+            if not active.any():
+                break
+        u = np.where(active, u_next, u)
+    event_u[active] = u[active]
+
+    theta_event = event_step * h
+    u_event = event_u
+    i = np.flatnonzero(status != REACHED)
+    if refine and i.size:
+        s = _event_fraction(theta_event[i], event_u[i], h[i], mu[i], R[i], g)
+        u_event = event_u.copy()
+        u_event[i] = arc_step(theta_event[i], event_u[i], s * h[i], mu[i], R[i], g)
+        theta_event[i] += s * h[i]
+
+    return {
+        "status": status.reshape(shape),
+        "theta": theta_event.reshape(shape),
+        "speed": np.sqrt(np.maximum(u_event, 0)).reshape(shape),
+    }
+
+
+# Функция для поиска минимальной начальной скорости, при которой тело доходит
+# по дуге до угла alpha (при π/2 < alpha < π оно отрывается ровно в alpha)
+# Поиск векторизован: на каждой итерации один прогон simulate_arc проверяет
+# сразу для всех сочетаний (mu, R, alpha) sections - 1 внутренних точек
+# отрезка [lo, hi] и сужает его до участка между последней недошедшей и
+# первой дошедшей скоростью. При малом числе сочетаний точек больше, что
+# сокращает число проходов интегрирования (sections = 2 - обычная бисекция).
+# Сочетания с R <= 0 и те, где тело не доходит до alpha и после MAX_DOUBLINGS
+# удвоений скорости, получают NaN; для одного сочетания это ValueError.
+def minimum_speed(mu, R, alpha, g=G, steps=ARC_STEPS, bits=BISECTION_STEPS, sections=None):
+    mu, R, alpha = np.broadcast_arrays(*(np.asarray(a, dtype=float) for a in (mu, R, alpha)))
+    shape = mu.shape
+    if not shape and not R > 0:
+        raise ValueError("радиус петли должен быть положительным")
+    v0 = np.full(mu.size, np.nan)
+    index = np.flatnonzero(R > 0)
+    mu, R, alpha = mu.ravel()[index], R.ravel()[index], alpha.ravel()[index]
+    if sections is None:
+        sections = int(np.clip(SECTION_BATCH // max(mu.size, 1), 2, MAX_SECTIONS))
+    hi = np.sqrt(g * R * (5 + 4 * mu))
+    for _ in range(MAX_DOUBLINGS):
+        reached = simulate_arc(hi, mu, R, alpha, g, steps, refine=False)["status"] == REACHED
+        if reached.all():
+            break
+        hi = np.where(reached, hi, 2 * hi)
+    index, mu, R, alpha, hi = index[reached], mu[reached], R[reached], alpha[reached], hi[reached]
+    lo = np.zeros_like(hi)
+
+    fractions = np.arange(1, sections) / sections
+    mu, R, alpha = mu[..., None], R[..., None], alpha[..., None]
+    for _ in range(int(np.ceil(bits / np.log2(sections)))):
+        edges = np.concatenate((lo[..., None], lo[..., None] + (hi - lo)[..., None] * fractions, hi[..., None]), -1)
+        reached = simulate_arc(edges[..., 1:-1], mu, R, alpha, g, steps, refine=False)["status"] == REACHED
+        # Исход монотонен по скорости: новая верхняя граница - первая дошедшая точка
+        first = np.where(reached.any(-1), reached.argmax(-1) + 1, sections)[..., None]
+        hi = np.take_along_axis(edges, first, -1)[..., 0]
+        lo = np.take_along_axis(edges, first - 1, -1)[..., 0]
+    v0[index] = hi
+    if not shape and np.isnan(v0[0]):
+        raise ValueError("не удалось подобрать начальную скорость: тело не доходит до угла отрыва")
+    return v0.reshape(shape)
+
+
+# Функция для расчета минимальной начальной скорости без бисекции (та же
+# граница, к которой сходится minimum_speed с тем же числом шагов steps)
+# Уравнение для u = v² линейно, поэтому шаг РК4 - аффинное отображение
+# u -> a u + c, и после k шагов u = A_k u0 + B_k. Условия u > 0 и N > 0 в
+# конце каждого шага - нижние границы для u0, их максимум - квадрат
+# искомой скорости. Весь набор (mu, R, alpha) считается за один проход.
+def minimum_speed_direct(mu, R, alpha, g=G, steps=ARC_STEPS):
+    mu, R, alpha = np.broadcast_arrays(*(np.asarray(a, dtype=float) for a in (mu, R, alpha)))
+    h = alpha / steps
+    A = np.ones(mu.shape)
+    B = np.zeros(mu.shape)
+    u_min = np.zeros(mu.shape)
+    for k in range(steps):
+        theta = k * h
+        c = arc_step(theta, 0.0, h, mu, R, g)
+        a = arc_step(theta, 1.0, h, mu, R, g) - c
+        A = a * A
+        B = a * B + c
+        u_min = np.maximum(u_min, (np.maximum(0.0, -g * R * np.cos(theta + h)) - B) / A)
+    return np.sqrt(np.where(R > 0, u_min, np.nan))
+
+
+# Функция для расчета времени полета после отрыва в угле theta со скоростью
+# speed: при отрыве N = 0, и тело снова касается петли через t = 4 v sin θ / g
+def recontact_time(theta, speed, g=G):
+    return 4 * speed * np.sin(theta) / g
+
+
+# Функция для расчета полета после отрыва в угле theta со скоростью speed
+# Скорость направлена по касательной (cos θ, sin θ). Возвращает координаты
+# x, y в points моментах времени от отрыва до нового касания петли.
+def ballistic_flight(theta, speed, R, g=G, points=100):
+    t = np.linspace(0, recontact_time(theta, speed, g), points)
+    x = R * np.sin(theta) + speed * np.cos(theta) * t
+    y = R * (1 - np.cos(theta)) + speed * np.sin(theta) * t - 0.5 * g * t ** 2
+    return x, y
+
+
+# Функция для расчета одного сценария петли: необходимая скорость, движение
+# по дуге с этой скоростью до отрыва и полет после отрыва
+# Возвращает словарь: v0, status, theta и speed в точке отрыва, координаты
+# дуги (x_arc, y_arc) и траектории полета (x_flight, y_flight). Меньшие
+# steps и bits дают быструю грубую оценку.
+def loop_trajectory(mu, R, alpha, g=G, points=100, steps=ARC_STEPS, bits=BISECTION_STEPS):
+    v0 = float(minimum_speed(mu, R, alpha, g, steps, bits))
+    run = simulate_arc(v0, mu, R, 2 * np.pi, g, steps)
+    theta = float(run["theta"])
+    speed = float(run["speed"])
+    theta_arc = np.linspace(0, theta, points)
+    if run["status"] == DETACHED:
+        x_flight, y_flight = ballistic_flight(theta, speed, R, g, points)
+    else:
+        x_flight = y_flight = np.empty(0)
+    return {
+        "v0": v0,
+        "status": int(run["status"]),
+        "theta": theta,
+        "speed": speed,
+        "x_arc": R * np.sin(theta_arc),
+        "y_arc": R * (1 - np.cos(theta_arc)),
+        "x_flight": x_flight,
+        "y_flight": y_flight,
+    }
@@ -0,0 +1,147 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from BackgroundWorker import check_cancelled
+from LoopSimulation import G, minimum_speed_direct, recontact_time
+from ResultStore import stored
+
+# Число сочетаний параметров, обрабатываемых одной задачей пула процессов
+SWEEP_CHUNK = 1 << 20
+
+# Величины, сохраняемые в наборе данных перебора
+SWEEP_FIELDS = ("v_min", "v_alpha", "x_land", "t_flight")
+
+
+# Функция для проверки, возможен ли отрыв в угле alpha (π/2 < α < π)
+# В нижней половине петли сила реакции не обращается в ноль, а после
+# верхней точки тело, прошедшее ее, уже не отрывается.
+def detachment_possible(alpha):
+    alpha = np.asarray(alpha)
+    return (alpha > np.pi / 2) & (alpha < np.pi)
+
+
+# Функция для расчета скорости в точке отрыва от дуги
+# Отрыв происходит там, где сила реакции обращается в ноль: v² = -g R cos α.
+# Вне π/2 < α < π и при R <= 0 результат - NaN.
+def detachment_speed(R, alpha, g=G):
+    v_squared = -g * np.asarray(R) * np.cos(alpha)
+    return np.sqrt(np.where(detachment_possible(alpha) & (v_squared > 0), v_squared, np.nan))
+
+
+# Функция для расчета необходимой начальной скорости в нижней точке петли
+# Модель та же, что у LoopSimulation.minimum_speed (трение μN, РК4 по углу).
+# Уравнение для v²/(gR) не зависит от R и g, поэтому скорость считается
+# один раз для каждой пары (μ, α) при R = g = 1 и умножается на √(gR).
+# Вне π/2 < α < π и при R <= 0 результат - NaN.
+def required_speed(mu, R, alpha, g=G):
+    mu, R, alpha = np.broadcast_arrays(*(np.asarray(a, dtype=float) for a in (mu, R, alpha)))
+    v0 = np.full(mu.shape, np.nan)
+    valid = detachment_possible(alpha) & (R > 0)
+    pairs, inverse = np.unique(np.stack((mu[valid], alpha[valid])), axis=1, return_inverse=True)
+    v_unit = minimum_speed_direct(pairs[0], 1.0, pairs[1], g=1.0)
+    v0[valid] = v_unit[inverse.ravel()] * np.sqrt(g * R[valid])
+    return v0
+
+
+# Функция для расчета положения и скорости тела в точке отрыва
+# Возвращает x0, y0, v_x, v_y; скорость направлена по касательной к дуге
+# (cos α, sin α), как в LoopSimulation.ballistic_flight.
+def detachment_state(R, alpha, g=G):
+    v_alpha = detachment_speed(R, alpha, g)
+    x0 = R * np.sin(alpha)
+    y0 = R * (1 - np.cos(alpha))
+    return x0, y0, v_alpha * np.cos(alpha), v_alpha * np.sin(alpha)
+
+
+# Функция для расчета времени полета после отрыва и абсциссы точки, где
+# тело снова касается петли (то же условие, что в LoopSimulation.ballistic_flight)
+def landing_point(R, alpha, g=G):
+    x0, _, v_x, _ = detachment_state(R, alpha, g)
+    t_flight = recontact_time(alpha, detachment_speed(R, alpha, g), g)
+    return x0 + v_x * t_flight, t_flight
+
+
+# Функция для расчета всех величин для набора сочетаний (μ, R, α)
+# Аргументы - массивы одинаковой (или совместимой) формы; результат -
+# словарь массивов SWEEP_FIELDS в точности dtype.
+def loop_scenarios(mu, R, alpha, g=G, dtype=np.float32):
+    mu, R, alpha = np.broadcast_arrays(*(np.asarray(a, dtype=float) for a in (mu, R, alpha)))
+    x_land, t_flight = landing_point(R, alpha, g)
+    values = {
+        "v_min": required_speed(mu, R, alpha, g),
+        "v_alpha": detachment_speed(R, alpha, g),
+        "x_land": x_land,
+        "t_flight": t_flight,
+    }
+    return {name: values[name].astype(dtype) for name in SWEEP_FIELDS}
+
+
+# Задача пула процессов: сочетания с плоскими номерами [start, stop)
+# из сетки mu × R × alpha
+def _sweep_chunk(args):
+    mu, R, alpha, start, stop, g, dtype = args
+    i, j, k = np.unravel_index(np.arange(start, stop), (len(mu), len(R), len(alpha)))
+    return start, loop_scenarios(mu[i], R[j], alpha[k], g, dtype)
+
+
+# Функция для перебора всех сочетаний параметров mu × R × alpha
+# Сетка делится на части по chunk сочетаний, которые считаются в пуле из
+# workers процессов (workers=1 - в текущем процессе). Результат - словарь с
+# осями mu, R, alpha и массивами SWEEP_FIELDS формы (len(mu), len(R), len(alpha)).
+# Флаг отмены cancelled проверяется после каждой части.
+def parameter_sweep(mu, R, alpha, g=G, workers=None, chunk=SWEEP_CHUNK, dtype=np.float32, cancelled=None):
+    mu, R, alpha = (np.atleast_1d(np.asarray(a, dtype=float)) for a in (mu, R, alpha))
+    shape = (len(mu), len(R), len(alpha))
+    total = int(np.prod(shape))
+    result = {"mu": mu, "R": R, "alpha": alpha}
+    flat = {name: np.empty(total, dtype=dtype) for name in SWEEP_FIELDS}
+
+    tasks = [(mu, R, alpha, start, min(start + chunk, total), g, dtype) for start in range(0, total, chunk)]
+    if workers is None:
+        workers = min(len(tasks), os.cpu_count() or 1)
+    if workers <= 1 or len(tasks) <= 1:
+        parts = map(_sweep_chunk, tasks)
+        pool = None
+    else:
+        pool = ProcessPoolExecutor(max_workers=workers)
+        parts = pool.map(_sweep_chunk, tasks)
+    try:
+        for start, values in parts:
+            check_cancelled(cancelled)
+            for name in SWEEP_FIELDS:
+                flat[name][start:start + len(values[name])] = values[name]
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    for name in SWEEP_FIELDS:
+        result[name] = flat[name].reshape(shape)
+    return result
+
+
+# Функция для запроса к хранилищу результатов: (модель, параметры, разрешение)
+# перебора по осям mu, R, alpha
+def sweep_request(mu, R, alpha, g=G, dtype=np.float32):
+    params = {"mu": np.asarray(mu, dtype=float), "R": np.asarray(R, dtype=float),
+              "alpha": np.asarray(alpha, dtype=float), "g": g}
+    return "loop_sweep", params, {"dtype": np.dtype(dtype).name}
+
+
+# Функция для перебора из хранилища store (np.memmap) или рассчитанного и
+# сохраненного; без хранилища (None) - просто расчет
+def stored_sweep(store, mu, R, alpha, g=G, workers=None, cancelled=None):
+    return stored(store, *sweep_request(mu, R, alpha, g),
+                  lambda writer: parameter_sweep(mu, R, alpha, g, workers, cancelled=cancelled))
+
+
+# Функция для сохранения результатов перебора в сжатый архив .npz
+def save_sweep(path, sweep):
+    np.savez_compressed(path, **sweep)
+
+
+# Функция для загрузки результатов перебора
+def load_sweep(path):
+    with np.load(path) as data:
+        return {name: data[name] for name in data.files}
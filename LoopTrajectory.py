@@ -1,86 +1,188 @@
 ﻿import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import tkinter as tk
 
-def calculate_velocity():
-    # Заданные параметры
-    m = 3  # кг
-    mu = 0.03
-    R = 3  # м
-    g = 9.8  # м/с^2
-
-    # Вычисление необходимой скорости
-    v_min_squared = 2 * g * R * (7/4 - mu * (np.sqrt(3)/2))
-    v_min = np.sqrt(v_min_squared)
-
-    return v_min
+from BackgroundWorker import BackgroundWorker, check_cancelled
+from PlotRendering import FigurePanel
+from Profiling import profile_status_bar, profiler
+from LoopSweep import SWEEP_FIELDS, parameter_sweep, save_sweep, stored_sweep, sweep_request
+from LoopSimulation import ARC_STEPS, loop_trajectory, minimum_speed
+from ResultStore import default_store
+
+# Заданные параметры
+m = 3  # кг
+MU = 0.03
+RADIUS = 3  # м
+ALPHA = 5 * np.pi / 6  # угол отрыва, радиан (отрыв возможен при π/2 < α < π)
+
+# Подписи величин для тепловых карт
+SWEEP_TITLES = {
+    "v_min": "Необходимая скорость (м/с)",
+    "v_alpha": "Скорость отрыва (м/с)",
+    "x_land": "Точка касания петли после полета x (м)",
+    "t_flight": "Время полета до касания петли (с)",
+}
+
+# Грубая оценка, которая показывается до точного расчета: шагов по дуге и
+# шагов бисекции для траектории, прореживание осей для карты параметров
+COARSE_ARC_STEPS = ARC_STEPS // 5
+COARSE_BISECTION_STEPS = 16
+COARSE_SWEEP_STRIDE = 4
+
+# Хранилище результатов перебора на диске (None - не сохранять)
+result_store = default_store()
+
+def calculate_velocity(mu=MU, R=RADIUS, alpha=ALPHA):
+    # Вычисление необходимой скорости: численное интегрирование движения по
+    # дуге с трением и бисекция по начальной скорости (векторизовано по
+    # массивам параметров)
+    return minimum_speed(mu, R, alpha)
+
+# Функция для расчета траектории в фоновом потоке: сначала грубая оценка, затем точный расчет
+def trajectory_stages(cancelled=None):
+    yield loop_trajectory(MU, RADIUS, ALPHA, steps=COARSE_ARC_STEPS, bits=COARSE_BISECTION_STEPS), False
+    check_cancelled(cancelled)
+    yield loop_trajectory(MU, RADIUS, ALPHA), True
 
 def plot_trajectory():
-    # Заданные параметры
-    m = 3  # кг
-    mu = 0.03
-    R = 3  # м
-    alpha = np.pi + (np.pi / 6)  # 4π/3 радиан
-
-    # Ускорение свободного падения
-    g = 9.8  # м/с^2
-
-    # Вычисление начальной скорости
-    v0 = calculate_velocity()
-
-    # Скорость в точке отрыва от дуги
-    v_alpha = np.sqrt(g * R / 2)
-
-    # Координаты точки отрыва
-    cos_alpha = np.cos(alpha)
-    sin_alpha = np.sin(alpha)
-    x0 = R * sin_alpha
-    y0 = R * (1 - cos_alpha)
-
-    # Компоненты скорости в точке отрыва
-    phi = alpha + (np.pi / 2)
-    v_x = v_alpha * np.cos(phi)
-    v_y = v_alpha * np.sin(phi)
-
-    # Время полета для построения траектории
-    t_flight = (-v_y - np.sqrt(v_y**2 + 2 * g * y0)) / (-g)
-    t = np.linspace(0, t_flight, 100)
-
-    # Уравнения траектории после отрыва
-    x_traj = x0 + v_x * t
-    y_traj = y0 + v_y * t - 0.5 * g * t**2
-
-    # Координаты дуги
-    theta_arc = np.linspace(0, alpha, 100)
-    x_arc = R * np.sin(theta_arc)
-    y_arc = R * (1 - np.cos(theta_arc))
-
-    # Создание графика
-    fig, ax = plt.subplots(figsize=(10, 6))
-    ax.plot(x_arc, y_arc, label='Путь по дуге', color='blue')
-    ax.plot(x_traj, y_traj, label='Траектория после отрыва', color='red')
-    ax.scatter([x0], [y0], color='green', label='Точка отрыва')
-    ax.set_xlabel('x (м)')
-    ax.set_ylabel('y (м)')
-    ax.set_title('Траектория тела после отрыва от дуги')
+    profiler.start_run("Траектория")
+    velocity_label.config(text="Расчет...")
+    trajectory_worker.submit(lambda cancelled: profiler.iterate("траектория", trajectory_stages(cancelled)),
+                             draw_trajectory, lambda e: velocity_label.config(text=f"Ошибка: {e}"))
+
+# Функция для отображения траектории (в главном потоке)
+def draw_trajectory(stage):
+    global panel, ax
+
+    # Необходимая скорость, движение по дуге до отрыва и полет после отрыва
+    result, final = stage
+    v0, theta_end, v_end = result["v0"], result["theta"], result["speed"]
+    x0, y0 = result["x_arc"][-1], result["y_arc"][-1]
+
+    # Создание графика: фигура и оси создаются один раз, при повторном
+    # построении у линий и точки отрыва обновляются только данные
+    if panel is None:
+        with profiler.stage("создание фигуры"):
+            panel = FigurePanel(window, figsize=(10, 6), side=tk.TOP)
+            ax = panel.figure.add_subplot(111)
+            ax.set_xlabel('x (м)')
+            ax.set_ylabel('y (м)')
+            ax.set_title('Траектория тела после отрыва от дуги')
+            ax.grid(True)
+    panel.line(ax, 'arc', result["x_arc"], result["y_arc"], label='Путь по дуге', color='blue')
+    panel.line(ax, 'trajectory', result["x_flight"], result["y_flight"], label='Траектория после отрыва',
+               color='red')
+    panel.scatter(ax, 'detachment', [x0], [y0], color='green', label='Точка отрыва')
     ax.legend()
-    ax.grid(True)
+    ax.relim()
+    ax.autoscale_view()
     ax.axis('equal')
-
-    # Вставка графика в интерфейс
-    canvas = FigureCanvasTkAgg(fig, master=window)  # Создание объекта canvas
-    canvas.draw()
-    canvas.get_tk_widget().pack()
+    panel.draw()
 
     # Вывод необходимой скорости
-    velocity_label.config(text=f'Необходимая скорость: {v0:.2f} м/с')
+    velocity_label.config(text=f'Необходимая скорость: {v0:.2f} м/с, '
+                               f'отрыв при {np.degrees(theta_end):.1f}° со скоростью {v_end:.2f} м/с' +
+                               ('' if final else ' (грубая оценка, уточняется...)'))
+
+# Функция для чтения диапазона "минимум максимум число точек"
+def read_range(entry, name):
+    parts = entry.get().split()
+    if len(parts) != 3:
+        raise ValueError(f"{name}: ожидается 'минимум максимум число точек'")
+    count = int(parts[2])
+    if count < 1:
+        raise ValueError(f"{name}: число точек должно быть положительным")
+    return np.linspace(float(parts[0]), float(parts[1]), count)
+
+# Функция для перебора параметров в фоновом потоке: сначала по прореженным
+# осям, затем по полным; в файл сохраняется только полный перебор. Перебор
+# из хранилища выдается сразу, без прореженного.
+def sweep_stages(mu, R, alpha, path, cancelled=None):
+    found = result_store is not None and result_store.contains(*sweep_request(mu, R, alpha))
+    if max(len(mu), len(R), len(alpha)) > COARSE_SWEEP_STRIDE and not found:
+        step = COARSE_SWEEP_STRIDE
+        yield parameter_sweep(mu[::step], R[::step], alpha[::step], cancelled=cancelled), False
+    result = stored_sweep(result_store, mu, R, alpha, cancelled=cancelled)
+    if path:
+        save_sweep(path, result)
+    yield result, True
+
+# Функция для перебора параметров (μ, R, α) по диапазонам из полей ввода
+# Результат сохраняется в sweep и, если задано имя файла, в архив .npz.
+def run_sweep():
+    profiler.start_run("Карта параметров")
+    try:
+        with profiler.stage("разбор диапазонов"):
+            mu = read_range(entry_mu_range, "μ")
+            R = read_range(entry_R_range, "R")
+            alpha = read_range(entry_alpha_range, "α")
+            if alpha.min() <= 90 or alpha.max() >= 180:
+                raise ValueError("α: отрыв возможен только при 90° < α < 180°")
+            alpha = np.radians(alpha)
+    except ValueError as e:
+        sweep_label.config(text=f"Ошибка: {e}")
+        return
+    path = entry_sweep_path.get().strip()
+    sweep_label.config(text="Расчет...")
+    sweep_worker.submit(lambda cancelled: profiler.iterate("перебор", sweep_stages(mu, R, alpha, path, cancelled)),
+                        lambda stage: show_sweep(stage, path),
+                        lambda e: sweep_label.config(text=f"Ошибка: {e}"))
+
+# Функция для вывода очередного результата перебора (в главном потоке)
+def show_sweep(stage, path):
+    global sweep
+    sweep, final = stage
+    count = sweep["v_min"].size
+    if final:
+        sweep_label.config(text=f"Рассчитано сочетаний: {count}" + (f", сохранено в {path}" if path else ""))
+    else:
+        sweep_label.config(text=f"Грубая карта: {count} сочетаний, уточняется...")
+    plot_sweep()
+
+# Функция для построения тепловой карты выбранной величины по (α, R)
+# при значении μ, ближайшем к заданному в поле среза
+def plot_sweep(*args):
+    global map_window, map_panel, map_ax
+    if sweep is None:
+        return
+    try:
+        mu_value = float(entry_mu_slice.get())
+    except ValueError:
+        sweep_label.config(text="Ошибка: некорректное значение μ для среза")
+        return
+    field = sweep_field.get()
+    i = int(np.abs(sweep["mu"] - mu_value).argmin())
+    alpha = np.degrees(sweep["alpha"])
+    R = sweep["R"]
+    extent = (alpha[0], alpha[-1], R[0], R[-1])
+
+    if map_panel is None:
+        with profiler.stage("создание фигуры"):
+            map_window = tk.Toplevel(window)
+            map_window.title("Карта параметров петли")
+            map_panel = FigurePanel(map_window, figsize=(7, 5))
+            map_ax = map_panel.figure.add_subplot(111)
+            map_ax.set_xlabel('α (град)')
+            map_ax.set_ylabel('R (м)')
+    map_panel.image(map_ax, 'map', sweep[field][i], extent, colorbar=True, cmap='viridis')
+    map_ax.set_title(f"{SWEEP_TITLES[field]} при μ = {sweep['mu'][i]:.3g}")
+    map_panel.draw()
+
+# Постоянная фигура с графиком (создается при первом построении)
+panel = ax = None
+
+# Результаты перебора параметров и окно тепловых карт
+sweep = None
+map_window = map_panel = map_ax = None
 
 # Создание главного окна
 window = tk.Tk()
 window.title("Мертвая петля")
 window.geometry("800x600")
 
+# Фоновые потоки для расчета траектории и перебора параметров (независимые)
+trajectory_worker = BackgroundWorker(window)
+sweep_worker = BackgroundWorker(window)
+
 # Кнопка для построения графика
 plot_button = tk.Button(window, text="Построить траекторию", command=plot_trajectory)
 plot_button.pack()
@@ -89,5 +191,46 @@ plot_button.pack()
 velocity_label = tk.Label(window, text="", font=("Arial", 12))
 velocity_label.pack()
 
+# Параметры перебора (μ, R, α)
+frame_sweep = tk.Frame(window)
+frame_sweep.pack(pady=5)
+
+tk.Label(frame_sweep, text="μ (мин макс число):").grid(row=0, column=0, sticky="e")
+entry_mu_range = tk.Entry(frame_sweep)
+entry_mu_range.insert(0, "0 0.3 100")
+entry_mu_range.grid(row=0, column=1)
+
+tk.Label(frame_sweep, text="R, м (мин макс число):").grid(row=1, column=0, sticky="e")
+entry_R_range = tk.Entry(frame_sweep)
+entry_R_range.insert(0, "1 10 100")
+entry_R_range.grid(row=1, column=1)
+
+tk.Label(frame_sweep, text="α, град (мин макс число):").grid(row=2, column=0, sticky="e")
+entry_alpha_range = tk.Entry(frame_sweep)
+entry_alpha_range.insert(0, "100 170 100")
+entry_alpha_range.grid(row=2, column=1)
+
+tk.Label(frame_sweep, text="Файл данных (.npz, необязательно):").grid(row=3, column=0, sticky="e")
+entry_sweep_path = tk.Entry(frame_sweep)
+entry_sweep_path.grid(row=3, column=1)
+
+tk.Label(frame_sweep, text="Величина:").grid(row=0, column=2, sticky="e")
+sweep_field = tk.StringVar(value="v_min")
+tk.OptionMenu(frame_sweep, sweep_field, *SWEEP_FIELDS, command=plot_sweep).grid(row=0, column=3)
+
+tk.Label(frame_sweep, text="Срез по μ:").grid(row=1, column=2, sticky="e")
+entry_mu_slice = tk.Entry(frame_sweep)
+entry_mu_slice.insert(0, str(MU))
+entry_mu_slice.grid(row=1, column=3)
+
+tk.Button(frame_sweep, text="Рассчитать карту", command=run_sweep).grid(row=2, column=2)
+tk.Button(frame_sweep, text="Показать срез", command=plot_sweep).grid(row=2, column=3)
+
+sweep_label = tk.Label(frame_sweep, text="")
+sweep_label.grid(row=3, column=2, columnspan=2)
+
+# Строка состояния с замером этапов (если он включен)
+profile_status_bar(window)
+
 # Запуск главного цикла
 window.mainloop()
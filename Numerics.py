@@ -0,0 +1,73 @@
+import numpy as np
+
+
+# Компилируемый бэкенд (numba) используется, если он установлен. Импорт
+# numba заметно замедляет запуск, поэтому он выполняется при первом
+# обращении к бэкенду (см. _njit).
+_NUMBA = {}
+
+
+# Скомпилированные функции: numba-версии функций и циклов (None - функция
+# не компилируется numba)
+_JIT_FUNCTIONS = {}
+
+
+# Функция для получения декоратора numba.njit (None, если numba не установлена)
+def _njit():
+    if "njit" not in _NUMBA:
+        try:
+            from numba import njit
+        except ImportError:
+            njit = None
+        _NUMBA["njit"] = njit
+    return _NUMBA["njit"]
+
+
+# Декоратор с параметрами компиляции numba для функции (например, fastmath)
+# Сама функция не меняется и без numba выполняется как обычно.
+def jit_options(**options):
+    def mark(f):
+        f.jit_options = options
+        return f
+
+    return mark
+
+
+# Функция для получения numba-версии функции f
+def _jit(f):
+    njit = _njit()
+    if njit is None:
+        return None
+    if f not in _JIT_FUNCTIONS:
+        _JIT_FUNCTIONS[f] = f if hasattr(f, "py_func") else njit(**getattr(f, "jit_options", {}))(f)
+    return _JIT_FUNCTIONS[f]
+
+
+# Функция для запуска скомпилированной версии цикла loop(f_jit, *loop_args)
+# (f - функция, которую цикл вызывает). Возвращает False, если numba
+# недоступна или не смогла скомпилировать f (кроме backend="numba", когда
+# это ошибка).
+def run_compiled(loop, f, backend, *loop_args):
+    f_jit = _jit(f)
+    if f_jit is None:
+        if backend == "numba":
+            raise RuntimeError("Бэкенд numba недоступен")
+        return False
+    try:
+        _jit(loop)(f_jit, *loop_args)
+        return True
+    except Exception:
+        if backend == "numba":
+            raise
+        _JIT_FUNCTIONS[f] = None
+        return False
+
+
+# Функция для разворачивания отрезков [first, first + count) в пары
+# (номер отрезка, индекс): owner[i] - номер отрезка, которому принадлежит
+# i-й индекс результата
+def expand_ranges(first, counts):
+    total = int(counts.sum())
+    owner = np.repeat(np.arange(len(counts)), counts)
+    offsets = np.cumsum(counts) - counts
+    return owner, first[owner] + np.arange(total) - offsets[owner]
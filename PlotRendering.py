@@ -0,0 +1,345 @@
+import numpy as np
+
+from Profiling import profiler
+
+
+# Число ячеек поверхности по каждой оси (как rcount/ccount у plot_surface)
+SURFACE_COUNT = 50
+
+
+# Функция для построения четырехугольников поверхности Z(X, Y)
+# Сетка прореживается до count ячеек по каждой оси. Возвращает вершины
+# формы (n, 4, 3) и среднее Z каждой ячейки; ячейки с нечисловыми
+# значениями отбрасываются.
+def surface_polygons(X, Y, Z, count=SURFACE_COUNT):
+    rows = np.unique(np.linspace(0, Z.shape[0] - 1, min(Z.shape[0], count + 1)).round().astype(int))
+    cols = np.unique(np.linspace(0, Z.shape[1] - 1, min(Z.shape[1], count + 1)).round().astype(int))
+    index = np.ix_(rows, cols)
+    P = np.stack((X[index], Y[index], Z[index]), axis=-1)
+    polys = np.stack((P[:-1, :-1], P[1:, :-1], P[1:, 1:], P[:-1, 1:]), axis=2).reshape(-1, 4, 3)
+    finite = np.isfinite(polys).all(axis=(1, 2))
+    polys = polys[finite]
+    return polys, polys[:, :, 2].mean(axis=1)
+
+
+# Функция для расчета пределов по конечным значениям массива
+def finite_limits(values):
+    values = np.asarray(values)
+    values = values[np.isfinite(values)]
+    if values.size == 0:
+        return 0.0, 1.0
+    lo, hi = values.min(), values.max()
+    if lo == hi:
+        lo, hi = lo - 0.5, hi + 0.5
+    return lo, hi
+
+
+# Кольцевой буфер фиксированной длины для прокручиваемых графиков
+# Каждое значение записывается дважды (в позиции i и i + capacity), поэтому
+# последние capacity значений всегда лежат в памяти подряд, и view()
+# возвращает их без копирования.
+class RingBuffer:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.data = np.zeros(2 * capacity)
+        self.head = 0
+        self.size = 0
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=float)[-self.capacity:]
+        index = (self.head + np.arange(len(values))) % self.capacity
+        self.data[index] = values
+        self.data[index + self.capacity] = values
+        self.head = (self.head + len(values)) % self.capacity
+        self.size = min(self.size + len(values), self.capacity)
+
+    def view(self):
+        start = self.head + self.capacity - self.size
+        return self.data[start:start + self.size]
+
+    def clear(self):
+        self.head = 0
+        self.size = 0
+
+
+# Функция для пошагового пересчета пределов оси y
+# Пределы расширяются, как только новые значения выходят за верхнюю границу,
+# и сужаются, когда максимум в окне падает ниже shrink от границы, так что
+# пересчет происходит редко, а проверка стоит O(окно).
+def update_ylim(ax, values, margin=1.1, shrink=0.5):
+    if len(values) == 0:
+        return False
+    top = ax.get_ylim()[1]
+    peak = values.max()
+    if peak > top or peak < shrink * top:
+        ax.set_ylim(0, peak * margin if peak > 0 else 1.0)
+        return True
+    return False
+
+
+# Линия с прореживанием по пикселям (уровень детализации)
+# Хранит полный ряд (x должен возрастать), а в Line2D передает только
+# огибающую: для каждой корзины из size соседних отсчетов - ее минимум и
+# максимум в исходном порядке, так что пики не теряются. size - степень
+# двойки не меньше числа отсчетов видимой области на пиксель ширины осей,
+# поэтому на экран уходит не больше ~2 точек на пиксель. Огибающие корзин
+# кэшируются: новые отсчеты (append) пересчитывают только последнюю неполную
+# корзину и новые, сдвиг вида - только еще не посчитанные видимые корзины,
+# а полный пересчет нужен лишь при смене size.
+class DecimatedLine:
+    def __init__(self, line, x=(), y=()):
+        self.line = line
+        self.ax = line.axes
+        self.ax.callbacks.connect("xlim_changed", lambda ax: self.update())
+        line.figure.canvas.mpl_connect("resize_event", lambda event: self.update())
+        self.set_data(x, y)
+
+    def set_data(self, x, y):
+        self.x = np.array(x, dtype=float)
+        self.y = np.array(y, dtype=float)
+        self.n = len(self.x)
+        self._reset(0)
+        self.update()
+
+    def append(self, x, y):
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        n_new = self.n + len(x)
+        # Память растет удвоением, чтобы добавление стоило O(len(x)) в среднем
+        if n_new > len(self.x):
+            capacity = max(n_new, 2 * len(self.x))
+            self.x = np.resize(self.x, capacity)
+            self.y = np.resize(self.y, capacity)
+        self.x[self.n:n_new] = x
+        self.y[self.n:n_new] = y
+
+        if self.size:
+            # Последняя неполная корзина изменилась, новые еще не посчитаны
+            n_buckets = -(-n_new // self.size)
+            if self.n % self.size:
+                self.done[self.n // self.size] = False
+            grow = n_buckets - len(self.done)
+            self.done = np.concatenate([self.done, np.zeros(grow, dtype=bool)])
+            self.lo = np.concatenate([self.lo, np.zeros(grow, dtype=np.intp)])
+            self.hi = np.concatenate([self.hi, np.zeros(grow, dtype=np.intp)])
+        self.n = n_new
+        self.update()
+
+    def _reset(self, size):
+        self.size = size
+        n_buckets = -(-self.n // size) if size else 0
+        self.done = np.zeros(n_buckets, dtype=bool)
+        self.lo = np.zeros(n_buckets, dtype=np.intp)
+        self.hi = np.zeros(n_buckets, dtype=np.intp)
+
+    def update(self):
+        x = self.x[:self.n]
+        y = self.y[:self.n]
+        if self.n == 0:
+            self.line.set_data([], [])
+            return
+
+        # Видимый диапазон отсчетов (с одним отсчетом запаса с каждой стороны)
+        x_left, x_right = sorted(self.ax.get_xlim())
+        i0 = max(np.searchsorted(x, x_left) - 1, 0)
+        i1 = min(np.searchsorted(x, x_right, side="right") + 1, self.n)
+        per_pixel = (i1 - i0) / max(self.ax.bbox.width, 1.0)
+        if per_pixel <= 2:
+            self.line.set_data(x[i0:i1], y[i0:i1])
+            return
+
+        size = 1 << int(np.ceil(np.log2(per_pixel)))
+        if size != self.size:
+            self._reset(size)
+
+        # Считаем огибающую только для видимых корзин, которых нет в кэше
+        b0 = i0 // size
+        b1 = -(-i1 // size)
+        missing = np.flatnonzero(~self.done[b0:b1]) + b0
+        if len(missing):
+            index = np.minimum(missing[:, None] * size + np.arange(size), self.n - 1)
+            values = y[index]
+            self.lo[missing] = index[np.arange(len(missing)), values.argmin(axis=1)]
+            self.hi[missing] = index[np.arange(len(missing)), values.argmax(axis=1)]
+            self.done[missing] = True
+
+        lo = self.lo[b0:b1]
+        hi = self.hi[b0:b1]
+        index = np.empty(2 * len(lo), dtype=np.intp)
+        index[0::2] = np.minimum(lo, hi)
+        index[1::2] = np.maximum(lo, hi)
+        self.line.set_data(x[index], y[index])
+
+
+# Постоянная фигура на холсте tkinter
+# Фигура, холст и художники (artists) создаются один раз и хранятся по
+# ключам; при перестроении графика у них только заменяются данные, а
+# перерисовка откладывается до простоя (draw_idle). Поэтому память не растет
+# с числом перестроений. Объекты, которые matplotlib не умеет обновлять на
+# месте (контуры), заменяются: старый удаляется, цветовая шкала
+# перестраивается в своих прежних осях.
+# master=None - фигура без окна на холсте Agg (пакетная отрисовка в файлы);
+# tkinter тогда не импортируется. Сам matplotlib импортируется только при
+# создании первой фигуры, чтобы не замедлять запуск приложений.
+class FigurePanel:
+    def __init__(self, master, figsize=(6, 5), **pack_options):
+        from matplotlib.figure import Figure
+
+        self.figure = Figure(figsize=figsize)
+        if master is None:
+            from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+            self.canvas = FigureCanvasAgg(self.figure)
+        else:
+            from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+
+            self.canvas = FigureCanvasTkAgg(self.figure, master=master)
+            self.canvas.get_tk_widget().pack(**(pack_options or {"side": "top", "fill": "both", "expand": True}))
+        # Отрисовка холста замеряется профилировщиком (без замера - только
+        # время до первого кадра)
+        profiler.wrap(self.canvas, "draw", "draw")
+        profiler.wrap(self.canvas, "blit", "blit")
+        self.artists = {}
+        self.colorbars = {}
+
+    # Отложенная перерисовка холста
+    def draw(self):
+        self.canvas.draw_idle()
+
+    # Сохранение фигуры в файл (PNG, SVG, PDF - по расширению)
+    def save(self, path, dpi=100):
+        self.figure.savefig(path, dpi=dpi)
+
+    # Функция для скрытия художников по ключам
+    def hide(self, *keys):
+        for key in keys:
+            if key in self.artists:
+                self.artists[key].set_visible(False)
+
+    def _replace(self, key, artist):
+        old = self.artists.get(key)
+        if old is not None:
+            old.remove()
+        self.artists[key] = artist
+        return artist
+
+    # Контурный график (filled=True - contourf) с заменой прежнего
+    # colorbar=True создает оси цветовой шкалы один раз и затем перерисовывает в них шкалу.
+    def contour(self, ax, key, X, Y, Z, filled=False, colorbar=False, **kwargs):
+        plot = ax.contourf if filled else ax.contour
+        with profiler.stage(plot.__name__):
+            artist = self._replace(key, plot(X, Y, Z, **kwargs))
+            self._update_colorbar(ax, key, artist, colorbar)
+        return artist
+
+    # Контурный график по неструктурированным точкам с заменой прежнего
+    def tricontour(self, ax, key, x, y, z, filled=False, colorbar=False, **kwargs):
+        plot = ax.tricontourf if filled else ax.tricontour
+        with profiler.stage(plot.__name__):
+            artist = self._replace(key, plot(x, y, z, **kwargs))
+            self._update_colorbar(ax, key, artist, colorbar)
+        return artist
+
+    def _update_colorbar(self, ax, key, artist, colorbar):
+        if not colorbar:
+            return
+        with profiler.stage("colorbar"):
+            if key in self.colorbars:
+                # Шкала перестраивается в тех же осях, поэтому раскладка фигуры не меняется
+                cax = self.colorbars[key].ax
+                cax.clear()
+                self.colorbars[key] = self.figure.colorbar(artist, cax=cax)
+            else:
+                self.colorbars[key] = self.figure.colorbar(artist, ax=ax)
+
+    # Тепловая карта: данные, границы и пределы цвета обновляются на месте
+    def image(self, ax, key, data, extent, colorbar=False, **kwargs):
+        with profiler.stage("image"):
+            artist = self.artists.get(key)
+            if artist is None:
+                artist = self.artists[key] = ax.imshow(data, extent=extent, origin="lower", aspect="auto", **kwargs)
+            else:
+                artist.set_data(data)
+                artist.set_extent(extent)
+                artist.set_visible(True)
+            artist.set_clim(*finite_limits(data))
+            if colorbar:
+                if key in self.colorbars:
+                    self.colorbars[key].update_normal(artist)
+                else:
+                    self.colorbars[key] = self.figure.colorbar(artist, ax=ax)
+        return artist
+
+    # Поверхность на 3D-осях: вершины и цвета обновляются на месте
+    def surface(self, ax, key, X, Y, Z, cmap="viridis", count=SURFACE_COUNT):
+        from mpl_toolkits.mplot3d.art3d import Poly3DCollection
+
+        with profiler.stage("surface"):
+            polys, values = surface_polygons(X, Y, Z, count)
+            artist = self.artists.get(key)
+            if artist is None:
+                artist = Poly3DCollection(polys, cmap=cmap)
+                ax.add_collection3d(artist)
+                self.artists[key] = artist
+            else:
+                artist.set_verts(polys)
+            artist.set_array(values)
+            artist.set_clim(*finite_limits(values))
+            artist.set_visible(True)
+            ax.set_xlim3d(*finite_limits(X))
+            ax.set_ylim3d(*finite_limits(Y))
+            ax.set_zlim3d(*finite_limits(Z))
+        return artist
+
+    # Поле стрелок: при том же числе стрелок и тех же настройках обновляются
+    # положения и компоненты (set_offsets, set_UVC), иначе стрелки заменяются
+    def quiver(self, ax, key, X, Y, U, V, C=None, **kwargs):
+        with profiler.stage("quiver"):
+            X, Y, U, V = (np.ravel(a) for a in (X, Y, U, V))
+            C = None if C is None else np.ravel(C)
+            signature = (len(X), C is None, tuple(sorted(kwargs.items())))
+            artist = self.artists.get(key)
+            if artist is None or artist.signature != signature:
+                args = (X, Y, U, V) if C is None else (X, Y, U, V, C)
+                artist = self._replace(key, ax.quiver(*args, **kwargs))
+                artist.signature = signature
+            else:
+                artist.set_offsets(np.column_stack((X, Y)))
+                artist.set_UVC(U, V, C)
+                artist.set_visible(True)
+        return artist
+
+    # Линия: данные обновляются через set_data
+    def line(self, ax, key, x, y, *fmt, **kwargs):
+        artist = self.artists.get(key)
+        if artist is None:
+            artist, = ax.plot(x, y, *fmt, **kwargs)
+            self.artists[key] = artist
+        else:
+            artist.set_data(x, y)
+            artist.set_visible(True)
+        return artist
+
+    # Точки: положения обновляются через set_offsets
+    def scatter(self, ax, key, x, y, **kwargs):
+        artist = self.artists.get(key)
+        if artist is None:
+            artist = self.artists[key] = ax.scatter(x, y, **kwargs)
+        else:
+            artist.set_offsets(np.column_stack((np.ravel(x), np.ravel(y))))
+            artist.set_visible(True)
+        return artist
+
+    # Набор ломаных: отрезки обновляются через set_segments
+    # Набор не влияет на пределы осей.
+    def lines(self, ax, key, segments, **kwargs):
+        artist = self.artists.get(key)
+        if artist is None:
+            from matplotlib.collections import LineCollection
+
+            artist = self.artists[key] = LineCollection(segments, **kwargs)
+            ax.add_collection(artist, autolim=False)
+        else:
+            artist.set_segments(segments)
+            artist.set_visible(True)
+        return artist
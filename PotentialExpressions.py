@@ -0,0 +1,352 @@
+import ast
+import math
+import re
+from functools import lru_cache
+
+import numpy as np
+
+
+# Максимальная длина выражения (символов) и глубина вложенности
+EXPRESSION_MAX_LENGTH = 500
+EXPRESSION_MAX_DEPTH = 60
+
+# Разрешенные функции (имя -> функция numpy); производные см. _function_derivative
+FUNCTIONS = {
+    "sin": np.sin,
+    "cos": np.cos,
+    "tan": np.tan,
+    "exp": np.exp,
+    "log": np.log,
+    "sqrt": np.sqrt,
+    "abs": np.abs,
+    "sign": np.sign,
+    "sinh": np.sinh,
+    "cosh": np.cosh,
+    "tanh": np.tanh,
+    "arctan": np.arctan,
+}
+
+# Разрешенные константы
+CONSTANTS = {"pi": math.pi, "e": math.e}
+
+# Переменные координат
+VARIABLES = ("x", "y")
+
+# Имена параметров: латинская буква, затем буквы и цифры
+PARAMETER_NAME = re.compile(r"[A-Za-z][A-Za-z0-9]*\Z")
+
+# Разрешенные бинарные операции
+BINARY_OPERATORS = {ast.Add: "add", ast.Sub: "sub", ast.Mult: "mul", ast.Div: "div", ast.Pow: "pow"}
+
+
+# Выражение хранится как дерево из кортежей:
+# ("num", v), ("var", имя), ("neg", a), ("add" | "sub" | "mul" | "div" | "pow", a, b),
+# ("call", функция, a). Конструкторы ниже сразу упрощают очевидные случаи
+# (сложение с нулем, умножение на единицу, действия над числами).
+def _num(value):
+    return ("num", float(value))
+
+
+def _is_num(node, value=None):
+    return node[0] == "num" and (value is None or node[1] == value)
+
+
+def _fold(operation, *values):
+    try:
+        with np.errstate(all="ignore"):
+            result = float(operation(*values))
+    except (OverflowError, TypeError, ValueError, ZeroDivisionError):
+        return None
+    return _num(result) if math.isfinite(result) else None
+
+
+def _neg(a):
+    if _is_num(a):
+        return _num(-a[1])
+    if a[0] == "neg":
+        return a[1]
+    return ("neg", a)
+
+
+def _add(a, b):
+    if _is_num(a) and _is_num(b):
+        return _num(a[1] + b[1])
+    if _is_num(a, 0):
+        return b
+    if _is_num(b, 0):
+        return a
+    return ("add", a, b)
+
+
+def _sub(a, b):
+    if _is_num(a) and _is_num(b):
+        return _num(a[1] - b[1])
+    if _is_num(b, 0):
+        return a
+    if _is_num(a, 0):
+        return _neg(b)
+    return ("sub", a, b)
+
+
+def _mul(a, b):
+    if _is_num(a) and _is_num(b):
+        return _num(a[1] * b[1])
+    if _is_num(a, 0) or _is_num(b, 0):
+        return _num(0)
+    if _is_num(a, 1):
+        return b
+    if _is_num(b, 1):
+        return a
+    if _is_num(a, -1):
+        return _neg(b)
+    if _is_num(b, -1):
+        return _neg(a)
+    return ("mul", a, b)
+
+
+def _div(a, b):
+    if _is_num(a) and _is_num(b) and b[1] != 0:
+        return _num(a[1] / b[1])
+    if _is_num(a, 0):
+        return _num(0)
+    if _is_num(b, 1):
+        return a
+    return ("div", a, b)
+
+
+def _pow(a, b):
+    if _is_num(b, 0):
+        return _num(1)
+    if _is_num(b, 1):
+        return a
+    if _is_num(a) and _is_num(b):
+        folded = _fold(pow, a[1], b[1])
+        if folded is not None:
+            return folded
+    return ("pow", a, b)
+
+
+def _call(name, a):
+    if _is_num(a):
+        folded = _fold(FUNCTIONS[name], a[1])
+        if folded is not None:
+            return folded
+    return ("call", name, a)
+
+
+# Функция для перевода синтаксического дерева Python в дерево выражения
+# Допускаются только числа, x, y, имена параметров, константы pi и e,
+# операции + - * / ** и вызовы функций из FUNCTIONS с одним аргументом.
+# Все остальное (атрибуты, индексы, вызовы других функций, сравнения и т.д.)
+# отклоняется с ValueError, так что выражение не может выполнить чужой код.
+def _convert(node, depth=0):
+    if depth > EXPRESSION_MAX_DEPTH:
+        raise ValueError("слишком глубокая вложенность выражения")
+    if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+        return _num(node.value)
+    if isinstance(node, ast.Name):
+        if node.id in CONSTANTS:
+            return _num(CONSTANTS[node.id])
+        if node.id in FUNCTIONS:
+            raise ValueError(f"функция {node.id} используется без аргумента")
+        if node.id not in VARIABLES and (not PARAMETER_NAME.match(node.id) or node.id == "np"):
+            raise ValueError(f"недопустимое имя {node.id}")
+        return ("var", node.id)
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.UAdd, ast.USub)):
+        operand = _convert(node.operand, depth + 1)
+        return operand if isinstance(node.op, ast.UAdd) else _neg(operand)
+    if isinstance(node, ast.BinOp) and type(node.op) in BINARY_OPERATORS:
+        a = _convert(node.left, depth + 1)
+        b = _convert(node.right, depth + 1)
+        return {"add": _add, "sub": _sub, "mul": _mul, "div": _div, "pow": _pow}[BINARY_OPERATORS[type(node.op)]](a, b)
+    if isinstance(node, ast.Call):
+        if not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS:
+            raise ValueError("допустимы только функции " + ", ".join(FUNCTIONS))
+        if len(node.args) != 1 or node.keywords:
+            raise ValueError(f"функция {node.func.id} принимает один аргумент")
+        return _call(node.func.id, _convert(node.args[0], depth + 1))
+    raise ValueError("недопустимый элемент выражения")
+
+
+# Функция для разбора строки выражения в дерево
+def parse_expression(text):
+    if len(text) > EXPRESSION_MAX_LENGTH:
+        raise ValueError(f"выражение длиннее {EXPRESSION_MAX_LENGTH} символов")
+    try:
+        tree = ast.parse(text.strip(), mode="eval")
+    except SyntaxError:
+        raise ValueError("синтаксическая ошибка в выражении") from None
+    return _convert(tree.body)
+
+
+# Функция для проверки, зависит ли выражение от переменной
+def depends_on(node, name):
+    if node[0] == "var":
+        return node[1] == name
+    if node[0] == "num":
+        return False
+    return any(depends_on(child, name) for child in node[1:] if isinstance(child, tuple))
+
+
+# Функция для символьного дифференцирования выражения по переменной name
+def differentiate(node, name):
+    kind = node[0]
+    if kind == "num":
+        return _num(0)
+    if kind == "var":
+        return _num(1 if node[1] == name else 0)
+    if kind == "neg":
+        return _neg(differentiate(node[1], name))
+    if kind == "call":
+        u = node[2]
+        return _mul(_function_derivative(node[1], u), differentiate(u, name))
+
+    a, b = node[1], node[2]
+    da, db = differentiate(a, name), differentiate(b, name)
+    if kind == "add":
+        return _add(da, db)
+    if kind == "sub":
+        return _sub(da, db)
+    if kind == "mul":
+        return _add(_mul(da, b), _mul(a, db))
+    if kind == "div":
+        return _div(_sub(_mul(da, b), _mul(a, db)), _pow(b, _num(2)))
+    # Степень: при постоянном показателе (a^n)' = n a^(n-1) a',
+    # иначе (a^b)' = a^b (b' ln a + b a' / a)
+    if not depends_on(b, name):
+        return _mul(_mul(b, _pow(a, _sub(b, _num(1)))), da)
+    return _mul(node, _add(_mul(db, _call("log", a)), _div(_mul(b, da), a)))
+
+
+# Функция для производной функции из FUNCTIONS по ее аргументу u
+def _function_derivative(name, u):
+    if name == "sin":
+        return _call("cos", u)
+    if name == "cos":
+        return _neg(_call("sin", u))
+    if name == "tan":
+        return _div(_num(1), _pow(_call("cos", u), _num(2)))
+    if name == "exp":
+        return _call("exp", u)
+    if name == "log":
+        return _div(_num(1), u)
+    if name == "sqrt":
+        return _div(_num(0.5), _call("sqrt", u))
+    if name == "abs":
+        return _call("sign", u)
+    if name == "sign":
+        return _num(0)
+    if name == "sinh":
+        return _call("cosh", u)
+    if name == "cosh":
+        return _call("sinh", u)
+    if name == "tanh":
+        return _sub(_num(1), _pow(_call("tanh", u), _num(2)))
+    if name == "arctan":
+        return _div(_num(1), _add(_num(1), _pow(u, _num(2))))
+    raise ValueError(f"неизвестная функция {name}")
+
+
+# Функция для записи дерева выражения в виде исходного кода
+# numpy=True - код для компиляции (функции numpy, малые целые степени через
+# умножение), иначе - текст для отображения.
+def to_source(node, numpy=True):
+    kind = node[0]
+    if kind == "num":
+        value = node[1]
+        if numpy and not math.isfinite(value):
+            return f"np.float64('{value}')"
+        return repr(int(value)) if value.is_integer() and abs(value) < 1e15 else repr(value)
+    if kind == "var":
+        return node[1]
+    if kind == "neg":
+        return f"(-{to_source(node[1], numpy)})"
+    if kind == "call":
+        prefix = "np." if numpy else ""
+        return f"{prefix}{node[1]}({to_source(node[2], numpy)})"
+    a, b = to_source(node[1], numpy), to_source(node[2], numpy)
+    if kind == "pow" and numpy and _is_num(node[2]) and node[2][1] in (2, 3, 4):
+        return "(" + " * ".join([a] * int(node[2][1])) + ")"
+    symbol = {"add": "+", "sub": "-", "mul": "*", "div": "/", "pow": "**"}[kind]
+    return f"({a} {symbol} {b})"
+
+
+# Функция для приведения значения к форме сетки x, y
+# (нужна, если выражение или производная не зависит от координат)
+def _like_grid(value, x, y):
+    return value + np.zeros(np.broadcast(x, y).shape)
+
+
+# Функция для компиляции выражения в векторизованную функцию numpy
+def _compile(node, params, name):
+    source = to_source(node)
+    if not (depends_on(node, "x") or depends_on(node, "y")):
+        source = f"_like_grid({source}, x, y)"
+    code = f"def {name}(x, y{''.join(', ' + p for p in params)}):\n    return {source}\n"
+    namespace = {"np": np, "_like_grid": _like_grid, "__builtins__": {}}
+    exec(compile(code, f"<потенциал {name}>", "exec"), namespace)
+    return namespace[name]
+
+
+# Функция для разбора и компиляции пользовательского потенциала U(x, y)
+# Возвращает словарь в формате ядер PotentialKernels: params - имена
+# параметров в алфавитном порядке, potential(x, y, *params) и
+# gradient(x, y, *params) -> (dU/dx, dU/dy), а также тексты производных.
+# Результат кэшируется по строке выражения, поэтому разбор, символьное
+# дифференцирование и компиляция выполняются один раз.
+@lru_cache(maxsize=128)
+def compile_expression(text):
+    tree = parse_expression(text)
+    names = set()
+    _collect_names(tree, names)
+    params = tuple(sorted(names - set(VARIABLES)))
+
+    dU_dx = differentiate(tree, "x")
+    dU_dy = differentiate(tree, "y")
+    potential = _compile(tree, params, "potential")
+    gradient_x = _compile(dU_dx, params, "gradient_x")
+    gradient_y = _compile(dU_dy, params, "gradient_y")
+
+    def gradient(x, y, *values):
+        return gradient_x(x, y, *values), gradient_y(x, y, *values)
+
+    return {
+        "name": text,
+        "params": tuple((name, "1") for name in params),
+        "potential": potential,
+        "gradient": gradient,
+        "text": to_source(tree, numpy=False),
+        "dx_text": to_source(dU_dx, numpy=False),
+        "dy_text": to_source(dU_dy, numpy=False),
+    }
+
+
+def _collect_names(node, names):
+    if node[0] == "var":
+        names.add(node[1])
+    elif node[0] != "num":
+        for child in node[1:]:
+            if isinstance(child, tuple):
+                _collect_names(child, names)
+
+
+# Функция для разбора значений параметров вида "a=1, b=2"
+# Возвращает кортеж значений в порядке names; ValueError, если параметр не
+# задан, задан дважды или не является числом.
+def parse_parameters(text, names):
+    values = {}
+    for item in filter(None, (part.strip() for part in re.split(r"[;,]", text))):
+        name, sep, value = item.partition("=")
+        name = name.strip()
+        if not sep or not PARAMETER_NAME.match(name):
+            raise ValueError(f"параметр задается как имя=значение: {item}")
+        if name in values:
+            raise ValueError(f"параметр {name} задан дважды")
+        try:
+            values[name] = float(value)
+        except ValueError:
+            raise ValueError(f"значение параметра {name} не число") from None
+    missing = [name for name in names if name not in values]
+    if missing:
+        raise ValueError("не заданы параметры " + ", ".join(missing))
+    return tuple(values[name] for name in names)
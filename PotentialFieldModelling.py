@@ -1,96 +1,76 @@
 ﻿import tkinter as tk
 from tkinter import ttk
-import numpy as np
-from matplotlib.figure import Figure
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-
-
-# Функция для расчета потенциальной энергии
-def calculate_potential_field(x, y, field_type, params):
-    if field_type == "Гравитационное поле":
-        G, m1, m2 = params
-        U = -G * m1 * m2 / np.sqrt(x ** 2 + y ** 2 + 1e-6)  # Добавляем маленькое значение для избежания деления на ноль
-    elif field_type == "Сила упругости":
-        k = params[0]
-        U = 0.5 * k * (x ** 2 + y ** 2)
-    elif field_type == "Степенная функция":
-        a, n, b, m = params
-        U = a * x ** n + b * y ** m
-    else:
-        U = np.zeros_like(x)
-    return U
+
+from BackgroundWorker import BackgroundWorker
+from PlotRendering import FigurePanel
+from PotentialKernels import GRID, PotentialCache
+from PotentialPlot import (FIELD_TYPES, draw_potential, parameter_frames, potential_axes, potential_stages,
+                           read_field_parameters)
+from Profiling import profile_status_bar, profiler
+from ResultStore import default_store
+
+
+# Функция для отображения очередной сетки (в главном потоке)
+def show_potential(result):
+    stage, X, Y, U = result
+    draw_potential(panel, ax_contour, ax_surface, X, Y, U)
+    panel.draw()
+    status_label.config(text=f"Сетка {stage[4]}×{stage[5]}")
 
 
 # Функция для построения графика
+# Потенциал считается в фоновом потоке: сначала на грубой сетке, затем
+# графики уточняются на месте. Новое построение отменяет незавершенное.
 def plot_potential_field():
-    # Удаляем старый график, если он существует
-    for widget in canvas_frame.winfo_children():
-        widget.destroy()
+    global panel, ax_contour, ax_surface
+
+    profiler.start_run("Построение графика")
 
     # Получаем параметры от пользователя
     try:
-        field_type = field_type_var.get()
-        if field_type == "Гравитационное поле":
-            G = float(entry_G.get())
-            m1 = float(entry_m1.get())
-            m2 = float(entry_m2.get())
-            params = (G, m1, m2)
-        elif field_type == "Сила упругости":
-            k = float(entry_k.get())
-            params = (k,)
-        elif field_type == "Степенная функция":
-            a = float(entry_a.get())
-            n = float(entry_n.get())
-            b = float(entry_b.get())
-            m = float(entry_m.get())
-            params = (a, n, b, m)
+        with profiler.stage("разбор параметров"):
+            field_type, params, note = read_field_parameters(field_type_var.get(), param_entries)
+    except ValueError as error:
+        result_label.config(text=f"Ошибка: {error}")
+        return
+    result_label.config(text=note)
+    try:
+        points = int(entry_points.get())
     except ValueError:
-        result_label.config(text="Ошибка: введите корректные значения параметров")
+        points = 0
+    if points < 2:
+        result_label.config(text="Ошибка: число точек сетки должно быть целым и не меньше 2")
         return
 
-    # Задаем сетку координат
-    x = np.linspace(-10, 10, 100)
-    y = np.linspace(-10, 10, 100)
-    X, Y = np.meshgrid(x, y)
-    U = calculate_potential_field(X, Y, field_type, params)
-
-    # Создаем фигуру для отображения на холсте
-    fig = Figure(figsize=(6, 5))
-
-    # Контурный график
-    ax1 = fig.add_subplot(121)
-    cp = ax1.contourf(X, Y, U, cmap="viridis")
-    fig.colorbar(cp, ax=ax1)
-    ax1.set_title("Контурное распределение U(x, y)")
-    ax1.set_xlabel("x")
-    ax1.set_ylabel("y")
-
-    # 3D-график
-    ax2 = fig.add_subplot(122, projection='3d')
-    ax2.plot_surface(X, Y, U, cmap="viridis")
-    ax2.set_title("3D график U(x, y)")
-    ax2.set_xlabel("x")
-    ax2.set_ylabel("y")
-    ax2.set_zlabel("U(x, y)")
-
-    # Отображение графика на Tkinter Canvas
-    canvas = FigureCanvasTkAgg(fig, master=canvas_frame)
-    canvas.draw()
-    canvas.get_tk_widget().pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+    # Фигура и оси создаются один раз, дальше у графиков меняются только данные
+    if panel is None:
+        with profiler.stage("создание фигуры"):
+            panel = FigurePanel(canvas_frame)
+            ax_contour, ax_surface = potential_axes(panel)
+
+    spec = GRID[:4] + (points, points)
+    status_label.config(text="Расчет...")
+    worker.submit(lambda cancelled: potential_stages(potential_cache, result_store, field_type, params, spec,
+                                                     cancelled),
+                  show_potential,
+                  lambda error: status_label.config(text=f"Ошибка: {error}"))
 
 
 # Функция для обновления видимости полей ввода параметров
 def update_fields(*args):
-    field_type = field_type_var.get()
-    frame_gravity.grid_remove()
-    frame_spring.grid_remove()
-    frame_power.grid_remove()
-    if field_type == "Гравитационное поле":
-        frame_gravity.grid()
-    elif field_type == "Сила упругости":
-        frame_spring.grid()
-    elif field_type == "Степенная функция":
-        frame_power.grid()
+    for frame in param_frames.values():
+        frame.pack_forget()
+    param_frames[FIELD_TYPES[field_type_var.get()]].pack(before=btn_plot)
+
+
+# Кэш сетки и рассчитанных потенциалов
+potential_cache = PotentialCache()
+
+# Хранилище рассчитанных потенциалов на диске (None - не сохранять)
+result_store = default_store()
+
+# Постоянная фигура с графиками (создается при первом построении)
+panel = ax_contour = ax_surface = None
 
 
 # Настройка интерфейса tkinter
@@ -101,59 +81,43 @@ root.geometry("800x800")
 # Выбор типа силы
 field_type_var = tk.StringVar()
 field_type_var.set("Гравитационное поле")
-field_type_var.trace("w", update_fields)
 
 ttk.Label(root, text="Выберите тип силы:").pack(pady=5)
-field_type_menu = ttk.OptionMenu(root, field_type_var, "Гравитационное поле", "Гравитационное поле", "Сила упругости",
-                                 "Степенная функция")
+field_type_menu = ttk.OptionMenu(root, field_type_var, "Гравитационное поле", *FIELD_TYPES)
 field_type_menu.pack()
 
-# Параметры для гравитационного поля
-frame_gravity = ttk.Frame(root)
-ttk.Label(frame_gravity, text="G:").grid(row=0, column=0)
-entry_G = ttk.Entry(frame_gravity)
-entry_G.grid(row=0, column=1)
-ttk.Label(frame_gravity, text="m1:").grid(row=1, column=0)
-entry_m1 = ttk.Entry(frame_gravity)
-entry_m1.grid(row=1, column=1)
-ttk.Label(frame_gravity, text="m2:").grid(row=2, column=0)
-entry_m2 = ttk.Entry(frame_gravity)
-entry_m2.grid(row=2, column=1)
-
-# Параметры для силы упругости
-frame_spring = ttk.Frame(root)
-ttk.Label(frame_spring, text="Коэффициент жесткости k:").grid(row=0, column=0)
-entry_k = ttk.Entry(frame_spring)
-entry_k.grid(row=0, column=1)
-
-# Параметры для степенной функции
-frame_power = ttk.Frame(root)
-ttk.Label(frame_power, text="Коэффициент a:").grid(row=0, column=0)
-entry_a = ttk.Entry(frame_power)
-entry_a.grid(row=0, column=1)
-ttk.Label(frame_power, text="Степень n для x:").grid(row=1, column=0)
-entry_n = ttk.Entry(frame_power)
-entry_n.grid(row=1, column=1)
-ttk.Label(frame_power, text="Коэффициент b:").grid(row=2, column=0)
-entry_b = ttk.Entry(frame_power)
-entry_b.grid(row=2, column=1)
-ttk.Label(frame_power, text="Степень m для y:").grid(row=3, column=0)
-entry_m = ttk.Entry(frame_power)
-entry_m.grid(row=3, column=1)
-
-frame_gravity.pack()
+# Параметры для каждого типа поля
+param_frames, param_entries = parameter_frames(root)
+
+# Число точек сетки по каждой оси
+frame_points = ttk.Frame(root)
+ttk.Label(frame_points, text="Точек сетки по оси:").grid(row=0, column=0)
+entry_points = ttk.Entry(frame_points)
+entry_points.insert(0, str(GRID[4]))
+entry_points.grid(row=0, column=1)
+frame_points.pack(pady=5)
 
 # Кнопка для построения графика
 btn_plot = ttk.Button(root, text="Построить график", command=plot_potential_field)
 btn_plot.pack(pady=10)
+update_fields()
+field_type_var.trace("w", update_fields)
 
 # Поле для вывода результата
 result_label = ttk.Label(root, text="")
 result_label.pack()
+status_label = ttk.Label(root, text="")
+status_label.pack()
+
+# Фоновый поток для расчета потенциала
+worker = BackgroundWorker(root)
 
 # Фрейм для графиков
 canvas_frame = ttk.Frame(root)
 canvas_frame.pack(fill=tk.BOTH, expand=True)
 
+# Строка состояния с замером этапов (если он включен)
+profile_status_bar(root)
+
 # Запуск приложения
 root.mainloop()
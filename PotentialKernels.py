@@ -0,0 +1,272 @@
+from collections import OrderedDict
+
+import numpy as np
+
+from PotentialExpressions import compile_expression
+from ResultStore import stored
+from TiledGrid import TILE_SIZE, fill_tiled, open_output
+
+
+# Малая добавка к r² для избежания деления на ноль (как в исходной формуле гравитации)
+SOFTENING = 1e-6
+
+# Бюджет памяти кэша потенциалов (байт)
+CACHE_BYTES = 64 * 2 ** 20
+
+# Сетка по умолчанию: (x_min, x_max, y_min, y_max, nx, ny)
+GRID = (-10.0, 10.0, -10.0, 10.0, 100, 100)
+
+
+# Функция для расчета сглаженного расстояния до начала координат
+def softened_radius(x, y):
+    return np.sqrt(x ** 2 + y ** 2 + SOFTENING)
+
+
+# Функция для перевода производной центрального потенциала dU/dr в градиент
+def radial_gradient(x, y, r, dU_dr):
+    return dU_dr * x / r, dU_dr * y / r
+
+
+# Гравитационное поле: U = -G m1 m2 / r
+def gravity_potential(x, y, G, m1, m2):
+    return -G * m1 * m2 / softened_radius(x, y)
+
+
+def gravity_gradient(x, y, G, m1, m2):
+    r = softened_radius(x, y)
+    return radial_gradient(x, y, r, G * m1 * m2 / r ** 2)
+
+
+# Сила упругости: U = k (x² + y²) / 2
+def spring_potential(x, y, k):
+    return 0.5 * k * (x ** 2 + y ** 2)
+
+
+def spring_gradient(x, y, k):
+    return k * x, k * y
+
+
+# Анизотропная упругость: U = (kx x² + ky y²) / 2
+def anisotropic_spring_potential(x, y, kx, ky):
+    return 0.5 * (kx * x ** 2 + ky * y ** 2)
+
+
+def anisotropic_spring_gradient(x, y, kx, ky):
+    return kx * x, ky * y
+
+
+# Степенная функция: U = a x^n + b y^m
+def power_potential(x, y, a, n, b, m):
+    return a * x ** n + b * y ** m
+
+
+def power_gradient(x, y, a, n, b, m):
+    dU_dx = a * n * x ** (n - 1) if n != 0 else np.zeros_like(x)
+    dU_dy = b * m * y ** (m - 1) if m != 0 else np.zeros_like(y)
+    return dU_dx, dU_dy
+
+
+# Экранированный потенциал Юкавы: U = -A exp(-r / λ) / r
+def yukawa_potential(x, y, A, lam):
+    r = softened_radius(x, y)
+    return -A * np.exp(-r / lam) / r
+
+
+def yukawa_gradient(x, y, A, lam):
+    r = softened_radius(x, y)
+    return radial_gradient(x, y, r, A * np.exp(-r / lam) * (1 / r ** 2 + 1 / (lam * r)))
+
+
+# Потенциал Морзе: U = D (1 - exp(-a (r - r0)))²
+def morse_potential(x, y, D, a, r0):
+    r = softened_radius(x, y)
+    return D * (1 - np.exp(-a * (r - r0))) ** 2
+
+
+def morse_gradient(x, y, D, a, r0):
+    r = softened_radius(x, y)
+    decay = np.exp(-a * (r - r0))
+    return radial_gradient(x, y, r, 2 * D * a * decay * (1 - decay))
+
+
+# Потенциал Леннард-Джонса: U = 4ε ((σ/r)^12 - (σ/r)^6)
+def lennard_jones_potential(x, y, eps, sigma):
+    s6 = (sigma / softened_radius(x, y)) ** 6
+    return 4 * eps * (s6 ** 2 - s6)
+
+
+def lennard_jones_gradient(x, y, eps, sigma):
+    r = softened_radius(x, y)
+    s6 = (sigma / r) ** 6
+    return radial_gradient(x, y, r, 4 * eps * (6 * s6 - 12 * s6 ** 2) / r)
+
+
+# Реестр ядер потенциала
+# Для каждого ключа: название для интерфейса, параметры (подпись, значение по
+# умолчанию), функция U(x, y, *params) и аналитический градиент
+# (dU/dx, dU/dy)(x, y, *params). Все функции векторизованы по x, y.
+KERNELS = {}
+
+
+# Функция для добавления ядра в реестр
+def register_kernel(key, name, params, potential, gradient):
+    KERNELS[key] = {"name": name, "params": tuple(params), "potential": potential, "gradient": gradient}
+
+
+register_kernel("gravity", "Гравитационное поле", (("G:", "1"), ("m1:", "1"), ("m2:", "1")),
+                gravity_potential, gravity_gradient)
+register_kernel("spring", "Сила упругости", (("Коэффициент жесткости k:", "1"),),
+                spring_potential, spring_gradient)
+register_kernel("power", "Степенная функция",
+                (("Коэффициент a:", "1"), ("Степень n для x:", "2"), ("Коэффициент b:", "1"),
+                 ("Степень m для y:", "2")),
+                power_potential, power_gradient)
+register_kernel("anisotropic_spring", "Анизотропная упругость",
+                (("Жесткость kx:", "1"), ("Жесткость ky:", "4")),
+                anisotropic_spring_potential, anisotropic_spring_gradient)
+register_kernel("yukawa", "Потенциал Юкавы", (("Амплитуда A:", "1"), ("Радиус экранирования λ:", "2")),
+                yukawa_potential, yukawa_gradient)
+register_kernel("morse", "Потенциал Морзе", (("Глубина ямы D:", "1"), ("Ширина a:", "1"), ("Равновесие r0:", "3")),
+                morse_potential, morse_gradient)
+register_kernel("lennard_jones", "Потенциал Леннард-Джонса", (("Глубина ямы ε:", "1"), ("Размер σ:", "2")),
+                lennard_jones_potential, lennard_jones_gradient)
+
+
+# Префикс ключа пользовательского потенциала: "expr:" + выражение
+EXPRESSION_PREFIX = "expr:"
+
+
+# Функция для получения описания ядра по ключу
+# Ключ вида "expr:<выражение>" компилируется (один раз) из выражения.
+def kernel_spec(kernel):
+    if kernel.startswith(EXPRESSION_PREFIX):
+        return compile_expression(kernel[len(EXPRESSION_PREFIX):])
+    return KERNELS[kernel]
+
+
+# Функция для расчета потенциала выбранного ядра в точках x, y
+def potential(kernel, x, y, params):
+    return kernel_spec(kernel)["potential"](x, y, *params)
+
+
+# Функция для расчета градиента (dU/dx, dU/dy) выбранного ядра в точках x, y
+def gradient(kernel, x, y, params):
+    return kernel_spec(kernel)["gradient"](x, y, *params)
+
+
+# Функция для расчета потенциальной энергии
+# field_type - ключ ядра из реестра PotentialKernels.KERNELS,
+# "expr:<выражение>" для пользовательского потенциала или название ядра в
+# интерфейсе (например, "Гравитационное поле", как в прежних версиях)
+def calculate_potential_field(x, y, field_type, params):
+    if field_type not in KERNELS and not field_type.startswith(EXPRESSION_PREFIX):
+        keys = [key for key, kernel in KERNELS.items() if kernel["name"] == field_type]
+        if not keys:
+            raise ValueError(f"неизвестный тип поля: {field_type}")
+        field_type = keys[0]
+    return potential(field_type, x, y, params)
+
+
+# Функция для построения сетки X, Y по описанию (x_min, x_max, y_min, y_max, nx, ny)
+def make_grid(spec=GRID):
+    x_min, x_max, y_min, y_max, nx, ny = spec
+    return np.meshgrid(np.linspace(x_min, x_max, nx), np.linspace(y_min, y_max, ny))
+
+
+# Функция для поблочного расчета потенциала на большой сетке spec
+# Полная сетка координат не строится: каждая плитка tile × tile считается в
+# точности dtype (np.float32 или np.float64) и пишется в выходной массив.
+# path - файл .npy для записи через np.memmap (иначе массив в памяти).
+def potential_tiled(kernel, params, spec=GRID, path=None, dtype=np.float64, tile=TILE_SIZE):
+    params = tuple(float(p) for p in params)
+    U = open_output(path, (spec[5], spec[4]), dtype)
+    fill_tiled((U,), spec, lambda x, y: (potential(kernel, x, y, params),), tile, dtype)
+    return U
+
+
+# Функция для запроса к хранилищу результатов: (модель, параметры, разрешение)
+# потенциала ядра на сетке spec
+def potential_request(kernel, params, spec=GRID, dtype=np.float64):
+    return "potential", {"kernel": kernel, "params": [float(p) for p in params]}, {
+        "grid": list(spec), "dtype": np.dtype(dtype).name}
+
+
+# Функция для потенциала из хранилища store (np.memmap без чтения в память)
+# или рассчитанного плитками прямо в файл хранилища; без хранилища (None)
+# потенциал считается в памяти
+def stored_potential(store, kernel, params, spec=GRID, dtype=np.float64):
+    def compute(writer):
+        return {"U": potential_tiled(kernel, params, spec, path=writer.path("U") if writer else None, dtype=dtype)}
+
+    return stored(store, *potential_request(kernel, params, spec, dtype), compute)["U"]
+
+
+# Функция для поблочного расчета градиента (dU/dx, dU/dy) на большой сетке
+# paths - пара файлов .npy для компонент (или None).
+def gradient_tiled(kernel, params, spec=GRID, paths=None, dtype=np.float64, tile=TILE_SIZE):
+    params = tuple(float(p) for p in params)
+    paths = paths or (None, None)
+    outputs = tuple(open_output(path, (spec[5], spec[4]), dtype) for path in paths)
+    return fill_tiled(outputs, spec, lambda x, y: gradient(kernel, x, y, params), tile, dtype)
+
+
+# Кэш сеток, потенциалов и градиентов с вытеснением давно не использованных
+# записей (LRU) при превышении бюджета памяти max_bytes
+# Ключи: ("grid", spec), ("U", kernel, params, spec), ("grad", kernel, params, spec).
+# Возвращаемые массивы защищены от записи, так как разделяются между вызовами.
+class PotentialCache:
+    def __init__(self, max_bytes=CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        self.entries.clear()
+        self.nbytes = 0
+
+    # Значение из кэша или вычисленное compute() и сохраненное
+    def lookup(self, key, compute):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+        entry = tuple(compute())
+        for arr in entry:
+            arr.setflags(write=False)
+        size = sum(arr.nbytes for arr in entry)
+        if size <= self.max_bytes:
+            self.entries[key] = entry
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                _, old = self.entries.popitem(last=False)
+                self.nbytes -= sum(arr.nbytes for arr in old)
+        return entry
+
+    # Сетка X, Y (строится один раз для каждого описания)
+    def grid(self, spec=GRID):
+        return self.lookup(("grid", spec), lambda: make_grid(spec))
+
+    # Потенциал U ядра на сетке
+    def potential(self, kernel, params, spec=GRID):
+        params = tuple(float(p) for p in params)
+
+        def compute():
+            X, Y = self.grid(spec)
+            return (potential(kernel, X, Y, params),)
+
+        return self.lookup(("U", kernel, params, spec), compute)[0]
+
+    # Градиент (dU/dx, dU/dy) ядра на сетке
+    def gradient(self, kernel, params, spec=GRID):
+        params = tuple(float(p) for p in params)
+
+        def compute():
+            X, Y = self.grid(spec)
+            return gradient(kernel, X, Y, params)
+
+        return self.lookup(("grad", kernel, params, spec), compute)
@@ -0,0 +1,108 @@
+from BackgroundWorker import check_cancelled
+from PotentialExpressions import FUNCTIONS, compile_expression, parse_parameters
+from PotentialKernels import EXPRESSION_PREFIX, KERNELS, potential_request, stored_potential
+from Profiling import profiler
+from TiledGrid import refinement_specs
+
+
+# Типы поля в интерфейсе: название -> ключ ядра
+FIELD_TYPES = {kernel["name"]: key for key, kernel in KERNELS.items()}
+FIELD_TYPES["Пользовательский потенциал"] = "expression"
+
+
+# Функция для создания полей ввода параметров всех типов поля в окне parent
+# Поля ввода строятся по реестру ядер; для пользовательского потенциала -
+# выражение U(x, y) и значения его параметров. Возвращает рамки и списки
+# полей ввода по ключу ядра (рамки размещает вызывающий).
+def parameter_frames(parent):
+    from tkinter import ttk
+
+    frames = {}
+    entries = {}
+    for key, kernel in KERNELS.items():
+        frame = ttk.Frame(parent)
+        entries[key] = []
+        for row, (label, default) in enumerate(kernel["params"]):
+            ttk.Label(frame, text=label).grid(row=row, column=0)
+            entry = ttk.Entry(frame)
+            entry.insert(0, default)
+            entry.grid(row=row, column=1)
+            entries[key].append(entry)
+        frames[key] = frame
+
+    frame = ttk.Frame(parent)
+    entries["expression"] = []
+    for row, (label, default) in enumerate((("U(x, y) =", "a*x**2 + b*sin(y)"), ("Параметры:", "a=1, b=5"))):
+        ttk.Label(frame, text=label).grid(row=row, column=0)
+        entry = ttk.Entry(frame, width=40)
+        entry.insert(0, default)
+        entry.grid(row=row, column=1)
+        entries["expression"].append(entry)
+    ttk.Label(frame, text="Функции: " + ", ".join(FUNCTIONS) + "; константы pi, e").grid(row=2, column=0,
+                                                                                     columnspan=2)
+    frames["expression"] = frame
+    return frames, entries
+
+
+# Функция для чтения типа поля и его параметров из полей ввода
+# field_name - название из FIELD_TYPES, param_entries - поля ввода параметров
+# по ключу ядра (для "expression" - выражение и строка его параметров).
+# Пользовательское выражение компилируется один раз (кэш по строке), а его
+# ключ "expr:<выражение>" используется в кэше потенциалов как ключ ядра.
+# Возвращает ключ ядра, параметры и текст для строки результата.
+def read_field_parameters(field_name, param_entries):
+    field_type = FIELD_TYPES[field_name]
+    if field_type == "expression":
+        entry_expression, entry_params = param_entries["expression"]
+        text = entry_expression.get()
+        compiled = compile_expression(text)
+        params = parse_parameters(entry_params.get(), [name for name, _ in compiled["params"]])
+        return EXPRESSION_PREFIX + text, params, f"∂U/∂x = {compiled['dx_text']},  ∂U/∂y = {compiled['dy_text']}"
+    try:
+        params = tuple(float(entry.get()) for entry in param_entries[field_type])
+    except ValueError:
+        raise ValueError("введите корректные значения параметров") from None
+    return field_type, params, ""
+
+
+# Функция для расчета потенциала от грубой сетки к подробной (в фоновом потоке)
+# Сетки и потенциалы берутся из кэша cache, поэтому повторное построение
+# мгновенно; подробная сетка сохраняется в хранилище store (если оно задано).
+# Флаг отмены cancelled проверяется перед каждой сеткой.
+def potential_stages(cache, store, field_type, params, spec, cancelled=None):
+    # Готовый результат из хранилища открывается сразу, без грубых сеток
+    stages = refinement_specs(spec)
+    if store is not None and store.contains(*potential_request(field_type, params, spec)):
+        stages = stages[-1:]
+    for stage in stages:
+        check_cancelled(cancelled)
+        with profiler.stage("потенциал", grid=f"{stage[4]}x{stage[5]}"):
+            X, Y = cache.grid(stage)
+            if stage == stages[-1] and store is not None:
+                U = stored_potential(store, field_type, params, stage)
+            else:
+                U = cache.potential(field_type, params, stage)
+        yield stage, X, Y, U
+
+
+# Функция для создания осей контурного и 3D-графика потенциала на панели
+def potential_axes(panel):
+    ax_contour = panel.figure.add_subplot(121)
+    ax_contour.set_title("Контурное распределение U(x, y)")
+    ax_contour.set_xlabel("x")
+    ax_contour.set_ylabel("y")
+    ax_surface = panel.figure.add_subplot(122, projection="3d")
+    ax_surface.set_title("3D график U(x, y)")
+    ax_surface.set_xlabel("x")
+    ax_surface.set_ylabel("y")
+    ax_surface.set_zlabel("U(x, y)")
+    return ax_contour, ax_surface
+
+
+# Функция для отображения потенциала U на сетке (X, Y)
+def draw_potential(panel, ax_contour, ax_surface, X, Y, U):
+    # Контурный график (контуры заменяются, цветовая шкала перестраивается в своих осях)
+    panel.contour(ax_contour, "U", X, Y, U, filled=True, colorbar=True, cmap="viridis")
+
+    # 3D-график (вершины поверхности обновляются на месте)
+    panel.surface(ax_surface, "surface", X, Y, U, cmap="viridis")
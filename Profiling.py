@@ -0,0 +1,282 @@
+import json
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+
+
+# Переменная окружения, включающая замер этапов: "1" - время, "memory" -
+# время и выделения памяти (tracemalloc, заметно замедляет расчет)
+PROFILE_ENV = "MODELS_PROFILE"
+
+# Сколько последних событий хранится (старые вытесняются)
+MAX_EVENTS = 100000
+
+# Разделитель этапов в строке состояния
+STATUS_SEPARATOR = " · "
+
+
+# Пустой этап: используется, когда замер выключен
+class _NoStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_STAGE = _NoStage()
+
+
+# Замеряемый этап
+class _Stage:
+    def __init__(self, profiler, name, args):
+        self.profiler = profiler
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.profiler._enter(self)
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler._exit(self)
+        return False
+
+
+# Замер времени и памяти по этапам построения графиков
+# Этапы задаются блоками with profiler.stage("имя"): они могут быть вложены
+# и выполняться в разных потоках (расчет в фоновом, отрисовка в главном).
+# Каждое построение начинается с start_run(), и строка состояния показывает
+# сумму времени по этапам текущего построения. Выключенный профилировщик
+# возвращает один и тот же пустой этап, поэтому почти ничего не стоит, и
+# отмечает только время от start_run() до первой отрисовки.
+# С track_memory для каждого этапа записываются прирост занятой памяти и
+# пик сверх памяти в начале этапа (по tracemalloc; пик общий для всех
+# потоков, поэтому при одновременных этапах в разных потоках он завышен).
+class StageProfiler:
+    def __init__(self, enabled=False, track_memory=False, max_events=MAX_EVENTS):
+        self.enabled = enabled
+        self.track_memory = track_memory and enabled
+        self.events = deque(maxlen=max_events)
+        self.run = 0
+        self.run_label = ""
+        self.run_start = None
+        self.first_frame = None
+        self.origin = time.perf_counter()
+        self.listeners = []
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        if self.track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    # Этап с именем name; args - подробности для выгрузки (например, размер сетки)
+    def stage(self, name, **args):
+        if not self.enabled:
+            return _NO_STAGE
+        return _Stage(self, name, args)
+
+    # Начало нового построения: строка состояния показывает только его этапы
+    def start_run(self, label):
+        self.run += 1
+        self.run_label = label
+        self.run_start = time.perf_counter()
+        self.first_frame = None
+
+    # Замена метода объекта на замеряемый (например, draw холста); при
+    # выключенном замере у метода отмечается только первый вызов после
+    # start_run() (время до первого кадра)
+    def wrap(self, obj, method, name):
+        original = getattr(obj, method)
+        if not self.enabled:
+            def marked(*args, **kwargs):
+                result = original(*args, **kwargs)
+                if self.first_frame is None and self.run_start is not None:
+                    self.first_frame = time.perf_counter() - self.run_start
+                    self._notify()
+                return result
+
+            setattr(obj, method, marked)
+            return
+
+        def timed(*args, **kwargs):
+            with self.stage(name):
+                return original(*args, **kwargs)
+
+        setattr(obj, method, timed)
+
+    # Итератор этапов фонового расчета, в котором замеряется получение
+    # каждого следующего элемента (этап с именем name)
+    def iterate(self, name, stages):
+        if not self.enabled:
+            return stages
+        return self._timed(name, iter(stages))
+
+    def _timed(self, name, stages):
+        try:
+            while True:
+                with self.stage(name):
+                    try:
+                        item = next(stages)
+                    except StopIteration:
+                        return
+                yield item
+        finally:
+            close = getattr(stages, "close", None)
+            if close is not None:
+                close()
+
+    def _enter(self, stage):
+        stack = getattr(self.local, "stack", None)
+        if stack is None:
+            stack = self.local.stack = []
+        if self.track_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, peak)
+            tracemalloc.reset_peak()
+            stage.memory = stage.peak = current
+        stage.run = self.run
+        stack.append(stage)
+        stage.start = time.perf_counter()
+
+    def _exit(self, stage):
+        end = time.perf_counter()
+        stack = self.local.stack
+        stack.pop()
+        event = {
+            "name": stage.name,
+            "run": stage.run,
+            "start": stage.start - self.origin,
+            "duration": end - stage.start,
+            "thread": threading.current_thread().name,
+            "depth": len(stack),
+        }
+        if self.track_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            peak = max(stage.peak, peak)
+            event["allocated_bytes"] = current - stage.memory
+            event["peak_bytes"] = peak - stage.memory
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, peak)
+        if stage.args:
+            event["args"] = stage.args
+        with self.lock:
+            self.events.append(event)
+
+        if not stack:
+            self._notify()
+
+    # Слушатели (строка состояния) вызываются только из главного потока
+    # после этапа верхнего уровня, чтобы не трогать tkinter из фонового
+    def _notify(self):
+        if threading.current_thread() is threading.main_thread():
+            for listener in self.listeners:
+                listener()
+
+    # Копия списка событий (события дописываются и из фонового потока)
+    def snapshot(self):
+        with self.lock:
+            return list(self.events)
+
+    # Функция для сводки по этапам построения run (по умолчанию текущего):
+    # имя -> (суммарное время, число вызовов, прирост памяти). Вложенные
+    # этапы уже входят во время внешних, поэтому суммируются только этапы
+    # верхнего уровня своего потока.
+    def summary(self, run=None):
+        run = self.run if run is None else run
+        totals = {}
+        for event in self.snapshot():
+            if event["run"] != run or event["depth"]:
+                continue
+            seconds, count, allocated = totals.get(event["name"], (0.0, 0, 0))
+            totals[event["name"]] = (seconds + event["duration"], count + 1,
+                                     allocated + event.get("allocated_bytes", 0))
+        return totals
+
+    # Функция для текста строки состояния
+    def status_text(self):
+        if not self.enabled:
+            if self.first_frame is None:
+                return ""
+            return f"{self.run_label}: первый кадр через {self.first_frame * 1e3:.0f} мс"
+        parts = []
+        for name, (seconds, count, allocated) in self.summary().items():
+            text = f"{name} {seconds * 1e3:.1f} мс"
+            if count > 1:
+                text += f" ×{count}"
+            if self.track_memory:
+                text += f" ({allocated / 2 ** 20:+.1f} МБ)"
+            parts.append(text)
+        return f"{self.run_label}: " + STATUS_SEPARATOR.join(parts) if parts else ""
+
+    # Выгрузка всех событий в JSON
+    def export_json(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"track_memory": self.track_memory, "events": self.snapshot()}, f, ensure_ascii=False,
+                      indent=1)
+
+    # Выгрузка в формате Chrome trace (chrome://tracing, Perfetto): события
+    # "X" с временем в микросекундах, потоки - отдельные дорожки
+    def export_chrome_trace(self, path):
+        threads = {}
+        trace = []
+        for event in self.snapshot():
+            args = dict(event.get("args", {}), run=event["run"])
+            for key in ("allocated_bytes", "peak_bytes"):
+                if key in event:
+                    args[key] = event[key]
+            trace.append({
+                "name": event["name"],
+                "cat": "stage",
+                "ph": "X",
+                "ts": event["start"] * 1e6,
+                "dur": event["duration"] * 1e6,
+                "pid": os.getpid(),
+                "tid": threads.setdefault(event["thread"], len(threads)),
+                "args": args,
+            })
+        for thread, tid in threads.items():
+            trace.append({"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": thread}})
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+
+
+# Функция для создания профилировщика по переменной окружения MODELS_PROFILE
+def profiler_from_environment():
+    mode = os.environ.get(PROFILE_ENV, "").strip().lower()
+    return StageProfiler(enabled=mode not in ("", "0"), track_memory=mode == "memory")
+
+
+# Общий профилировщик приложений
+profiler = profiler_from_environment()
+
+
+# Функция для строки состояния профилировщика внизу окна master: время до
+# первого кадра последнего построения, а при включенном замере (MODELS_PROFILE)
+# - сводка по его этапам и кнопки выгрузки
+def profile_status_bar(master, profiler=profiler):
+    import tkinter as tk
+
+    frame = tk.Frame(master, relief=tk.SUNKEN, borderwidth=1)
+    text = "Замер этапов включен" if profiler.enabled else f"Подробный замер этапов: {PROFILE_ENV}=1"
+    label = tk.Label(frame, text=text, anchor="w", justify="left", wraplength=600)
+    label.pack(side=tk.LEFT, fill=tk.X, expand=True)
+    frame.pack(side=tk.BOTTOM, fill=tk.X)
+    profiler.listeners.append(lambda: label.config(text=profiler.status_text()))
+    if not profiler.enabled:
+        return frame
+    from tkinter import filedialog
+
+    def export(method, extension, title):
+        path = filedialog.asksaveasfilename(parent=master, title=title, defaultextension=extension,
+                                            filetypes=((title, "*" + extension),))
+        if path:
+            method(path)
+
+    tk.Button(frame, text="Chrome trace", command=lambda: export(
+        profiler.export_chrome_trace, ".trace.json", "Chrome trace")).pack(side=tk.RIGHT)
+    tk.Button(frame, text="JSON", command=lambda: export(profiler.export_json, ".json", "Этапы JSON")).pack(
+        side=tk.RIGHT)
+    return frame
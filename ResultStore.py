@@ -0,0 +1,265 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+
+import numpy as np
+
+from TiledGrid import open_output, release_output
+
+
+# Хранилище результатов расчетов на диске
+# Результат адресуется содержимым запроса: ключ - SHA-256 от модели,
+# параметров и разрешения (в записи JSON с упорядоченными ключами), поэтому
+# одинаковый запрос из приложения и из пакетного расчета находит один и тот
+# же результат. Каждый результат - каталог <ключ[:2]>/<ключ> с файлами .npy
+# (по одному на массив) и meta.json (описание запроса, формы и типы массивов,
+# скалярные значения). Массивы пишутся полосами по CHUNK_BYTES через
+# np.memmap, а читаются через np.load(mmap_mode="r") без копирования: открыть
+# траекторию в 10^6 шагов или сетку 4096 × 4096 - это открыть файл, а не
+# пересчитать. Записи создаются во временном каталоге и переименовываются
+# целиком, так что параллельные процессы не видят недописанных результатов.
+# index.jsonl в корне - краткий журнал записей (одна строка JSON на запись)
+# для просмотра и вытеснения старых записей при превышении max_bytes.
+
+# Переменная окружения хранилища: каталог или "1"/"on" - каталог STORE_DIR в
+# кэше пользователя. Без нее (или при "0"/"off") результаты на диск не пишутся.
+STORE_ENV = "MODELS_STORE"
+STORE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+                         "models", "result_store")
+
+# Версия формата: при изменении расчетов старые записи перестают находиться
+STORE_VERSION = 4
+
+# Объем полосы при записи массива на диск (байт)
+CHUNK_BYTES = 1 << 24
+
+# Наибольший объем хранилища по умолчанию (байт)
+STORE_MAX_BYTES = 512 * 2 ** 20
+
+INDEX_NAME = "index.jsonl"
+META_NAME = "meta.json"
+
+
+# Функция для приведения параметров к виду JSON: кортежи и массивы - списки,
+# числа numpy - числа Python, ключи словарей - строки
+def _json_value(value):
+    if isinstance(value, dict):
+        return {str(key): _json_value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_value(item) for item in value]
+    if isinstance(value, np.ndarray):
+        return _json_value(value.tolist())
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+# Функция для ключа результата по модели, параметрам и разрешению
+def result_key(model, params, resolution):
+    request = {"model": model, "params": _json_value(params), "resolution": _json_value(resolution),
+               "version": STORE_VERSION}
+    text = json.dumps(request, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+# Функция для записи массива в файл .npy полосами по chunk_bytes
+# Полный массив не копируется в память второй раз: каждая полоса строк
+# пишется в np.memmap и сразу сбрасывается на диск.
+def write_chunked(path, array, chunk_bytes=CHUNK_BYTES):
+    array = np.asarray(array)
+    if array.dtype.hasobject:
+        raise ValueError(f"массив {os.path.basename(path)} нельзя сохранить: тип {array.dtype}")
+    out = open_output(path, array.shape, array.dtype)
+    if array.ndim == 0:
+        out[()] = array
+    else:
+        rows = max(1, chunk_bytes // max(array[:1].nbytes, 1))
+        for start in range(0, len(array), rows):
+            out[start:start + rows] = array[start:start + rows]
+            release_output(out)
+    out.flush()
+    del out
+
+
+# Функция для чтения массива без копирования (np.memmap только для чтения)
+# Пустые массивы отобразить в память нельзя, они читаются обычным образом.
+def read_array(path):
+    try:
+        return np.load(path, mmap_mode="r")
+    except ValueError:
+        return np.load(path)
+
+
+# Запись нового результата: массивы можно передать готовыми в commit() или
+# рассчитать прямо в файлы по путям path(name) (например, плитками через
+# potential_tiled(path=...)). До commit() запись не видна в хранилище.
+class ResultWriter:
+    def __init__(self, store, key, model, params, resolution):
+        self.store = store
+        self.key = key
+        self.request = {"model": model, "params": _json_value(params), "resolution": _json_value(resolution)}
+        self.directory = os.path.join(store.root, f".tmp-{key[:16]}-{os.getpid()}-{uuid.uuid4().hex[:8]}")
+        os.makedirs(self.directory)
+        self.files = set()
+
+    # Путь файла .npy для массива name, который расчет запишет сам
+    def path(self, name):
+        self.files.add(name)
+        return os.path.join(self.directory, name + ".npy")
+
+    # Функция для завершения записи: массивы из result записываются на диск
+    # (кроме уже записанных по path()), остальные значения - в meta.json.
+    # Возвращает результат из хранилища (массивы - np.memmap).
+    def commit(self, result=None):
+        values = {}
+        for name, value in (result or {}).items():
+            if name in self.files:
+                continue
+            if isinstance(value, np.ndarray):
+                write_chunked(self.path(name), value)
+            else:
+                values[name] = _json_value(value)
+
+        arrays = {}
+        nbytes = 0
+        for name in sorted(self.files):
+            array = read_array(os.path.join(self.directory, name + ".npy"))
+            arrays[name] = {"shape": list(array.shape), "dtype": array.dtype.str}
+            nbytes += array.nbytes
+            del array
+        meta = dict(self.request, key=self.key, arrays=arrays, values=values, nbytes=nbytes, created=time.time())
+        with open(os.path.join(self.directory, META_NAME), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        return self.store._publish(self, meta)
+
+    # Функция для отказа от записи (временный каталог удаляется)
+    def discard(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+# Хранилище результатов в каталоге root
+class ResultStore:
+    def __init__(self, root=STORE_DIR, max_bytes=STORE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+
+    def _entry_dir(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    # Функция для чтения результата по ключу (None, если его нет)
+    # Массивы возвращаются как np.memmap только для чтения, значения - как в meta.json.
+    def load_key(self, key):
+        directory = self._entry_dir(key)
+        try:
+            with open(os.path.join(directory, META_NAME), encoding="utf-8") as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return None
+        result = dict(meta["values"])
+        for name in meta["arrays"]:
+            result[name] = read_array(os.path.join(directory, name + ".npy"))
+        return result
+
+    # Функция для чтения результата по запросу (None, если его нет)
+    def load(self, model, params, resolution):
+        return self.load_key(result_key(model, params, resolution))
+
+    # Есть ли результат в хранилище
+    def contains(self, model, params, resolution):
+        return os.path.exists(os.path.join(self._entry_dir(result_key(model, params, resolution)), META_NAME))
+
+    # Функция для начала записи результата (см. ResultWriter)
+    def create(self, model, params, resolution):
+        return ResultWriter(self, result_key(model, params, resolution), model, params, resolution)
+
+    # Функция для сохранения готового результата: словарь массивов и значений
+    def save(self, model, params, resolution, result):
+        writer = self.create(model, params, resolution)
+        try:
+            return writer.commit(result)
+        except BaseException:
+            writer.discard()
+            raise
+
+    # Функция для получения результата из хранилища или расчета с сохранением
+    # compute(writer) возвращает словарь массивов и значений; большие массивы
+    # он может писать сразу в файлы writer.path(name).
+    def lookup(self, model, params, resolution, compute):
+        result = self.load(model, params, resolution)
+        if result is not None:
+            return result
+        writer = self.create(model, params, resolution)
+        try:
+            return writer.commit(compute(writer))
+        except BaseException:
+            writer.discard()
+            raise
+
+    def _publish(self, writer, meta):
+        directory = self._entry_dir(writer.key)
+        os.makedirs(os.path.dirname(directory), exist_ok=True)
+        try:
+            os.rename(writer.directory, directory)
+        except OSError:
+            # Тот же результат уже записал другой процесс
+            writer.discard()
+            return self.load_key(writer.key)
+        index = {name: meta[name] for name in ("key", "model", "params", "resolution", "nbytes", "created")}
+        with open(os.path.join(self.root, INDEX_NAME), "a", encoding="utf-8") as f:
+            f.write(json.dumps(index, ensure_ascii=False) + "\n")
+        self.prune(keep=writer.key)
+        return self.load_key(writer.key)
+
+    # Функция для списка записей по журналу (только существующие, без повторов)
+    def entries(self):
+        path = os.path.join(self.root, INDEX_NAME)
+        if not os.path.exists(path):
+            return []
+        records = {}
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    records[record["key"]] = record
+        return [record for key, record in records.items()
+                if os.path.exists(os.path.join(self._entry_dir(key), META_NAME))]
+
+    # Функция для вытеснения самых старых записей, пока объем больше max_bytes
+    # (запись keep не удаляется); журнал переписывается без удаленных записей
+    def prune(self, keep=None):
+        entries = sorted(self.entries(), key=lambda record: record["created"])
+        total = sum(record["nbytes"] for record in entries)
+        if total <= self.max_bytes:
+            return
+        kept = []
+        for record in entries:
+            if total > self.max_bytes and record["key"] != keep:
+                shutil.rmtree(self._entry_dir(record["key"]), ignore_errors=True)
+                total -= record["nbytes"]
+            else:
+                kept.append(record)
+        path = os.path.join(self.root, INDEX_NAME)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            for record in kept:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        os.replace(path + ".tmp", path)
+
+
+# Функция для хранилища по переменной окружения MODELS_STORE (None - не сохранять)
+def default_store():
+    root = os.environ.get(STORE_ENV, "").strip()
+    if root.lower() in ("", "0", "off"):
+        return None
+    return ResultStore(STORE_DIR if root.lower() in ("1", "on") else root)
+
+
+# Функция для результата из хранилища store или, если его нет (None), расчета
+# без сохранения: compute(None) должен тогда вернуть все массивы в словаре
+def stored(store, model, params, resolution, compute):
+    if store is None:
+        return compute(None)
+    return store.lookup(model, params, resolution, compute)
@@ -0,0 +1,78 @@
+import mmap
+
+import numpy as np
+
+
+# Размер плитки при поблочном расчете (точек по каждой оси)
+TILE_SIZE = 512
+
+# Наименьшее число точек по оси у грубой сетки при постепенном уточнении
+COARSE_POINTS = 16
+
+
+# Функция для создания выходного массива формы shape
+# path=None - обычный массив в памяти, иначе файл .npy, открытый как
+# np.memmap: данные пишутся прямо на диск и читаются потом через
+# np.load(path, mmap_mode="r").
+def open_output(path, shape, dtype=np.float64):
+    if path is None:
+        return np.empty(shape, dtype=dtype)
+    return np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=shape)
+
+
+# Функция для сброса записанной полосы memmap на диск и освобождения ее страниц
+# Без этого записанные страницы остаются в памяти процесса до конца расчета.
+def release_output(out):
+    if not isinstance(out, np.memmap):
+        return
+    out.flush()
+    mapping = getattr(out, "_mmap", None)
+    if mapping is not None and hasattr(mapping, "madvise") and hasattr(mmap, "MADV_DONTNEED"):
+        mapping.madvise(mmap.MADV_DONTNEED)
+
+
+# Функция для перебора плиток сетки spec = (x_min, x_max, y_min, y_max, nx, ny)
+# Выдает (rows, cols, x, y): срезы плитки в выходном массиве формы (ny, nx) и
+# координаты ее точек формы (1, tx) и (ty, 1) в точности dtype. Координаты
+# совпадают с np.meshgrid(np.linspace(...), np.linspace(...)), а поэлементные
+# формулы считают плитку за счет broadcasting, не строя полную сетку.
+def grid_tiles(spec, tile=TILE_SIZE, dtype=np.float64):
+    x_min, x_max, y_min, y_max, nx, ny = spec
+    x_axis = np.linspace(x_min, x_max, nx)
+    y_axis = np.linspace(y_min, y_max, ny)
+    for i0 in range(0, ny, tile):
+        rows = slice(i0, min(i0 + tile, ny))
+        y = y_axis[rows].astype(dtype)[:, None]
+        for j0 in range(0, nx, tile):
+            cols = slice(j0, min(j0 + tile, nx))
+            yield rows, cols, x_axis[cols].astype(dtype)[None, :], y
+
+
+# Функция для поблочного заполнения выходных массивов по сетке spec
+# evaluate(x, y) возвращает кортеж значений плитки (по одному на выход).
+# Каждая полоса плиток после записи сбрасывается на диск, поэтому пиковая
+# память определяется размером плитки и длиной строки сетки, а не ее площадью.
+def fill_tiled(outputs, spec, evaluate, tile=TILE_SIZE, dtype=np.float64):
+    last_rows = None
+    for rows, cols, x, y in grid_tiles(spec, tile, dtype):
+        if last_rows is not None and rows != last_rows:
+            for out in outputs:
+                release_output(out)
+        last_rows = rows
+        for out, values in zip(outputs, evaluate(x, y)):
+            out[rows, cols] = values
+    for out in outputs:
+        release_output(out)
+    return outputs
+
+
+# Функция для построения последовательности сеток от грубой к подробной
+# Каждая следующая сетка примерно вдвое подробнее предыдущей по каждой оси,
+# последняя совпадает со spec, у самой грубой не меньше coarse точек по оси.
+def refinement_specs(spec, coarse=COARSE_POINTS):
+    x_min, x_max, y_min, y_max, nx, ny = spec
+    specs = [tuple(spec)]
+    while min(nx, ny) // 2 >= coarse:
+        nx, ny = (nx + 1) // 2, (ny + 1) // 2
+        specs.append((x_min, x_max, y_min, y_max, nx, ny))
+    return specs[::-1]